@@ -0,0 +1,6 @@
+# benchmarks/__init__.py
+"""
+Bộ benchmark headless cho catalogue lệnh.
+Chạy: python -m benchmarks run --out results.json
+So sánh: python -m benchmarks compare baseline.json results.json
+"""
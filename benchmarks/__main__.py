@@ -0,0 +1,121 @@
+# benchmarks/__main__.py
+import sys
+import json
+import argparse
+from pathlib import Path
+
+
+def _parse_list(text, cast=str):
+    return [cast(x) for x in text.split(',') if x.strip()] if text else []
+
+
+def _cmd_run(args):
+    # Setup MAGICK_HOME trước khi import Wand (giống main.py)
+    from utils import auto_setup_dependencies
+    auto_setup_dependencies()
+
+    from .synthetic import all_specs, SIZES_MP, DEPTHS
+    from .runner import run_suite
+
+    sizes = _parse_list(args.sizes, int) or list(SIZES_MP)
+    depths = _parse_list(args.depths, int) or list(DEPTHS)
+    alpha_modes = {'both': (False, True), 'yes': (True,), 'no': (False,)}[args.alpha]
+    specs = all_specs(sizes, depths, alpha_modes)
+
+    commands = _parse_list(args.commands) or None
+    presets = {} if args.no_presets else None
+
+    report = run_suite(specs, commands=commands, presets=presets, repeat=args.repeat)
+
+    out_path = Path(args.out)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[+] Đã ghi kết quả: {out_path} ({len(report['results'])} case)")
+    return 0
+
+
+def _cmd_profiles(args):
+    from utils import auto_setup_dependencies
+    auto_setup_dependencies()
+
+    import os
+    from .synthetic import ImageSpec
+    from .runner import run_profiles
+
+    spec = ImageSpec(args.size, 8, False)
+    file_count = args.files or 2 * (os.cpu_count() or 1)
+    profiles = _parse_list(args.profiles) or ["throughput", "latency", "default"]
+
+    print(f"[-] {file_count} file {spec.key}, lệnh: {args.command}")
+    report = run_profiles(spec, args.command, file_count, profiles)
+
+    out_path = Path(args.out)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[+] Đã ghi kết quả: {out_path}")
+    return 0
+
+
+def _cmd_compare(args):
+    from .runner import compare_results
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+
+    diff = compare_results(baseline, current, threshold=args.threshold)
+
+    for title, rows in (("REGRESSION", diff["regressions"]), ("IMPROVED", diff["improvements"])):
+        for row in rows:
+            print(f"{title:<11} {row['case']:<50} "
+                  f"{row['baseline_s'] * 1000:9.1f} ms -> {row['current_s'] * 1000:9.1f} ms (x{row['ratio']})")
+    for row in diff["new_errors"]:
+        print(f"{'NEW ERROR':<11} {row['case']:<50} {row['error']}")
+
+    print(f"\n{len(diff['regressions'])} regression, {len(diff['improvements'])} improved, "
+          f"{len(diff['unchanged'])} unchanged, {len(diff['new_errors'])} new error")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(diff, f, ensure_ascii=False, indent=2)
+
+    # Exit code != 0 để dùng được trong CI
+    return 1 if (diff["regressions"] or diff["new_errors"]) else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark catalogue lệnh ImageMagick")
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    p_run = sub.add_parser("run", help="Chạy benchmark và ghi kết quả JSON")
+    p_run.add_argument("--sizes", help="Danh sách Megapixel, VD: 1,12 (mặc định: 1,12,24,50)")
+    p_run.add_argument("--depths", help="Độ sâu bit, VD: 8,16 (mặc định: 8,16)")
+    p_run.add_argument("--alpha", choices=["both", "yes", "no"], default="both")
+    p_run.add_argument("--commands", help="Chỉ chạy các lệnh này, VD: resize,blur")
+    p_run.add_argument("--no-presets", action="store_true", help="Bỏ qua benchmark preset end-to-end")
+    p_run.add_argument("--repeat", type=int, default=3)
+    p_run.add_argument("--out", default="bench_results.json")
+    p_run.set_defaults(func=_cmd_run)
+
+    p_prof = sub.add_parser("profiles", help="So sánh resource profile (throughput / latency / default)")
+    p_prof.add_argument("--size", type=int, default=12, help="Megapixel của ảnh test (mặc định 12)")
+    p_prof.add_argument("--files", type=int, default=0, help="Số file trong batch (mặc định 2 x số core)")
+    p_prof.add_argument("--command", default="-resize 50% -unsharp-mask 0x1 -quality 85 -format jpg")
+    p_prof.add_argument("--profiles", help="VD: throughput,latency (mặc định: throughput,latency,default)")
+    p_prof.add_argument("--out", default="bench_profiles.json")
+    p_prof.set_defaults(func=_cmd_profiles)
+
+    p_cmp = sub.add_parser("compare", help="So sánh 2 file kết quả, báo regression")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("current")
+    p_cmp.add_argument("--threshold", type=float, default=0.10, help="Ngưỡng chậm hơn (0.10 = 10%%)")
+    p_cmp.add_argument("--json", help="Ghi kết quả so sánh ra file JSON")
+    p_cmp.set_defaults(func=_cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
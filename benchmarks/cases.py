@@ -0,0 +1,133 @@
+# benchmarks/cases.py
+from typing import Dict, Optional
+
+# ==============================================
+# THAM SỐ ĐẠI DIỆN CHO TỪNG LỆNH TRONG CATALOGUE
+# ==============================================
+# Giá trị None = lệnh không cần tham số. Lệnh nào có trong ALL_COMMANDS mà
+# thiếu ở đây vẫn được chạy với None và bị đánh dấu "no_case" trong kết quả.
+COMMAND_ARGS: Dict[str, Optional[str]] = {
+    # --- Geometry ---
+    'resize': '50%',
+    'scale': '50%',
+    'sample': '50%',
+    'liquid-rescale': '90x90',
+    'extent': '1200x800',
+    'repage': None,
+    'crop': '500x500+10+10',
+    'rotate': '15',
+    'auto-orient': None,
+    'deskew': '0.4',
+    'shear': '20x10',
+    'flip': None,
+    'flop': None,
+    'transpose': None,
+    'transverse': None,
+    'trim': None,
+    'roll': '+10+10',
+    'distort': 'Arc:60',
+    'resample': '72',
+    # --- Settings ---
+    'quality': '85',
+    'density': '300',
+    'units': 'PixelsPerInch',
+    'depth': '8',
+    'strip': None,
+    'compress': 'zip',
+    'virtual-pixel': 'mirror',
+    'format': 'jpg',
+    'interlace': 'plane',
+    'sampling-factor': '4:2:0',
+    'loop': '0',
+    'delay': '10',
+    'fuzz': '10%',
+    'target-size': '200KB',  # Chỉ gắn option; vòng tìm quality chạy lúc encode (batch)
+    # --- Color ---
+    'colorspace': 'gray',
+    'type': 'grayscale',
+    'monochrome': None,
+    'grayscale': None,
+    'alpha': 'off',
+    'background': 'white',
+    'transparent': 'white',
+    'negate': None,
+    'level': '10%,90%,1.0',
+    'auto-level': None,
+    'auto-gamma': None,
+    'brightness-contrast': '10x20',
+    'modulate': '100,120,100',
+    'normalize': None,
+    'equalize': None,
+    'gamma': '1.6',
+    'threshold': '50%',
+    'colorize': 'red,30',
+    'tint': 'red,30',
+    'sigmoidal-contrast': '3x50%',
+    'auto-threshold': None,
+    'clahe': '50x50x128x3',
+    'black-threshold': '20%',
+    'white-threshold': '80%',
+    # --- Filters ---
+    'blur': '0x5',
+    'gaussian-blur': '0x3',
+    'sharpen': '0x1',
+    'unsharp-mask': '0x1+1+0.05',
+    'noise': 'gaussian',
+    'median': '1',
+    'kuwahara': '3',
+    'despeckle': None,
+    'adaptive-blur': '0x1',
+    'adaptive-sharpen': '0x1',
+    'enhance': None,
+    'statistic': 'median:3x3',
+    'mode': '1',
+    'cca': '5',
+    'selective-blur': '0x2+10%',
+    'lat': '20x20+10',
+    # --- Artistic ---
+    'sepia': '80%',
+    'solarize': '50%',
+    'posterize': '8',
+    'oil-paint': '3',
+    'charcoal': '0x1',
+    'sketch': '0x20+120',
+    'swirl': '90',
+    'wave': '25x150',
+    'implode': '0.5',
+    'vignette': '0x20',
+    'polaroid': '5',
+    'shadow': '80x3+5+5',
+    'blue-shift': '1.5',
+    'emboss': '0x1',
+    'motion-blur': '0x10+45',
+    'rotational-blur': '10',
+    'spread': '5',
+    'cycle-colormap': '10',
+    'raise': '5x5',
+    'lower': '5x5',
+    # --- Decoration ---
+    'border': '10x10',
+    'frame': '10x10+2+2',
+    'shave': '10x10',
+    'splice': '0x20+0+0',
+    'chop': '0x20+0+0',
+    # --- Edge ---
+    'edge': '1',
+    'canny': '0x1+10%+30%',
+    'morphology': 'Dilate:Disk',
+    'shade': '30x30',
+    'dilate': 'Disk',
+    'erode': 'Disk',
+    'opening': 'Disk',
+    'closing': 'Disk',
+}
+
+# Preset mặc định (lấy từ các combo trong phần Hướng dẫn) - chạy end-to-end
+# qua BatchWorker. Preset trong presets.json được chạy thêm nếu có.
+BUILTIN_PRESETS: Dict[str, str] = {
+    'web-jpeg': '-auto-orient -strip -resize 1920x1080 -format jpg -quality 85 -sharpen 0x1',
+    'scan-cleanup': '-grayscale -despeckle -level 10%,90% -sharpen 0x1',
+    'shrink': '-strip -quality 85 -depth 8',
+    'old-film': '-sepia 80% -vignette 0x20',
+    'webp-convert': '-format webp -quality 80',
+}
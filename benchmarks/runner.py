@@ -0,0 +1,257 @@
+# benchmarks/runner.py
+import os
+import sys
+import time
+import shutil
+import platform
+import statistics
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import CONFIG
+from core.commands import ALL_COMMANDS
+from core.parser import CommandParser
+from core.presets import PresetStore
+from .cases import COMMAND_ARGS, BUILTIN_PRESETS
+from .synthetic import ImageSpec, make_image, ensure_image_file
+
+# ==================
+# BENCHMARK RUNNER
+# ==================
+def _summarize(runs: List[float]) -> dict:
+    """Thống kê thời gian các lần chạy (giây)"""
+    return {
+        "runs": [round(r, 6) for r in runs],
+        "min_s": round(min(runs), 6),
+        "median_s": round(statistics.median(runs), 6),
+        "mean_s": round(statistics.mean(runs), 6),
+    }
+
+
+def _environment_info(repeat: int) -> dict:
+    """Thông tin môi trường để biết 2 file kết quả có so sánh được không"""
+    try:
+        from wand.version import MAGICK_VERSION, VERSION as WAND_VERSION
+    except ImportError:
+        MAGICK_VERSION = WAND_VERSION = "unknown"
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "app_version": CONFIG.app_version,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "wand": WAND_VERSION,
+        "imagemagick": MAGICK_VERSION,
+        "repeat": repeat,
+    }
+
+
+def time_command(base_img, name: str, value: Optional[str], repeat: int, warmup: int = 1) -> dict:
+    """
+    Đo thời gian 1 handler trên bản clone của ảnh gốc.
+    Thời gian clone không được tính vào kết quả.
+    """
+    handler = ALL_COMMANDS[name]
+    runs = []
+    for i in range(warmup + repeat):
+        with base_img.clone() as img:
+            start = time.perf_counter()
+            handler(img, value)
+            elapsed = time.perf_counter() - start
+        if i >= warmup:
+            runs.append(elapsed)
+    return _summarize(runs)
+
+
+def time_preset(image_path: Path, command_string: str, repeat: int, warmup: int = 1) -> dict:
+    """
+    Đo end-to-end 1 preset qua đúng đường xử lý của BatchWorker/BatchEngine
+    (ping -> decode -> apply -> encode -> atomic write).
+    """
+    from workers.engine import BatchEngine, FileTask, STATUS_OK
+
+    out_dir = Path(tempfile.mkdtemp(prefix="imtool-bench-"))
+    try:
+        engine = BatchEngine({"": [image_path.name]}, image_path.parent, out_dir, command_string)
+        operations = CommandParser.parse(command_string)
+        task = FileTask(0, "", image_path.name)
+
+        runs = []
+        for i in range(warmup + repeat):
+            start = time.perf_counter()
+            file_result = engine.process_file(task, operations)
+            elapsed = time.perf_counter() - start
+            if file_result.status != STATUS_OK:
+                raise RuntimeError(file_result.message)
+            if i >= warmup:
+                runs.append(elapsed)
+
+        result = _summarize(runs)
+        outputs = [p for p in out_dir.iterdir() if p.is_file()]
+        if outputs:
+            result["output_bytes"] = outputs[0].stat().st_size
+        return result
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def load_user_presets() -> Dict[str, str]:
+    """Đọc presets.json (nếu có) để benchmark cả preset của người dùng"""
+    if not CONFIG.preset_file.exists():
+        return {}
+    try:
+        return PresetStore().load().as_dict()
+    except Exception:
+        return {}
+
+
+def run_suite(specs: List[ImageSpec], commands: List[str] = None, presets: Dict[str, str] = None,
+              repeat: int = 3, log=print) -> dict:
+    """
+    Chạy toàn bộ benchmark.
+    Returns: dict {"meta": ..., "results": {case_key: {...}}}
+    """
+    commands = commands if commands is not None else sorted(ALL_COMMANDS.keys())
+    presets = presets if presets is not None else {**BUILTIN_PRESETS, **load_user_presets()}
+    results = {}
+
+    for spec in specs:
+        log(f"[-] Ảnh {spec.key} ({spec.dimensions[0]}x{spec.dimensions[1]})")
+        with make_image(spec) as base_img:
+            pixels = base_img.width * base_img.height
+            for name in commands:
+                value = COMMAND_ARGS.get(name)
+                key = f"cmd:{name}@{spec.key}"
+                entry = {"kind": "command", "command": name, "value": value, "image": spec.key}
+                if name not in COMMAND_ARGS:
+                    entry["no_case"] = True
+                try:
+                    entry.update(time_command(base_img, name, value, repeat))
+                    entry["mpix_per_s"] = round(pixels / 1e6 / entry["median_s"], 3) if entry["median_s"] else None
+                    log(f"    -{name:<22} {entry['median_s'] * 1000:9.1f} ms")
+                except Exception as e:
+                    entry["error"] = str(e)
+                    log(f"    -{name:<22} ✖ {e}")
+                results[key] = entry
+
+        if presets:
+            image_path = ensure_image_file(spec)
+            for preset_name, cmd in presets.items():
+                key = f"preset:{preset_name}@{spec.key}"
+                entry = {"kind": "preset", "preset": preset_name, "command": cmd, "image": spec.key}
+                try:
+                    entry.update(time_preset(image_path, cmd, repeat))
+                    log(f"    [{preset_name}] {entry['median_s'] * 1000:9.1f} ms")
+                except Exception as e:
+                    entry["error"] = str(e)
+                    log(f"    [{preset_name}] ✖ {e}")
+                results[key] = entry
+
+    return {"meta": _environment_info(repeat), "results": results}
+
+
+def run_profiles(spec: ImageSpec, command_string: str, file_count: int, profiles: List[str],
+                 log=print) -> dict:
+    """
+    So sánh các resource profile (utils/resources.py) trên cùng 1 batch:
+    file_count bản sao của ảnh tổng hợp, chạy qua BatchEngine với số worker của từng profile.
+    Chạy thêm 1 lượt 'before' (giới hạn mặc định của ImageMagick x N worker = hành vi trước khi
+    có profile) làm mốc, mỗi profile có speedup_vs_before = file/s của profile / file/s của mốc.
+    """
+    from utils import build_profile
+    from workers.engine import BatchEngine
+
+    source = ensure_image_file(spec)
+    work_dir = Path(tempfile.mkdtemp(prefix="imtool-bench-profiles-"))
+    results = {}
+    try:
+        input_dir = work_dir / "input"
+        input_dir.mkdir()
+        names = []
+        for i in range(file_count):
+            name = f"img_{i:04d}{source.suffix}"
+            shutil.copyfile(source, input_dir / name)
+            names.append(name)
+
+        cpus = os.cpu_count() or 1
+        runs = [("before", build_profile("default"), cpus)]
+        runs += [(name, build_profile(name), build_profile(name).workers or 1) for name in profiles]
+        for name, profile, workers in runs:
+            out_dir = work_dir / f"out-{name}"
+            latencies = []
+            engine = BatchEngine(
+                {"": names}, input_dir, out_dir, command_string,
+                workers=workers, use_journal=False, memory_budget_mb=-1, resource_profile=profile.name,
+                on_result=lambda r, done, total: latencies.append(r.elapsed_s),
+            )
+            start = time.perf_counter()
+            summary = engine.run()
+            wall = time.perf_counter() - start
+
+            entry = {
+                "workers": workers,
+                "limits": {k: v for k, v in profile._asdict().items() if k not in ("name", "workers")},
+                "wall_s": round(wall, 4),
+                "files_per_s": round(file_count / wall, 3) if wall else None,
+                "failed": summary["failed"],
+            }
+            if latencies:
+                latencies.sort()
+                entry["latency_mean_s"] = round(statistics.mean(latencies), 4)
+                entry["latency_p95_s"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 4)
+            before = results.get("before", entry)
+            if name != "before" and before["files_per_s"] and entry["files_per_s"]:
+                entry["speedup_vs_before"] = round(entry["files_per_s"] / before["files_per_s"], 3)
+            results[name] = entry
+            log(f"    [{name:<10}] {workers:>2} worker  {entry['files_per_s']:>7} file/s  "
+                f"latency {entry.get('latency_mean_s', 0) * 1000:8.1f} ms")
+            shutil.rmtree(out_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    meta = _environment_info(repeat=1)
+    meta.update({"image": spec.key, "files": file_count, "command": command_string})
+    return {"meta": meta, "profiles": results}
+
+
+# ==================
+# SO SÁNH KẾT QUẢ
+# ==================
+def compare_results(baseline: dict, current: dict, threshold: float = 0.10,
+                    min_delta_s: float = 0.002) -> dict:
+    """
+    So sánh 2 file kết quả theo median.
+    Một case bị coi là REGRESSION khi chậm hơn > threshold (tỉ lệ) VÀ
+    chênh lệch tuyệt đối > min_delta_s (tránh nhiễu ở các lệnh siêu nhanh).
+    """
+    base_results = baseline.get("results", {})
+    cur_results = current.get("results", {})
+    regressions, improvements, unchanged, errors = [], [], [], []
+
+    for key in sorted(set(base_results) & set(cur_results)):
+        old, new = base_results[key], cur_results[key]
+        if "error" in old or "error" in new:
+            if "error" in new and "error" not in old:
+                errors.append({"case": key, "error": new["error"]})
+            continue
+
+        old_t, new_t = old["median_s"], new["median_s"]
+        ratio = (new_t / old_t) if old_t > 0 else float('inf')
+        row = {"case": key, "baseline_s": old_t, "current_s": new_t, "ratio": round(ratio, 3)}
+
+        if ratio > 1 + threshold and (new_t - old_t) > min_delta_s:
+            regressions.append(row)
+        elif ratio < 1 - threshold and (old_t - new_t) > min_delta_s:
+            improvements.append(row)
+        else:
+            unchanged.append(row)
+
+    return {
+        "regressions": sorted(regressions, key=lambda r: -r["ratio"]),
+        "improvements": sorted(improvements, key=lambda r: r["ratio"]),
+        "unchanged": unchanged,
+        "new_errors": errors,
+        "missing": sorted(set(base_results) - set(cur_results)),
+        "added": sorted(set(cur_results) - set(base_results)),
+    }
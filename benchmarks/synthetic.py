@@ -0,0 +1,81 @@
+# benchmarks/synthetic.py
+import math
+from pathlib import Path
+from typing import NamedTuple, Tuple
+
+from wand.image import Image as WandImage, COMPOSITE_OPERATORS
+
+# ==========================
+# SYNTHETIC TEST IMAGES
+# ==========================
+# Kích thước chuẩn (Megapixel), độ sâu bit và kênh alpha dùng cho benchmark
+SIZES_MP: Tuple[int, ...] = (1, 12, 24, 50)
+DEPTHS: Tuple[int, ...] = (8, 16)
+ALPHA_MODES: Tuple[bool, ...] = (False, True)
+
+CACHE_DIR = Path(__file__).parent / ".cache"
+
+
+class ImageSpec(NamedTuple):
+    """Mô tả 1 ảnh tổng hợp (dùng làm key trong file kết quả)"""
+    megapixels: int
+    depth: int
+    alpha: bool
+
+    @property
+    def key(self) -> str:
+        return f"{self.megapixels}mp-{self.depth}bit-{'rgba' if self.alpha else 'rgb'}"
+
+    @property
+    def dimensions(self) -> Tuple[int, int]:
+        """Tỉ lệ 3:2 giống ảnh máy ảnh"""
+        width = int(round(math.sqrt(self.megapixels * 1_000_000 * 1.5)))
+        height = int(round(width / 1.5))
+        return width, height
+
+
+def all_specs(sizes=SIZES_MP, depths=DEPTHS, alpha_modes=ALPHA_MODES):
+    """Tổ hợp toàn bộ các ảnh cần sinh"""
+    return [ImageSpec(mp, d, a) for mp in sizes for d in depths for a in alpha_modes]
+
+
+def make_image(spec: ImageSpec) -> WandImage:
+    """
+    Sinh ảnh tổng hợp XÁC ĐỊNH (deterministic) - không dùng nguồn ngẫu nhiên
+    (plasma/noise) để kết quả giữa các lần chạy so sánh được với nhau.
+    Gồm: nền gradient màu + vân checkerboard + vùng sáng radial (tạo cạnh & chi tiết).
+    """
+    width, height = spec.dimensions
+    img = WandImage(width=width, height=height, pseudo='gradient:#1e3c72-#f7b733')
+    with WandImage(width=width, height=height, pseudo='pattern:checkerboard') as pattern:
+        img.composite(pattern, left=0, top=0, operator='soft_light')
+    with WandImage(width=width, height=height, pseudo='radial-gradient:#ffffff-#202020') as glow:
+        img.composite(glow, left=0, top=0, operator='overlay')
+
+    img.depth = spec.depth
+    if spec.alpha:
+        # Alpha giảm dần từ tâm ra ngoài
+        copy_op = 'copy_alpha' if 'copy_alpha' in COMPOSITE_OPERATORS else 'copy_opacity'
+        img.alpha_channel = 'activate'
+        with WandImage(width=width, height=height, pseudo='radial-gradient:white-black') as mask:
+            img.composite(mask, left=0, top=0, operator=copy_op)
+    else:
+        img.alpha_channel = 'remove'
+    return img
+
+
+def ensure_image_file(spec: ImageSpec, cache_dir: Path = CACHE_DIR) -> Path:
+    """
+    Ghi ảnh ra TIFF không nén (giữ nguyên 16-bit & alpha) và cache lại,
+    tránh phải sinh lại ảnh 50MP ở mỗi lần chạy.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_dir / f"synthetic-{spec.key}.tif"
+    if not path.exists():
+        with make_image(spec) as img:
+            img.format = 'tiff'
+            img.compression = 'no'
+            temp_path = path.with_suffix('.tif.tmp')
+            img.save(filename=str(temp_path))
+        temp_path.replace(path)
+    return path
@@ -0,0 +1,468 @@
+# cli.py
+"""
+Chạy batch không cần giao diện (cron, server). Dùng chung engine với GUI.
+
+VD:
+    python cli.py batch -i ./input -o ./output -c "-resize 50% -format jpg" -j 4
+    python cli.py batch -i ./input -o ./output -p "Web JPEG" --overwrite skip
+    python cli.py watch -i ./hotfolder -o ./output -p "Web JPEG" -j 4
+    python cli.py index -i ./input --filter "mp>40 cmyk" --list
+    python cli.py ab -i ./input -o ./ab_out -p "Web JPEG" -p "Web WebP" -n 48 -j 4
+
+Mỗi sự kiện được in ra stdout dạng 1 dòng JSON (JSON Lines).
+Exit code: 0 = OK, 1 = có file lỗi, 2 = sai tham số/cấu hình,
+           3 = có file trùng (--overwrite fail), 130 = bị dừng (Ctrl+C).
+"""
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+from pathlib import Path
+
+EXIT_OK = 0
+EXIT_FAILED_FILES = 1
+EXIT_USAGE = 2
+EXIT_CONFLICTS = 3
+EXIT_INTERRUPTED = 130
+
+
+class JsonLinesReporter:
+    """In tiến trình dạng JSON Lines (thread-safe, flush từng dòng)"""
+    def __init__(self, stream=sys.stdout, quiet: bool = False):
+        self.stream = stream
+        self.quiet = quiet
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields):
+        line = json.dumps({"event": event, "ts": round(time.time(), 3), **fields}, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def on_log(self, message: str):
+        if not self.quiet and message.strip():
+            self.emit("log", message=message.strip())
+
+    def on_result(self, result, done: int, total: int):
+        self.emit(
+            "file",
+            done=done,
+            total=total,
+            status=result.status,
+            input=result.task.rel_file,
+            output=str(result.out_path) if result.out_path else None,
+            bytes=result.size_bytes,
+            elapsed_s=round(result.elapsed_s, 4),
+            message=result.message,
+        )
+
+
+_PRESETS = None
+
+
+def _load_preset(name: str) -> str:
+    """Lấy command string của preset từ presets.json (đọc 1 lần, dùng chung cho mọi -p/-r @preset)"""
+    global _PRESETS
+    from config import CONFIG
+    from core.presets import PresetStore
+    if _PRESETS is None:
+        if not CONFIG.preset_file.exists():
+            raise KeyError(f"Không tìm thấy file preset: {CONFIG.preset_file}")
+        _PRESETS = PresetStore().load()
+    plan = _PRESETS.compiled(name)
+    if plan is None:
+        raise KeyError(f"Preset '{name}' không tồn tại")
+    if not plan.valid:
+        raise ValueError(f"Preset '{name}': {plan.problem}")
+    return plan.command_string
+
+
+def _parse_rendition(spec: str):
+    """'thumb=-resize 200x200 -format webp' hoặc 'thumb=@Tên preset' -> Rendition"""
+    from workers.fanout import Rendition
+    name, sep, command = spec.partition('=')
+    name, command = name.strip(), command.strip()
+    if not sep or not name or not command:
+        raise ValueError(f"Rendition không hợp lệ: '{spec}' (cú pháp: tên=lệnh hoặc tên=@preset)")
+    if name in ('.', '..') or any(c in name for c in '/\\:'):
+        raise ValueError(f"Tên rendition không hợp lệ (dùng làm tên folder): '{name}'")
+    if command.startswith('@'):
+        command = _load_preset(command[1:])
+    return Rendition(name, command)
+
+
+def _cmd_batch(args, reporter: JsonLinesReporter) -> int:
+    from config import CONFIG
+    from workers.engine import BatchEngine, scan_input, scan_for_conflicts
+    from workers.fanout import RenditionEngine
+    from workers.journal import BatchJournal
+    from workers.archive_io import is_archive_path
+
+    input_dir = Path(args.input)
+    output_dir = Path(args.output)
+    if not input_dir.is_dir() and not is_archive_path(input_dir):
+        reporter.emit("error", message=f"Input folder/archive không tồn tại: {input_dir}")
+        return EXIT_USAGE
+
+    try:
+        renditions = [_parse_rendition(spec) for spec in args.rendition or []]
+        if renditions:
+            command_string = None
+        else:
+            command_string = args.command if args.command else _load_preset(args.preset)
+    except (KeyError, ValueError, OSError) as e:
+        reporter.emit("error", message=str(e))
+        return EXIT_USAGE
+
+    # === 1. QUÉT FILE (cùng logic với FileLoaderWorker) ===
+    extensions = tuple(args.ext.split(',')) if args.ext else CONFIG.image_extensions
+    file_structure, flat_list = scan_input(input_dir, extensions)
+    reporter.emit("scan", input=str(input_dir), files=len(flat_list), folders=len(file_structure))
+    if not flat_list:
+        reporter.emit("done", total=0, processed=0, skipped=0, failed=0, stopped=False, elapsed_s=0.0)
+        return EXIT_OK
+
+    from utils import build_profile
+    try:
+        profile = build_profile(args.profile) if args.profile else None
+    except ValueError as e:
+        reporter.emit("error", message=str(e))
+        return EXIT_USAGE
+
+    overwrite_mode = args.overwrite
+    engine_options = dict(
+        overwrite_mode="overwrite" if overwrite_mode == "fail" else overwrite_mode,
+        workers=args.jobs or (profile and profile.workers) or 1,
+        resource_profile=profile.name if profile else None,
+        resume=not args.no_resume,
+        hash_inputs=args.hash,
+        memory_budget_mb=args.memory_budget,
+        autoscale=args.autoscale,
+        max_workers=args.max_jobs,
+        fsync_every=args.fsync_every,
+        archive=args.archive,
+        archive_split_mb=args.archive_split,
+        use_metadata_index=False if args.no_index else None,
+        on_log=reporter.on_log,
+        on_result=reporter.on_result,
+    )
+    try:
+        if renditions:
+            engine = RenditionEngine(file_structure, input_dir, output_dir, renditions, **engine_options)
+        else:
+            engine = BatchEngine(file_structure, input_dir, output_dir, command_string, **engine_options)
+    except ValueError as e:
+        reporter.emit("error", message=str(e))
+        return EXIT_USAGE
+
+    # === 2. JOB DANG DỞ -> CHẠY TIẾP THEO JOURNAL ===
+    resumable = 0
+    if engine.resume:
+        plan_hash = engine.plan_key()
+        resumable = BatchJournal.peek(input_dir, output_dir, plan_hash)
+        if resumable:
+            reporter.emit("resume", completed=resumable, plan_hash=plan_hash)
+
+    # === 3. KIỂM TRA TRÙNG FILE (cùng logic với BatchWorker.scan_for_conflicts) ===
+    # Khi resume thì bỏ qua: file còn lại trong output có thể là bản ghi dở của lần trước
+    if output_dir.exists() and not resumable and overwrite_mode != "incremental" and not args.archive:
+        targets = [(output_dir / r.name, r.command_string) for r in renditions] or [(output_dir, command_string)]
+        conflicts = []
+        for target_dir, target_command in targets:
+            conflicts += scan_for_conflicts(file_structure, input_dir, target_dir, target_command)[1]
+        if conflicts:
+            reporter.emit("conflicts", count=len(conflicts), examples=conflicts[:5], mode=overwrite_mode)
+            if overwrite_mode == "fail":
+                return EXIT_CONFLICTS
+
+    # === 4. CHẠY ENGINE ===
+    output_dir.mkdir(parents=True, exist_ok=True)
+    reporter.emit("start", total=len(flat_list), command=engine.command_string, workers=engine.workers,
+                  renditions=[r.name for r in renditions] or None)
+
+    try:
+        summary = engine.run()
+    except KeyboardInterrupt:
+        engine.stop()
+        reporter.emit("done", **engine.summary())
+        return EXIT_INTERRUPTED
+
+    reporter.emit("done", **summary)
+    if summary["stopped"]:
+        return EXIT_INTERRUPTED
+    return EXIT_FAILED_FILES if summary["failed"] else EXIT_OK
+
+
+def _cmd_watch(args, reporter: JsonLinesReporter) -> int:
+    from workers.engine import BatchEngine
+    from workers.watcher import FolderWatcher
+
+    input_dir = Path(args.input)
+    output_dir = Path(args.output)
+    if not input_dir.is_dir():
+        reporter.emit("error", message=f"Input folder không tồn tại: {input_dir}")
+        return EXIT_USAGE
+    try:
+        command_string = args.command if args.command else _load_preset(args.preset)
+        engine = BatchEngine({}, input_dir, output_dir, command_string,
+                             overwrite_mode="incremental", workers=args.jobs, use_journal=False,
+                             hash_inputs=args.hash, resource_profile=args.profile,
+                             on_log=reporter.on_log, on_result=reporter.on_result)
+    except (KeyError, ValueError, OSError) as e:
+        reporter.emit("error", message=str(e))
+        return EXIT_USAGE
+
+    watcher = FolderWatcher(
+        engine,
+        extensions=tuple(args.ext.split(',')) if args.ext else None,
+        settle_s=args.settle,
+        poll_interval_s=args.poll,
+        report_interval_s=args.report,
+        use_notifications=not args.poll_only,
+        on_stats=lambda stats: reporter.emit("stats", **stats),
+    )
+    # Daemon (systemd/docker) dừng bằng SIGTERM -> dừng êm như Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    reporter.emit("watch", input=str(input_dir), command=command_string, workers=engine.workers,
+                  mode="poll" if not watcher.use_notifications else "notify")
+    summary = watcher.run()
+    reporter.emit("done", **summary)
+    return EXIT_FAILED_FILES if summary["failed"] else EXIT_OK
+
+
+def _cmd_index(args, reporter: JsonLinesReporter) -> int:
+    from collections import Counter
+    from config import CONFIG
+    from workers.engine import scan_input
+    from workers.archive_io import is_archive_path
+    from workers.metadata_index import MetadataIndex, index_files, parse_filter
+
+    input_dir = Path(args.input)
+    if not input_dir.is_dir() and not is_archive_path(input_dir):
+        reporter.emit("error", message=f"Input folder/archive không tồn tại: {input_dir}")
+        return EXIT_USAGE
+    try:
+        matches = parse_filter(args.filter) if args.filter else (lambda meta: True)
+    except ValueError as e:
+        reporter.emit("error", message=str(e))
+        return EXIT_USAGE
+
+    extensions = tuple(args.ext.split(',')) if args.ext else CONFIG.image_extensions
+    _, flat_list = scan_input(input_dir, extensions)
+    reporter.emit("scan", input=str(input_dir), files=len(flat_list))
+
+    def on_progress(done, total):
+        if done % 500 == 0 or done == total:
+            reporter.emit("progress", done=done, total=total)
+
+    start = time.perf_counter()
+    with MetadataIndex() as index:
+        metas, pinged = index_files(index, input_dir, flat_list, workers=args.jobs, on_progress=on_progress)
+
+    matched = [rel for rel in flat_list if rel in metas and matches(metas[rel])]
+    if args.list:
+        for rel in matched:
+            reporter.emit("file", input=rel, **metas[rel]._asdict())
+    selected = [metas[rel] for rel in matched]
+    reporter.emit(
+        "done",
+        files=len(flat_list),
+        indexed=pinged,
+        unreadable=len(flat_list) - len(metas),
+        matched=len(matched),
+        megapixels=round(sum(m.megapixels for m in selected), 1),
+        formats=dict(Counter(m.format for m in selected)),
+        colorspaces=dict(Counter(m.colorspace for m in selected)),
+        elapsed_s=round(time.perf_counter() - start, 3),
+    )
+    return EXIT_OK
+
+
+def _cmd_ab(args, reporter: JsonLinesReporter) -> int:
+    import os
+    from config import CONFIG
+    from workers.engine import scan_input
+    from workers.archive_io import is_archive_path
+    from workers.ab_compare import ABRunner, Candidate, stratified_sample
+
+    input_dir = Path(args.input)
+    if not input_dir.is_dir() and not is_archive_path(input_dir):
+        reporter.emit("error", message=f"Input folder/archive không tồn tại: {input_dir}")
+        return EXIT_USAGE
+    try:
+        candidates = [Candidate(name, _load_preset(name)) for name in args.preset]
+    except (KeyError, ValueError, OSError) as e:
+        reporter.emit("error", message=str(e))
+        return EXIT_USAGE
+
+    # === 1. QUÉT + CHỌN MẪU (phân tầng theo format + dung lượng) ===
+    extensions = tuple(args.ext.split(',')) if args.ext else CONFIG.image_extensions
+    _, flat_list = scan_input(input_dir, extensions)
+    archive = is_archive_path(input_dir)
+    sizes = {}
+    for rel_file in flat_list:
+        try:
+            # Member archive: không có dung lượng riêng -> chỉ phân tầng theo format
+            sizes[rel_file] = 0 if archive else os.stat(input_dir / rel_file).st_size
+        except OSError:
+            continue
+    sample = stratified_sample(sizes, CONFIG.ab_sample_size if args.sample is None else args.sample,
+                               seed=args.seed)
+    reporter.emit("scan", input=str(input_dir), files=len(flat_list), sample=len(sample))
+    if not sample:
+        reporter.emit("done", presets=[], elapsed_s=0.0)
+        return EXIT_OK
+
+    # === 2. CHẠY XEN KẼ CÁC PRESET TRÊN CÙNG POOL ===
+    def on_sample(result, done, total):
+        reporter.emit("file", done=done, total=total, preset=result.candidate, input=result.rel_file,
+                      status=result.status, bytes=result.output_bytes, elapsed_s=round(result.elapsed_s, 4),
+                      psnr=None if result.psnr in (None, float('inf')) else round(result.psnr, 2),
+                      ssim=None if result.ssim is None else round(result.ssim, 4),
+                      message=result.message)
+
+    try:
+        runner = ABRunner(candidates, input_dir, Path(args.output), sample, workers=args.jobs,
+                          measure_quality=not args.no_quality, on_log=reporter.on_log, on_sample=on_sample)
+    except ValueError as e:
+        reporter.emit("error", message=str(e))
+        return EXIT_USAGE
+
+    reporter.emit("start", presets=[c.name for c in candidates], sample=len(sample), workers=runner.workers)
+    try:
+        rows = runner.run()
+    except KeyboardInterrupt:
+        runner.stop()
+        reporter.emit("done", presets=runner.summary(), stopped=True)
+        return EXIT_INTERRUPTED
+
+    for row in rows:
+        reporter.emit("preset", **row)
+    reporter.emit("done", presets=[row["preset"] for row in rows], stopped=False, elapsed_s=round(runner.wall_s, 3))
+    return EXIT_FAILED_FILES if any(row["failed"] for row in rows) else EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python cli.py", description="ImageMagick GUI Tool - chế độ dòng lệnh")
+    parser.add_argument("--trace", metavar="FILE", help="Ghi Chrome Trace JSON ra FILE")
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    p_batch = sub.add_parser("batch", help="Xử lý hàng loạt 1 folder")
+    p_batch.add_argument("-i", "--input", required=True, help="Folder input, hoặc file .zip/.tar (đọc trực tiếp, không giải nén)")
+    p_batch.add_argument("-o", "--output", required=True, help="Folder output")
+    source = p_batch.add_mutually_exclusive_group(required=True)
+    source.add_argument("-c", "--command", help="Chuỗi lệnh, VD: \"-resize 50%% -format jpg\"")
+    source.add_argument("-p", "--preset", help="Tên preset trong presets.json")
+    source.add_argument("-r", "--rendition", action="append", metavar="TÊN=LỆNH",
+                        help="Xuất nhiều phiên bản từ 1 lần decode, lặp lại cho mỗi bản. "
+                             "VD: -r \"thumb=-strip -thumbnail 200x200\" -r \"web=@Web JPEG\"")
+    p_batch.add_argument("-j", "--jobs", type=int, default=None,
+                         help="Số worker song song (mặc định theo --profile, hoặc 1)")
+    p_batch.add_argument("--profile", choices=["throughput", "latency", "preview", "default"],
+                         help="Giới hạn tài nguyên ImageMagick: throughput = 1 thread IM x N worker, "
+                              "latency = N thread IM x 1 worker (mặc định: tự chọn theo số worker)")
+    p_batch.add_argument("--overwrite", choices=["overwrite", "skip", "fail", "incremental"], default="overwrite",
+                         help="Xử lý file trùng: ghi đè / bỏ qua / dừng với exit code 3 / "
+                              "chỉ xử lý file mới hoặc thay đổi so với lần chạy trước")
+    p_batch.add_argument("--hash", action="store_true",
+                         help="(incremental) So sánh cả nội dung file khi mtime đổi nhưng size giữ nguyên")
+    p_batch.add_argument("--memory-budget", type=int, metavar="MB", default=None,
+                         help="Giới hạn RAM ước lượng cho các file chạy song song "
+                              "(mặc định theo config: 0 = 50%% RAM, -1 = tắt)")
+    p_batch.add_argument("--autoscale", action="store_true",
+                         help="Tự tăng/giảm số worker theo CPU và throughput đo được (bắt đầu từ -j)")
+    p_batch.add_argument("--max-jobs", type=int, metavar="N", default=None,
+                         help="(autoscale) Số worker tối đa (mặc định theo config: 0 = 2 x số core)")
+    p_batch.add_argument("--fsync-every", type=int, metavar="N", default=None,
+                         help="fsync output + journal sau mỗi N file (mặc định theo config: 0 = không fsync)")
+    p_batch.add_argument("--archive", choices=["zip", "tar"],
+                         help="Ghi output vào <output>/<tên input>-001.zip|tar (giữ cấu trúc folder) thay vì từng file")
+    p_batch.add_argument("--archive-split", type=int, metavar="MB", default=0,
+                         help="(archive) Tách part mới khi part hiện tại vượt MB (mặc định 0 = không tách)")
+    p_batch.add_argument("--no-index", action="store_true",
+                         help="Không dùng metadata index (ping lại header mọi file khi ước lượng RAM)")
+    p_batch.add_argument("--no-resume", action="store_true",
+                         help="Bỏ qua journal của lần chạy dang dở, chạy lại từ đầu")
+    p_batch.add_argument("--ext", help="Đuôi file cần quét, VD: .jpg,.png (mặc định theo config)")
+    p_batch.add_argument("-q", "--quiet", action="store_true", help="Không in các dòng log, chỉ in sự kiện")
+    p_batch.set_defaults(func=_cmd_batch)
+
+    p_watch = sub.add_parser("watch", help="Theo dõi 1 folder, tự xử lý file mới/thay đổi (chạy tới khi Ctrl+C)")
+    p_watch.add_argument("-i", "--input", required=True, help="Folder cần theo dõi")
+    p_watch.add_argument("-o", "--output", required=True, help="Folder output")
+    source = p_watch.add_mutually_exclusive_group(required=True)
+    source.add_argument("-c", "--command", help="Chuỗi lệnh, VD: \"-resize 50%% -format jpg\"")
+    source.add_argument("-p", "--preset", help="Tên preset trong presets.json")
+    p_watch.add_argument("-j", "--jobs", type=int, default=1, help="Số worker cố định (mặc định 1)")
+    p_watch.add_argument("--profile", choices=["throughput", "latency", "preview", "default"],
+                         help="Giới hạn tài nguyên ImageMagick (mặc định: tự chọn theo số worker)")
+    p_watch.add_argument("--settle", type=float, default=None, metavar="GIÂY",
+                         help="File phải không đổi size/mtime trong bao lâu mới xử lý (mặc định theo config)")
+    p_watch.add_argument("--poll", type=float, default=None, metavar="GIÂY",
+                         help="Chu kỳ quét khi không dùng watchdog (mặc định theo config)")
+    p_watch.add_argument("--poll-only", action="store_true",
+                         help="Không dùng thông báo của hệ thống file (VD: ổ mạng SMB/NFS), chỉ quét định kỳ")
+    p_watch.add_argument("--report", type=float, default=None, metavar="GIÂY",
+                         help="Chu kỳ in sự kiện stats (throughput/backlog), 0 = tắt")
+    p_watch.add_argument("--hash", action="store_true",
+                         help="So sánh cả nội dung file khi mtime đổi nhưng size giữ nguyên")
+    p_watch.add_argument("--ext", help="Đuôi file cần theo dõi, VD: .jpg,.png (mặc định theo config)")
+    p_watch.add_argument("-q", "--quiet", action="store_true", help="Không in các dòng log, chỉ in sự kiện")
+    p_watch.set_defaults(func=_cmd_watch)
+
+    p_index = sub.add_parser("index", help="Đọc header ảnh vào metadata index và thống kê/lọc (không decode)")
+    p_index.add_argument("-i", "--input", required=True, help="Folder input, hoặc file .zip/.tar")
+    p_index.add_argument("--filter", metavar="ĐIỀU_KIỆN",
+                         help="VD: \"mp>40 cmyk\", \"format=png depth=16\", \"animated\", \"rotated\"")
+    p_index.add_argument("--list", action="store_true", help="In từng file khớp điều kiện")
+    p_index.add_argument("-j", "--jobs", type=int, default=None, help="Số thread đọc header (mặc định: số core)")
+    p_index.add_argument("--ext", help="Đuôi file cần quét, VD: .jpg,.png (mặc định theo config)")
+    p_index.set_defaults(func=_cmd_index)
+
+    p_ab = sub.add_parser("ab", help="So sánh nhiều preset trên 1 mẫu ảnh: throughput, dung lượng, PSNR/SSIM")
+    p_ab.add_argument("-i", "--input", required=True, help="Folder input, hoặc file .zip/.tar")
+    p_ab.add_argument("-o", "--output", required=True, help="Folder output (mỗi preset 1 subfolder)")
+    p_ab.add_argument("-p", "--preset", action="append", required=True, metavar="TÊN",
+                      help="Tên preset trong presets.json, lặp lại cho mỗi preset (ít nhất 2)")
+    p_ab.add_argument("-n", "--sample", type=int, default=None,
+                      help="Số file mẫu, phân tầng theo format + dung lượng (mặc định theo config, 0 = tất cả)")
+    p_ab.add_argument("--seed", type=int, default=None, help="Seed chọn mẫu (cùng seed = cùng mẫu)")
+    p_ab.add_argument("-j", "--jobs", type=int, default=1, help="Số worker dùng chung cho mọi preset (mặc định 1)")
+    p_ab.add_argument("--no-quality", action="store_true", help="Không đo PSNR/SSIM (chỉ throughput + dung lượng)")
+    p_ab.add_argument("--ext", help="Đuôi file cần quét, VD: .jpg,.png (mặc định theo config)")
+    p_ab.add_argument("-q", "--quiet", action="store_true", help="Không in các dòng log, chỉ in sự kiện")
+    p_ab.set_defaults(func=_cmd_ab)
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    reporter = JsonLinesReporter(stream=sys.stdout, quiet=getattr(args, "quiet", False))
+
+    # stdout chỉ dành cho JSON Lines: mọi print() khác (cảnh báo, setup) chuyển sang stderr
+    sys.stdout = sys.stderr
+
+    # Setup MAGICK_HOME trước khi import Wand (giống main.py)
+    from utils import auto_setup_dependencies, TRACER
+    auto_setup_dependencies()
+    if args.trace:
+        TRACER.enable(Path(args.trace))
+
+    try:
+        return args.func(args, reporter)
+    finally:
+        if _PRESETS is not None:
+            # Gộp log preset vào presets.json trước khi thoát
+            try:
+                _PRESETS.close()
+            except (OSError, ValueError) as e:
+                print(f"[!] Không gộp được presets.json: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
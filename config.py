@@ -36,6 +36,80 @@ class Config:
     
     # 8. Danh sách lệnh (sẽ được core.py tự động điền)
     commands: List[str] = field(default_factory=list)
+
+    # 9. Số worker xử lý song song khi chạy batch (GUI đọc thêm 'batch_workers' trong settings.ini)
+    batch_workers: int = 1
+
+    # 10. File trace mặc định (Chrome Trace JSON) khi bật --trace hoặc trace_enabled
+    trace_file: Path = Path("trace.json")
+
+    # 11. Ngân sách RAM (MB) cho batch song song: 0 = tự động (50% RAM), -1 = tắt
+    memory_budget_mb: int = 0
+
+    # 12. Profile giới hạn tài nguyên ImageMagick (thread/memory/map/area/disk) - xem utils/resources.py
+    # Giới hạn là toàn cục theo process: GUI dùng profile này làm nền, batch trong GUI áp profile riêng khi chạy
+    gui_resource_profile: str = "preview"
+    # Batch (CLI và GUI): "auto" = nhiều worker -> throughput (1 thread IM/worker), 1 worker -> latency (IM dùng mọi core)
+    batch_resource_profile: str = "auto"
+
+    # 13. Autoscale số worker batch (hill-climbing theo throughput)
+    autoscale_max_workers: int = 0      # 0 = 2 x số core
+    autoscale_interval_s: float = 3.0   # Chu kỳ đo/điều chỉnh (giây)
+
+    # 14. Log batch trên GUI: gom dòng log/progress và cập nhật theo nhịp khung hình,
+    # chỉ giữ N dòng cuối trên màn hình (log đầy đủ ghi ra <output>/.imtool/batch.log)
+    ui_flush_fps: int = 30
+    log_view_lines: int = 5000
+
+    # 15. Watch folder (cli.py watch): file phải đứng yên (size/mtime) bao lâu mới xử lý,
+    # chu kỳ quét khi không có watchdog, chu kỳ báo cáo throughput/backlog (giây)
+    watch_settle_s: float = 2.0
+    watch_poll_interval_s: float = 2.0
+    watch_report_interval_s: float = 10.0
+
+    # 16. -target-size: khoảng quality được phép, số lần encode tối đa mỗi ảnh,
+    # và sai số chấp nhận (file nằm trong 3% dưới mục tiêu là đủ tốt, dừng tìm)
+    target_min_quality: int = 30
+    target_max_encodes: int = 7
+    target_tolerance: float = 0.03
+
+    # 17. Ghi output: encode vào RAM rồi ghi 1 lần với buffer này (bytes);
+    # fsync output + journal theo đợt N file (0 = không fsync, nhanh nhất)
+    write_buffer_bytes: int = 1024 * 1024
+    output_fsync_every: int = 0
+
+    # 18. Thumbnail (chế độ lưới của danh sách file): kích thước cạnh dài (px), số thread decode,
+    # thư mục cache trên đĩa, số icon tối đa giữ trong RAM (icon cuộn ra xa bị giải phóng)
+    thumbnail_size: int = 128
+    thumbnail_workers: int = 2
+    thumbnail_cache_dir: Path = Path(".thumbcache")
+    thumbnail_memory_items: int = 600
+
+    # 19. Index metadata (header ảnh: kích thước, format, colorspace, depth, số frame, EXIF orientation)
+    # dùng chung cho lọc danh sách file, ước lượng RAM batch; số thread ping (0 = số core)
+    metadata_index_enabled: bool = True
+    metadata_index_file: Path = Path("metadata_index.sqlite")
+    metadata_index_workers: int = 0
+
+    # 20. Histogram/thống kê pixel (numpy) tính trên thread preview từ buffer tạo QImage
+    preview_stats_enabled: bool = True
+    # Chế độ Diff: hệ số khuếch đại heatmap (sai khác 64/255 x 4 = đỏ rực)
+    diff_heatmap_gain: float = 4.0
+
+    # 21. So sánh preset A/B (cli.py ab): số file mẫu mặc định, số nhóm dung lượng khi phân tầng,
+    # seed chọn mẫu (cố định -> các lần chạy so trên cùng 1 mẫu)
+    ab_sample_size: int = 48
+    ab_size_buckets: int = 4
+    ab_seed: int = 0
+
+    # 22. Preset store: số thay đổi tối đa nằm trong presets.json.log trước khi ghi lại snapshot presets.json
+    preset_log_compact_ops: int = 200
+
+    # 23. Ảnh lớn hơn ngưỡng này (megapixel) được xử lý theo tile nếu chuỗi lệnh chỉ gồm lệnh điểm/cục bộ
+    # (0 = tắt). Khi bật, batch giới hạn 'area' của ImageMagick bằng ngưỡng này -> ảnh lớn hơn nằm
+    # trong pixel cache trên disk. Cạnh tile (px, chưa tính halo); file tạm nằm cạnh output.
+    tile_threshold_mp: int = 150
+    tile_size: int = 1024
     
 
 CONFIG = Config()
@@ -1,15 +1,23 @@
 # core/__init__.py
 
 from .validator import ValidationError, Validator
-from .cache import ImageCache
+from .cache import ImageCache, ThumbnailStore
 from .parser import CommandParser
+from .presets import CompiledPreset, PresetStore
+from .completion import COMMAND_INDEX, CommandIndex, CommandTrie
 from .commands import Command_classes
 from .commands.base_command import BaseCommand
 
 __all__ = [ 'ValidationError', 
             'Validator', 
             'ImageCache', 
+            'ThumbnailStore',
             'CommandParser',
+            'CompiledPreset',
+            'PresetStore',
+            'COMMAND_INDEX',
+            'CommandIndex',
+            'CommandTrie',
             'Command_classes',
             ]
 
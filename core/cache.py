@@ -1,4 +1,7 @@
 # v3.0/core/cache.py
+import os
+import hashlib
+from pathlib import Path
 from collections import OrderedDict
 from typing import Optional
 from qtpy.QtGui import QImage
@@ -53,4 +56,43 @@ class ImageCache:
     def clear(self):
         """Reset toàn bộ cache"""
         self.cache.clear()
-        self.current_size = 0
\ No newline at end of file
+        self.current_size = 0
+
+
+# ==========================
+# THUMBNAIL CACHE (TRÊN ĐĨA)
+# ==========================
+class ThumbnailStore:
+    """
+    Lưu thumbnail đã encode (JPEG) trên đĩa, dùng lại giữa các lần mở app.
+    Key = hash(đường dẫn + mtime + size + kích thước thumbnail): file gốc đổi -> key đổi,
+    thumbnail cũ tự bị bỏ qua (không cần invalidate).
+    Thread-safe: mỗi key là 1 file, ghi vào .tmp rồi os.replace.
+    """
+    def __init__(self, root: Path, thumb_size: int):
+        self.root = Path(root)
+        self.thumb_size = thumb_size
+
+    def key(self, identity: str, mtime_ns: int, size: int) -> str:
+        raw = f"{identity}|{mtime_ns}|{size}|{self.thumb_size}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.jpg"
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self._path(key).read_bytes()
+        except OSError:
+            return None
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        temp = path.with_name(f"{path.name}.{os.getpid()}.{id(data)}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp.write_bytes(data)
+            os.replace(temp, path)
+        except OSError:
+            # Cache chỉ để tăng tốc: đĩa đầy/không ghi được thì bỏ qua
+            temp.unlink(missing_ok=True)
@@ -3,6 +3,9 @@ import re
 from ..validator import Validator, ValidationError
 from .base_command import BaseCommand
 
+# Option lưu dung lượng mục tiêu (bytes) trên ảnh, bước ghi file của batch sẽ đọc lại
+TARGET_SIZE_OPTION = "imtool:target-size"
+
 # =====================================================
 # 2. IMAGE SETTINGS & METADATA (Cài đặt & Dữ liệu ảnh)
 # ====================================================
@@ -21,6 +24,19 @@ class SettingsCommands(BaseCommand):
             raise ValidationError("quality: giá trị phải từ 0-100")
         img.compression_quality = quality
 
+    @staticmethod
+    def _cmd_target_size(img, v):
+        """
+        Nén JPEG/WebP/AVIF với quality cao nhất mà file vẫn <= dung lượng này.
+        Cú pháp: 300KB, 1.5MB, 250k. VD: -format webp -target-size 300KB.
+        Chỉ có tác dụng khi chạy batch (ghi file); preview không đổi.
+        """
+        if not v:
+            raise ValidationError("target-size: thiếu dung lượng (VD: 300KB)")
+
+        size = Validator.validate_byte_size(v, "target-size")
+        img.options[TARGET_SIZE_OPTION] = str(size)
+
     @staticmethod
     def _cmd_density(img, v):
         """
@@ -0,0 +1,185 @@
+# core/completion.py
+import re
+import inspect
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .parser import CommandParser
+
+# ==========================
+# AUTOCOMPLETE (TRIE LỆNH + GỢI Ý THAM SỐ)
+# ==========================
+class CommandHint(NamedTuple):
+    """Gợi ý cho 1 lệnh, lấy từ docstring của hàm _cmd_..."""
+    name: str                 # '-resize'
+    summary: str              # Dòng đầu docstring
+    syntax: str               # Dòng 'Cú pháp:' / 'Giá trị:' / 'VD:' (rỗng nếu không có)
+    values: Tuple[str, ...]   # Giá trị liệt kê sau 'Giá trị:' (gray, rgb, cmyk...)
+
+
+_SYNTAX_LINE = re.compile(r'^(Cú pháp|Giá trị|VD)\s*:\s*(.+)$')
+_VALUE = re.compile(r'^[\w:#.+-]+$')
+
+
+def _hint_from_doc(name: str, func) -> CommandHint:
+    lines = [line.strip() for line in (inspect.getdoc(func) or "").splitlines() if line.strip()]
+    summary = lines[0] if lines else ""
+    syntax, values = "", ()
+    for line in lines[1:]:
+        match = _SYNTAX_LINE.match(line)
+        if not match:
+            continue
+        syntax = syntax or line
+        if match.group(1) == 'Giá trị' and not values:
+            items = (v.strip().rstrip('.').strip() for v in match.group(2).split(','))
+            values = tuple(v for v in items if v and _VALUE.match(v))
+    return CommandHint(name, summary, syntax, values)
+
+
+class _Node:
+    __slots__ = ('children', 'words')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.words: List[str] = []     # Mọi từ trong nhánh này (tiền tố = đường đi tới node)
+
+
+class CommandTrie:
+    """
+    Trie không phân biệt hoa thường. Mỗi node giữ sẵn danh sách từ trong nhánh của nó
+    -> tìm theo tiền tố chỉ đi len(prefix) bước, không duyệt lại cả cây mỗi phím gõ.
+    Kết quả xếp theo số lần dùng (record) giảm dần, rồi theo alphabet;
+    thứ tự đã xếp được cache theo node cho tới lần record tiếp theo.
+    """
+    def __init__(self, words: Iterable[str] = ()):
+        self._root = _Node()
+        self._words: Dict[str, str] = {}       # casefold -> từ gốc
+        self.counts: Dict[str, int] = {}
+        self._ranked: Dict[int, List[str]] = {} # id(node) -> từ đã xếp hạng
+        for word in words:
+            self.insert(word)
+
+    def insert(self, word: str):
+        key = word.casefold()
+        if key in self._words:
+            return
+        self._words[key] = word
+        node = self._root
+        node.words.append(word)
+        for ch in key:
+            node = node.children.setdefault(ch, _Node())
+            node.words.append(word)
+        self._ranked.clear()
+
+    def __contains__(self, word: str) -> bool:
+        return word.casefold() in self._words
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def canonical(self, word: str) -> Optional[str]:
+        """Từ gốc (đúng hoa thường) của word, None nếu không có"""
+        return self._words.get(word.casefold())
+
+    def complete(self, prefix: str, limit: int = 0) -> List[str]:
+        node = self._root
+        for ch in prefix.casefold():
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        ranked = self._ranked.get(id(node))
+        if ranked is None:
+            counts = self.counts
+            ranked = self._ranked[id(node)] = sorted(node.words, key=lambda w: (-counts.get(w, 0), w.casefold()))
+        return ranked[:limit] if limit else list(ranked)
+
+    def record(self, word: str, times: int = 1):
+        """Tăng số lần dùng (từ không có trong trie bị bỏ qua)"""
+        word = self.canonical(word)
+        if word is not None and times > 0:
+            self.counts[word] = self.counts.get(word, 0) + times
+            self._ranked.clear()
+
+
+class CommandIndex:
+    """
+    Index dùng cho ô nhập lệnh (SmartCommandEdit + highlighter):
+    - commands: trie các lệnh '-resize', '-quality'... (theo CommandParser.DISPATCH)
+    - values: trie giá trị tham số cho lệnh có liệt kê 'Giá trị:' trong docstring
+    - hint(cmd): mô tả + cú pháp để hiện tooltip khi đang gõ tham số
+    - Số lần dùng (chọn gợi ý, chạy batch) -> xếp hạng gợi ý; lưu/đọc qua usage()/load_usage()
+    """
+    def __init__(self, dispatch: Dict[str, object] = None):
+        dispatch = CommandParser.DISPATCH if dispatch is None else dispatch
+        self.hints: Dict[str, CommandHint] = {}
+        self.values: Dict[str, CommandTrie] = {}
+        for cmd, func in sorted(dispatch.items()):
+            hint = _hint_from_doc(f"-{cmd}", func)
+            self.hints[cmd] = hint
+            if hint.values:
+                self.values[cmd] = CommandTrie(hint.values)
+        self.commands = CommandTrie(h.name for h in self.hints.values())
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(command: str) -> str:
+        return command.lstrip('-').casefold()
+
+    def is_command(self, token: str) -> bool:
+        return self._key(token) in self.hints
+
+    def hint(self, command: str) -> Optional[CommandHint]:
+        return self.hints.get(self._key(command))
+
+    def complete_command(self, prefix: str, limit: int = 0) -> List[str]:
+        with self._lock:
+            return self.commands.complete(prefix, limit)
+
+    def complete_value(self, command: str, prefix: str, limit: int = 0) -> List[str]:
+        trie = self.values.get(self._key(command))
+        if trie is None:
+            return []
+        with self._lock:
+            return trie.complete(prefix, limit)
+
+    def record_usage(self, command_string: str):
+        """Ghi nhận các lệnh (và giá trị liệt kê) trong 1 chuỗi lệnh đã dùng"""
+        with self._lock:
+            for cmd, value in CommandParser.parse(command_string):
+                self.commands.record(f"-{cmd}")
+                if value and cmd in self.values:
+                    self.values[cmd].record(value)
+
+    def record(self, command: str, value: str = None):
+        """Ghi nhận 1 gợi ý vừa được chọn"""
+        with self._lock:
+            if value is None:
+                self.commands.record(command)
+            elif self._key(command) in self.values:
+                self.values[self._key(command)].record(value)
+
+    def usage(self) -> Dict[str, int]:
+        """Số lần dùng dạng phẳng: {'-resize': 12, '-colorspace gray': 3}"""
+        with self._lock:
+            flat = dict(self.commands.counts)
+            for cmd, trie in self.values.items():
+                flat.update({f"-{cmd} {value}": n for value, n in trie.counts.items()})
+            return flat
+
+    def load_usage(self, usage: Dict[str, int]):
+        with self._lock:
+            for key, count in usage.items():
+                command, _, value = str(key).partition(' ')
+                try:
+                    count = int(count)
+                except (TypeError, ValueError):
+                    continue
+                if value:
+                    trie = self.values.get(self._key(command))
+                    if trie is not None:
+                        trie.record(value, count)
+                else:
+                    self.commands.record(command, count)
+
+
+COMMAND_INDEX = CommandIndex()
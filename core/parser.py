@@ -1,8 +1,9 @@
 # core/parser.py
 import re
+import hashlib
 from typing import List, Tuple, Optional
 from config import CONFIG
-from utils import handle_errors
+from utils import handle_errors, TRACER
 
 # Import các module Ops
 from .commands import ALL_COMMANDS
@@ -52,6 +53,30 @@ class CommandParser:
         
         return operations
     
+    @staticmethod
+    def plan_hash(operations: List[Tuple[str, Optional[str]]]) -> str:
+        """
+        Hash ổn định của danh sách lệnh đã parse.
+        Dùng để nhận biết 2 lần chạy có cùng "kế hoạch xử lý" (journal, manifest...).
+        """
+        canonical = "\n".join(f"{cmd}\t{value or ''}" for cmd, value in operations)
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def common_prefix_length(plans: List[List[Tuple[str, Optional[str]]]]) -> int:
+        """
+        Số lệnh đầu tiên giống hệt nhau ở tất cả các plan.
+        VD: [-strip -resize 200] và [-strip -resize 800] -> 1 (chỉ -strip dùng chung)
+        """
+        if not plans:
+            return 0
+        length = 0
+        for ops in zip(*plans):
+            if any(op != ops[0] for op in ops[1:]):
+                break
+            length += 1
+        return length
+
     @classmethod
     @handle_errors()
     def apply_commands(cls, img, operations: List[Tuple[str, Optional[str]]]):
@@ -60,7 +85,8 @@ class CommandParser:
             handler = cls.DISPATCH.get(cmd)
             if handler:
                 try:
-                    handler(img, value)
+                    with TRACER.span(cmd, "op", value=value):
+                        handler(img, value)
                 except Exception as e:
                     print(f"⚠️ Lỗi khi thực thi lệnh '-{cmd} {value}': {e}")
             else:
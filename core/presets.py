@@ -0,0 +1,355 @@
+# core/presets.py
+import os
+import re
+import json
+import bisect
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from config import CONFIG
+from .parser import CommandParser
+
+# ==========================
+# PRESET STORE (INDEX TRONG RAM + LOG GHI THÊM)
+# ==========================
+_WORD = re.compile(r"[^\W_]+", re.UNICODE)
+_NO_BASE = object()   # Log không có dòng "base" (không biết dựa trên snapshot nào)
+
+
+def _tokens(text: str) -> Set[str]:
+    """Từ khóa để tìm kiếm: chữ/số viết thường (VD: '-resize 50%' -> resize, 50)"""
+    return set(_WORD.findall(text.casefold()))
+
+
+class CompiledPreset(NamedTuple):
+    """Kết quả parse + kiểm tra 1 preset (cache theo chuỗi lệnh)"""
+    command_string: str
+    operations: List[Tuple[str, Optional[str]]]
+    plan_hash: str
+    unknown: Tuple[str, ...]     # Lệnh không có trong DISPATCH
+
+    @property
+    def valid(self) -> bool:
+        return bool(self.operations) and not self.unknown
+
+    @property
+    def problem(self) -> str:
+        if not self.operations:
+            return "Preset không có lệnh nào"
+        if self.unknown:
+            return "Lệnh không hỗ trợ: " + ", ".join(f"-{cmd}" for cmd in self.unknown)
+        return ""
+
+
+def compile_command(command_string: str) -> CompiledPreset:
+    operations = CommandParser.parse(command_string)
+    unknown = tuple(dict.fromkeys(cmd for cmd, _ in operations if cmd not in CommandParser.DISPATCH))
+    return CompiledPreset(command_string, operations, CommandParser.plan_hash(operations), unknown)
+
+
+class PresetStore:
+    """
+    Quản lý presets.json cho GUI và CLI:
+    - Đọc 1 lần vào RAM (dict tên -> lệnh) + index tìm kiếm:
+        * danh sách tên đã sort (casefold) -> tìm theo tiền tố bằng bisect
+        * inverted index từ khóa (tên + lệnh) -> tập tên preset (tìm full-text)
+    - Ghi tăng dần: mỗi thay đổi là 1 dòng JSON nối vào <presets.json>.log;
+      khi log dài quá CONFIG.preset_log_compact_ops dòng, hoặc khi close() (đóng GUI / CLI thoát),
+      thì ghi lại snapshot presets.json (.tmp + os.replace) rồi xóa log
+      -> presets.json luôn đầy đủ với bản cũ của tool và khi copy/chia sẻ file.
+      Dòng log bị cắt dở (crash) bị bỏ qua khi đọc.
+    - Dòng đầu của log ghi size/mtime của snapshot mà log dựa trên. presets.json bị tool khác
+      ghi lại (không khớp) -> snapshot mới là bản đúng, log cũ bị bỏ (không phát lại đè lên).
+    - Cache plan đã parse + kết quả kiểm tra theo chuỗi lệnh (đổi tên không phải parse lại).
+    - File bị process khác sửa (size/mtime đổi) -> refresh() đọc lại.
+    Thread-safe (1 lock).
+    """
+    def __init__(self, path: Path = None):
+        self.path = Path(path or CONFIG.preset_file)
+        self.log_path = self.path.with_name(self.path.name + ".log")
+        self._presets: Dict[str, str] = {}
+        self._sorted: List[Tuple[str, str]] = []          # (casefold, tên) đã sort
+        self._postings: Dict[str, Set[str]] = {}           # từ khóa -> tên preset
+        self._vocab: List[str] = []                        # từ khóa đã sort (tìm theo tiền tố)
+        self._compiled: Dict[str, CompiledPreset] = {}     # chuỗi lệnh -> plan
+        self._log_ops = 0
+        self._stamp = None
+        self._lock = threading.RLock()
+
+    # --- Đọc ---
+    def load(self) -> 'PresetStore':
+        with self._lock:
+            presets = {}
+            if self.path.exists():
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    presets = {str(k): str(v) for k, v in json.load(f).items()}
+            self._log_ops = 0
+            base, ops = self._read_log()
+            if base is not _NO_BASE and base != self._snapshot_stamp():
+                # presets.json đã bị ghi lại sau khi log bắt đầu -> bỏ log (đã cũ so với snapshot)
+                self.log_path.unlink(missing_ok=True)
+                ops = []
+            for op in ops:
+                try:
+                    self._replay(presets, op)
+                except (ValueError, KeyError, TypeError):
+                    continue
+                self._log_ops += 1
+            self._presets = presets
+            self._rebuild_index()
+            self._stamp = self._file_stamp()
+        return self
+
+    def refresh(self) -> bool:
+        """Đọc lại nếu presets.json/log bị sửa từ bên ngoài. Trả về True nếu có đọc lại."""
+        with self._lock:
+            if self._stamp == self._file_stamp():
+                return False
+            self.load()
+            return True
+
+    def _read_log(self):
+        """(stamp snapshot mà log dựa trên | _NO_BASE, danh sách op). Bỏ qua dòng ghi dở."""
+        base, ops = _NO_BASE, []
+        if not self.log_path.exists():
+            return base, ops
+        with open(self.log_path, 'r', encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    continue  # Dòng cuối ghi dở
+                if i == 0 and isinstance(op, dict) and op.get("op") == "base":
+                    base = op.get("snapshot")
+                else:
+                    ops.append(op)
+        return base, ops
+
+    def _snapshot_stamp(self) -> Optional[List[int]]:
+        """[size, mtime_ns] của presets.json (dạng list để so với giá trị đọc từ JSON)"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def _file_stamp(self):
+        stamp = []
+        for path in (self.path, self.log_path):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_size, st.st_mtime_ns))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    @staticmethod
+    def _replay(presets: Dict[str, str], op: dict):
+        kind = op["op"]
+        if kind == "set":
+            presets[op["name"]] = op["command"]
+        elif kind == "del":
+            presets.pop(op["name"], None)
+        elif kind == "rename":
+            if op["old"] in presets:
+                presets[op["new"]] = presets.pop(op["old"])
+        else:
+            raise ValueError(kind)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._presets
+
+    def __len__(self) -> int:
+        return len(self._presets)
+
+    def get(self, name: str) -> Optional[str]:
+        return self._presets.get(name)
+
+    def names(self) -> List[str]:
+        """Tên preset theo thứ tự alphabet (không phân biệt hoa thường)"""
+        with self._lock:
+            return [name for _, name in self._sorted]
+
+    def as_dict(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._presets)
+
+    def compiled(self, name: str) -> Optional[CompiledPreset]:
+        """Plan đã parse + kiểm tra của preset (None nếu không tồn tại)"""
+        command = self._presets.get(name)
+        if command is None:
+            return None
+        with self._lock:
+            plan = self._compiled.get(command)
+            if plan is None:
+                plan = self._compiled[command] = compile_command(command)
+            return plan
+
+    # --- Tìm kiếm ---
+    def search(self, query: str, limit: int = 0) -> List[str]:
+        """
+        Tên preset khớp query, sort theo alphabet:
+        - Tên bắt đầu bằng query (tiền tố, không phân biệt hoa thường) xếp trước
+        - Sau đó là preset có đủ mọi từ trong query ở tên hoặc lệnh (từ cuối khớp theo tiền tố)
+        """
+        query = query.strip()
+        if not query:
+            names = self.names()
+            return names[:limit] if limit else names
+        with self._lock:
+            key = query.casefold()
+            prefix = []
+            i = bisect.bisect_left(self._sorted, (key, ""))
+            while i < len(self._sorted) and self._sorted[i][0].startswith(key):
+                prefix.append(self._sorted[i][1])
+                i += 1
+
+            words = _WORD.findall(key)
+            matched: Optional[Set[str]] = None
+            for i, word in enumerate(words):
+                hits = self._prefix_postings(word) if i == len(words) - 1 else self._postings.get(word, set())
+                matched = set(hits) if matched is None else matched & hits
+                if not matched:
+                    break
+            seen = set(prefix)
+            rest = sorted((n for n in matched or () if n not in seen), key=str.casefold)
+        result = prefix + rest
+        return result[:limit] if limit else result
+
+    def _prefix_postings(self, word: str) -> Set[str]:
+        hits: Set[str] = set()
+        vocab = self._vocab
+        i = bisect.bisect_left(vocab, word)
+        while i < len(vocab) and vocab[i].startswith(word):
+            hits |= self._postings[vocab[i]]
+            i += 1
+        return hits
+
+    def _rebuild_index(self):
+        self._sorted = sorted((name.casefold(), name) for name in self._presets)
+        self._postings = {}
+        for name, command in self._presets.items():
+            self._index_add(name, command)
+        self._vocab = sorted(self._postings)
+        live = set(self._presets.values())
+        self._compiled = {cmd: plan for cmd, plan in self._compiled.items() if cmd in live}
+
+    def _index_add(self, name: str, command: str):
+        for token in _tokens(name) | _tokens(command):
+            self._postings.setdefault(token, set()).add(name)
+
+    def _index_remove(self, name: str, command: str):
+        for token in _tokens(name) | _tokens(command):
+            names = self._postings.get(token)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self._postings[token]
+                    i = bisect.bisect_left(self._vocab, token)
+                    if i < len(self._vocab) and self._vocab[i] == token:
+                        del self._vocab[i]
+
+    def _index_put(self, name: str, command: str):
+        old = self._presets.get(name)
+        if old is not None:
+            self._index_remove(name, old)
+        else:
+            bisect.insort(self._sorted, (name.casefold(), name))
+        self._presets[name] = command
+        for token in _tokens(name) | _tokens(command):
+            if token not in self._postings:
+                bisect.insort(self._vocab, token)
+        self._index_add(name, command)
+
+    def _index_pop(self, name: str) -> Optional[str]:
+        command = self._presets.pop(name, None)
+        if command is not None:
+            self._index_remove(name, command)
+            i = bisect.bisect_left(self._sorted, (name.casefold(), name))
+            if i < len(self._sorted) and self._sorted[i][1] == name:
+                del self._sorted[i]
+        return command
+
+    # --- Ghi ---
+    def set(self, name: str, command: str):
+        with self._lock:
+            self.refresh()
+            self._index_put(name, command)
+            self._append([{"op": "set", "name": name, "command": command}])
+
+    def delete(self, name: str) -> bool:
+        with self._lock:
+            self.refresh()
+            if self._index_pop(name) is None:
+                return False
+            self._append([{"op": "del", "name": name}])
+            return True
+
+    def rename(self, old: str, new: str) -> bool:
+        with self._lock:
+            self.refresh()
+            command = self._index_pop(old)
+            if command is None:
+                return False
+            self._index_put(new, command)
+            self._append([{"op": "rename", "old": old, "new": new}])
+            return True
+
+    def update(self, presets: Dict[str, str]):
+        """Thêm/ghi đè nhiều preset (Import). Lô lớn ghi thẳng snapshot thay vì log."""
+        with self._lock:
+            self.refresh()
+            for name, command in presets.items():
+                self._index_put(str(name), str(command))
+            self._append([{"op": "set", "name": str(name), "command": str(command)}
+                          for name, command in presets.items()])
+
+    def export(self, path: Path):
+        """Ghi toàn bộ preset (đã gộp log) ra 1 file JSON"""
+        with self._lock:
+            self._write_json(Path(path), self._presets)
+
+    def close(self):
+        """Gộp log vào presets.json (gọi khi đóng GUI / CLI thoát)"""
+        with self._lock:
+            self.refresh()
+            if self._log_ops or self.log_path.exists():
+                self.compact()
+
+    def compact(self):
+        """Ghi snapshot presets.json mới rồi xóa log"""
+        with self._lock:
+            self._write_json(self.path, self._presets)
+            # Crash trước khi xóa log: log dựa trên snapshot cũ -> bị bỏ khi đọc (snapshot mới đã gồm hết)
+            self.log_path.unlink(missing_ok=True)
+            self._log_ops = 0
+            self._stamp = self._file_stamp()
+
+    def _append(self, ops: List[dict]):
+        if not ops:
+            return
+        if self._log_ops + len(ops) > CONFIG.preset_log_compact_ops:
+            self.compact()
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lines = [{"op": "base", "snapshot": self._snapshot_stamp()}] if not self.log_path.exists() else []
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write("".join(json.dumps(op, ensure_ascii=False) + "\n" for op in lines + ops))
+        self._log_ops += len(ops)
+        self._stamp = self._file_stamp()
+
+    @staticmethod
+    def _write_json(path: Path, data: Dict[str, str]):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_name(path.name + ".tmp")
+        try:
+            with open(temp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, path)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+
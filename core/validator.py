@@ -1,4 +1,5 @@
 # core/validator.py
+import re
 from typing import List, Tuple, Optional
 from utils import SafeParse
 
@@ -74,6 +75,18 @@ class Validator:
             raise ValidationError("Màu không được để trống")
         return value.strip()
     
+    @staticmethod
+    def validate_byte_size(value: str, param_name: str) -> int:
+        """Validate dung lượng: 300KB, 1.5MB, 250k, 120000 (bytes). 1KB = 1024 bytes."""
+        match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?\s*', value or '', re.IGNORECASE)
+        if not match:
+            raise ValidationError(f"{param_name} không hợp lệ: {value} (VD: 300KB, 1.5MB)")
+        units = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+        size = float(match.group(1)) * units[match.group(2).lower()]
+        if size < 1:
+            raise ValidationError(f"{param_name} phải > 0")
+        return int(size)
+
     @staticmethod
     def validate_enum(value: str, valid_values: List[str], param_name: str) -> str:
         """Validate giá trị trong danh sách cho phép"""
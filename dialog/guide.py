@@ -30,7 +30,7 @@ GUIDE_CONTENT = BASE_STYLE + """
 <h2>💡 Mẹo sử dụng</h2>
 <ul>
     <li><b>Split View:</b> Bật chế độ này để so sánh trực quan Before/After. Bạn có thể zoom/pan đồng bộ cả 2 bên.</li>
-    <li><b>Presets:</b> Chuột phải vào preset để đổi tên. Dùng nút Import/Export để chia sẻ công thức.</li>
+    <li><b>Presets:</b> Chuột phải vào preset để đổi tên. Dùng nút Import/Export để chia sẻ công thức. Ô tìm kiếm lọc theo tên hoặc nội dung lệnh (VD: <code>webp resize</code>); preset có lệnh không hỗ trợ hiện màu cam.</li>
     <li><b>Natural Sort:</b> Tool tự động sắp xếp file thông minh (Chapter 1 -> Chapter 2... -> Chapter 10).</li>
 </ul>
 """
\ No newline at end of file
@@ -1,12 +1,34 @@
 # main.py
 import sys
+from pathlib import Path
 from qtpy.QtWidgets import QApplication, QMessageBox
 
+def _parse_trace_arg(argv):
+    """
+    Đọc tham số bật tracing từ dòng lệnh:
+    --trace (ghi ra file mặc định), --trace file.json hoặc --trace=file.json
+    """
+    from config import CONFIG
+    for i, arg in enumerate(argv):
+        if arg.startswith("--trace="):
+            return Path(arg.split("=", 1)[1])
+        if arg == "--trace":
+            if i + 1 < len(argv) and not argv[i + 1].startswith("-"):
+                return Path(argv[i + 1])
+            return CONFIG.trace_file
+    return None
+
 def main():
     # Khởi tạo App trước để có thể dùng QMessageBox nếu lỗi xảy ra ngay khi import
     app = QApplication(sys.argv)
     app.setStyle("Fusion") # Giao diện hiện đại
 
+    # Bật tracing nếu có tham số --trace (Chrome Trace JSON)
+    trace_path = _parse_trace_arg(sys.argv)
+    if trace_path:
+        from utils import TRACER
+        TRACER.enable(trace_path)
+
     # ============================================================
     # 1. SETUP MÔI TRƯỜNG & KIỂM TRA DEPENDENCIES
     # ============================================================
@@ -1,3 +1,4 @@
+import json
 from pathlib import Path
 from typing import List, Dict, Optional
 
@@ -8,9 +9,11 @@ from wand.image import Image as WandImage
 
 # Import Modules
 from config import CONFIG
-from core import ImageCache
-from workers import BatchWorker, FileLoaderWorker, PreviewController
+from core import ImageCache, CommandParser, COMMAND_INDEX
+from workers import BatchWorker, BatchJournal, FileLoaderWorker, PreviewController, ThumbnailService
+from workers import ARCHIVE_SUFFIXES, ArchiveSource, is_archive_path
 from dialog import HelpDialog
+from utils import TRACER, RESOURCES, build_profile
 
 # Import UI Panels
 from ui.panels.left import LeftPanel
@@ -28,6 +31,11 @@ class ImageMagickTool(QMainWindow):
         
         self.settings = QSettings(str(CONFIG.settings_file), QSettings.IniFormat)
         self.cache = ImageCache(max_size_mb=500)
+        self.stats_cache: Dict[str, object] = {}  # Lệnh -> PixelStats của preview (đi kèm self.cache)
+
+        # Tracing: bật bằng nút Trace (lưu 'trace_enabled' trong settings.ini) hoặc --trace
+        if self.settings.value("trace_enabled", False, type=bool) and not TRACER.enabled:
+            TRACER.enable(self._trace_path())
 
         # State
         self.input_dir = Path(self.settings.value("last_input_dir", ""))
@@ -37,13 +45,25 @@ class ImageMagickTool(QMainWindow):
         self.current_index = -1
         self.worker: Optional[BatchWorker] = None
         self.file_loader_worker: Optional[FileLoaderWorker] = None
+        self._retired_loaders: List[FileLoaderWorker] = []
+        self.input_archive: Optional[ArchiveSource] = None
         self.cached_source_blob = None
         self._preview_lock = False
+        self._original_qimage: Optional[QImage] = None   # Ảnh gốc/preview đang hiện (cho chế độ Diff)
+        self._preview_qimage: Optional[QImage] = None
+
+        # Giới hạn ImageMagick là toàn cục theo process -> profile preview làm nền, batch áp profile riêng khi chạy
+        try:
+            RESOURCES.pin(build_profile(CONFIG.gui_resource_profile))
+        except Exception as e:
+            print(f"[!] Không thể đặt resource profile: {e}")
 
         # Controllers
         self.preview_controller = PreviewController()
         self.preview_controller.original_ready_signal.connect(self._on_original_ready)
         self.preview_controller.preview_ready_signal.connect(self._on_preview_ready)
+        self.preview_controller.diff_ready_signal.connect(self._on_diff_ready)
+        self.thumbnailer = ThumbnailService()
         
         # Timers
         self.ui_load_timer = QTimer()
@@ -91,13 +111,23 @@ class ImageMagickTool(QMainWindow):
         self.middle.req_prev_image.connect(self._prev_image)
         self.middle.req_next_image.connect(self._next_image)
         self.middle.req_refresh_preview.connect(self._refresh_split_view_logic)
+        self.middle.req_diff_update.connect(self._request_diff)
+        self.left.req_thumbnails.connect(self.thumbnailer.request)
+        self.thumbnailer.thumbnail_ready.connect(self.left.set_thumbnail)
         # Right
         self.right.command_changed.connect(self._on_command_input_changed)
         self.right.req_start_batch.connect(self._start_batch_thread)
         self.right.req_stop_batch.connect(self._stop_batch_thread)
         self.right.req_help.connect(self._show_help)
+        self.right.btn_trace.setChecked(TRACER.enabled)
+        self.right.req_toggle_trace.connect(self._toggle_trace)
 
     def _restore_settings(self):
+        # Số lần dùng lệnh -> thứ tự gợi ý autocomplete
+        try:
+            COMMAND_INDEX.load_usage(json.loads(self.settings.value("command_usage", "{}")))
+        except (TypeError, ValueError):
+            pass
         # Restore và hiển thị output directory
         if self.output_dir.exists():
             self.left.lbl_output.setText(self.output_dir.name)
@@ -106,16 +136,7 @@ class ImageMagickTool(QMainWindow):
         if self.input_dir.exists():
             self.left.lbl_input.setText(str(self.input_dir))
             # Tự động quét file từ folder đã lưu
-            self.left.list_files.clear()
-            self.left.list_files.addItem("Đang khôi phục folder trước...")
-            self.left.btn_input.setEnabled(False)
-            
-            self.file_loader_worker = FileLoaderWorker(
-                self.input_dir, 
-                CONFIG.image_extensions
-            )
-            self.file_loader_worker.finished_signal.connect(self._on_scan_finished)
-            self.file_loader_worker.start()
+            self._start_scan("Đang khôi phục folder trước...")
 
     # --- LOGIC XỬ LÝ (Giữ nguyên như cũ) ---
     def _select_input(self):
@@ -125,6 +146,7 @@ class ImageMagickTool(QMainWindow):
         msg.setText("Bạn muốn chọn:")
         btn_files = msg.addButton("Chọn Files", QMessageBox.ActionRole)
         btn_folder = msg.addButton("Chọn Folder", QMessageBox.ActionRole)
+        btn_archive = msg.addButton("Chọn ZIP/TAR", QMessageBox.ActionRole)
         msg.addButton("Hủy", QMessageBox.RejectRole)
         msg.exec()
         
@@ -137,16 +159,34 @@ class ImageMagickTool(QMainWindow):
                 self.image_files = file_names
                 self._finalize_load_files(len(files))
                 
-        elif msg.clickedButton() == btn_folder:
-            d = QFileDialog.getExistingDirectory(self, "Chọn Folder", start_dir)
+        elif msg.clickedButton() in (btn_folder, btn_archive):
+            if msg.clickedButton() == btn_folder:
+                d = QFileDialog.getExistingDirectory(self, "Chọn Folder", start_dir)
+            else:
+                # Archive được coi như 1 folder input (đọc member trực tiếp, không giải nén)
+                patterns = ' '.join('*' + s for s in ARCHIVE_SUFFIXES)
+                d, _ = QFileDialog.getOpenFileName(self, "Chọn Archive", start_dir, f"Archives ({patterns})")
             if d:
                 self.input_dir = Path(d)
-                self.left.list_files.clear()
-                self.left.list_files.addItem("Đang quét file...")
-                self.left.btn_input.setEnabled(False) 
-                self.file_loader_worker = FileLoaderWorker(self.input_dir, CONFIG.image_extensions)
-                self.file_loader_worker.finished_signal.connect(self._on_scan_finished)
-                self.file_loader_worker.start()
+                self._start_scan("Đang quét file...")
+
+    def _start_scan(self, message: str):
+        """Quét input_dir ở background (sau đó FileLoaderWorker tiếp tục index metadata)"""
+        old = self.file_loader_worker
+        if old and old.isRunning():
+            # Đang index folder cũ -> dừng, bỏ kết quả (giữ tham chiếu tới khi thread thoát hẳn)
+            old.stop()
+            old.metadata_signal.disconnect(self.left.set_metadata)
+            self._retired_loaders.append(old)
+            old.finished.connect(lambda w=old: self._retired_loaders.remove(w))
+        self.left.set_metadata({})
+        self.left.list_files.clear()
+        self.left.list_files.addItem(message)
+        self.left.btn_input.setEnabled(False)
+        self.file_loader_worker = FileLoaderWorker(self.input_dir, CONFIG.image_extensions)
+        self.file_loader_worker.finished_signal.connect(self._on_scan_finished)
+        self.file_loader_worker.metadata_signal.connect(self.left.set_metadata)
+        self.file_loader_worker.start()
 
     def _on_scan_finished(self, structure, flat_list, total_count):
         self.file_structure = structure
@@ -169,6 +209,7 @@ class ImageMagickTool(QMainWindow):
 
     def _finalize_load_files(self, total_count):
         self.left.lbl_input.setText(f"{self.input_dir.name} ({total_count})")
+        self.thumbnailer.set_source(self.input_dir)
         self.left.list_files.clear()
         self.pending_files_queue = list(self.image_files)
         initial = self.pending_files_queue[:50]
@@ -194,30 +235,48 @@ class ImageMagickTool(QMainWindow):
             self._load_image_to_memory()
 
     def _prev_image(self):
-        if self.current_index > 0:
-            self.left.list_files.setCurrentRow(self.current_index - 1)
+        row = self.left.adjacent_row(self.current_index, -1)
+        if row >= 0:
+            self.left.list_files.setCurrentRow(row)
 
     def _next_image(self):
-        if self.current_index < len(self.image_files) - 1:
-            self.left.list_files.setCurrentRow(self.current_index + 1)
+        row = self.left.adjacent_row(self.current_index, +1)
+        if 0 <= row < len(self.image_files):
+            self.left.list_files.setCurrentRow(row)
 
     def _load_image_to_memory(self):
         filepath = self.input_dir / self.image_files[self.current_index]
         self.debounce_timer.stop()
         self.cache.clear()
+        self.stats_cache.clear()
         self.cached_source_blob = None
+        self._original_qimage = self._preview_qimage = None
         try:
-            with open(filepath, 'rb') as f: img_blob = f.read()
-            with WandImage(blob=img_blob) as img:
-                if img.width > 1200 or img.height > 1200: img.transform(resize="800x1200>")
-                self.cached_source_blob = img.make_blob(format='bmp')
+            with TRACER.span("load_source", "ui", file=filepath.name):
+                img_blob = self._read_source(self.image_files[self.current_index])
+                with WandImage(blob=img_blob) as img:
+                    if img.width > 1200 or img.height > 1200: img.transform(resize="800x1200>")
+                    self.cached_source_blob = img.make_blob(format='bmp')
+            self.right.set_stats("original", None)
             self.middle.lbl_info.setText(f"{self.current_index + 1}/{len(self.image_files)}: {filepath.name}")
             self.middle.image_canvas.reset_view_flag = True
-            if self.middle.split_view_enabled: self._update_left_canvas()
+            # Original worker cũng tính histogram ảnh gốc (cùng buffer tạo QImage) -> gửi cả khi không split view
+            if self.middle.split_view_enabled or CONFIG.preview_stats_enabled: self._update_left_canvas()
             self._execute_preview_update()
         except Exception as e:
             QMessageBox.warning(self, "Lỗi đọc ảnh", str(e))
 
+    def _read_source(self, rel_file: str) -> bytes:
+        """Bytes của file input (file thường, hoặc member nếu input là ZIP/TAR)"""
+        if not is_archive_path(self.input_dir):
+            with open(self.input_dir / rel_file, 'rb') as f:
+                return f.read()
+        if self.input_archive is None or self.input_archive.path != self.input_dir:
+            if self.input_archive:
+                self.input_archive.close()
+            self.input_archive = ArchiveSource(self.input_dir)
+        return self.input_archive.read(rel_file)
+
     def _on_command_input_changed(self):
         self.debounce_timer.start()
 
@@ -234,8 +293,15 @@ class ImageMagickTool(QMainWindow):
         if self.cached_source_blob:
             self.preview_controller.request_original(self.cached_source_blob)
 
-    def _on_original_ready(self, qimage: QImage):
+    def _on_original_ready(self, qimage: QImage, stats=None):
         """Nhận ảnh gốc từ Original Worker và hiển thị panel trái"""
+        self._original_qimage = qimage
+        self.right.set_stats("original", stats)
+        if self.middle.diff_enabled:
+            self._request_diff()  # Panel trái hiện heatmap thay cho ảnh gốc
+            return
+        if not self.middle.split_view_enabled:
+            return  # Chỉ cần histogram
         pixmap = QPixmap.fromImage(qimage)
         self.middle.image_canvas_left.set_image(
             pixmap, 
@@ -248,25 +314,41 @@ class ImageMagickTool(QMainWindow):
         cmd = self.right.txt_command.toPlainText().strip()
         cached_qimg = self.cache.get(cmd)
         if cached_qimg:
-            self._update_right_display(cached_qimg)
+            self._update_right_display(cached_qimg, self.stats_cache.get(cmd))
             return
         self._preview_lock = True
         self.preview_controller.request_preview(self.cached_source_blob, cmd)
 
-    def _on_preview_ready(self, qimage: QImage):
+    def _on_preview_ready(self, qimage: QImage, stats=None):
         """Nhận QImage từ Preview Worker và hiển thị panel phải"""
         self._preview_lock = False
         try:
             cmd = self.right.txt_command.toPlainText().strip()
             self.cache.put(cmd, qimage)
-            self._update_right_display(qimage)
+            if stats is not None:
+                self.stats_cache[cmd] = stats
+            self._update_right_display(qimage, stats)
         except Exception as e:
             print(f"Error preview: {e}")
 
-    def _update_right_display(self, qimg):
+    def _update_right_display(self, qimg, stats=None):
+        self.right.set_stats("preview", stats)
         pixmap = QPixmap.fromImage(qimg)
         self.middle.image_canvas.set_image(pixmap, reset_view=self.middle.image_canvas.reset_view_flag)
         self.middle.image_canvas.reset_view_flag = False
+        self._preview_qimage = qimg
+        if self.middle.diff_enabled:
+            self._request_diff()
+
+    def _request_diff(self):
+        """Chế độ Diff: so sánh gốc/preview trong vùng đang xem (tính ở Diff Worker)"""
+        if self.middle.diff_enabled:
+            self.preview_controller.request_diff(self._original_qimage, self._preview_qimage,
+                                                 self.middle.visible_region(),
+                                                 reset=self.middle.diff_generation is None)
+
+    def _on_diff_ready(self, result):
+        self.middle.set_diff_result(result)
 
     def _start_batch_thread(self):
         cmd = self.right.txt_command.toPlainText().strip()
@@ -276,13 +358,36 @@ class ImageMagickTool(QMainWindow):
         if not cmd:
             QMessageBox.warning(self, "Thiếu lệnh", "Vui lòng nhập lệnh.")
             return
+        COMMAND_INDEX.record_usage(cmd)
+        # -------------- Job dang dở (journal) -> hỏi có chạy tiếp không -------------
+        overwrite_mode = "overwrite"  # Default
+        resume = False
+        try:
+            plan_hash = CommandParser.plan_hash(CommandParser.parse(cmd))
+            resumable = BatchJournal.peek(self.input_dir, self.output_dir, plan_hash)
+        except Exception:
+            resumable = 0
+
+        if resumable > 0:
+            reply = QMessageBox.question(
+                self, "↩️ Job chưa hoàn tất",
+                f"Lần chạy trước với cùng lệnh đã xử lý xong {resumable} file rồi bị dừng.\n"
+                "Chạy tiếp từ chỗ dừng? (No = chạy lại từ đầu)",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel,
+                QMessageBox.Yes)
+            if reply == QMessageBox.Cancel:
+                return
+            resume = reply == QMessageBox.Yes
+
+        # Output vào ZIP/TAR (settings.ini: batch_archive = zip | tar) -> không có file lẻ để trùng
+        archive = self.settings.value("batch_archive", "", type=str) or None
+
         # -------------- Scan conflicts và hiện popup (CHỈ KHI BẤM START) -------------
-        has_conflicts, conflict_list = BatchWorker.scan_for_conflicts(
+        # Khi resume: file đã xong được bỏ qua theo journal, phần còn lại ghi đè (có thể là file ghi dở)
+        has_conflicts, conflict_list = (False, []) if resume or archive else BatchWorker.scan_for_conflicts(
             self.file_structure, self.input_dir, self.output_dir, cmd
         )
         
-        overwrite_mode = "overwrite"  # Default
-        
         if has_conflicts:
             msg = QMessageBox(self)
             msg.setIcon(QMessageBox.Warning)
@@ -297,6 +402,10 @@ class ImageMagickTool(QMainWindow):
             
             btn_overwrite = msg.addButton("Ghi Đè Tất Cả", QMessageBox.YesRole)
             btn_skip = msg.addButton("Bỏ Qua File Trùng", QMessageBox.NoRole)
+            btn_incremental = None
+            if not is_archive_path(self.input_dir):  # Input ZIP/TAR không hỗ trợ incremental
+                btn_incremental = msg.addButton("Chỉ File Mới/Thay Đổi", QMessageBox.ActionRole)
+                btn_incremental.setToolTip("So với lần chạy trước: chỉ xử lý file input mới, đã sửa, hoặc khi lệnh thay đổi")
             btn_cancel = msg.addButton("Hủy", QMessageBox.RejectRole)
             
             msg.setDefaultButton(btn_skip)  # Default = Skip (an toàn hơn)
@@ -306,21 +415,37 @@ class ImageMagickTool(QMainWindow):
                 overwrite_mode = "overwrite"
             elif msg.clickedButton() == btn_skip:
                 overwrite_mode = "skip"
+            elif btn_incremental is not None and msg.clickedButton() == btn_incremental:
+                overwrite_mode = "incremental"
             else:  # Cancel
                 return
         # -------------- Khởi tạo Worker với overwrite_mode ----------------
         self.right.btn_start.setEnabled(False)
         self.right.btn_stop.setEnabled(True)
         self.right.progress_bar.setValue(0)
-        self.right.txt_log.clear()
-        self.worker = BatchWorker(
-            self.file_structure, 
-            self.input_dir, 
-            self.output_dir, 
-            cmd,
-            overwrite_mode=overwrite_mode)
+        self.right.clear_log()
+        try:
+            self.worker = BatchWorker(
+                self.file_structure, 
+                self.input_dir, 
+                self.output_dir, 
+                cmd,
+                overwrite_mode=overwrite_mode,
+                workers=self.settings.value("batch_workers", CONFIG.batch_workers, type=int),
+                resume=resume,
+                hash_inputs=self.settings.value("incremental_hash", False, type=bool),
+                autoscale=self.settings.value("batch_autoscale", False, type=bool),
+                archive=archive,
+                archive_split_mb=self.settings.value("batch_archive_split_mb", 0, type=int))
+        except Exception as e:
+            # Cấu hình không hợp lệ (VD: archive + incremental) -> trả lại nút để chạy lại được
+            self.worker = None
+            self.right.btn_start.setEnabled(True)
+            self.right.btn_stop.setEnabled(False)
+            QMessageBox.warning(self, "Không thể bắt đầu batch", str(e))
+            return
         self.worker.progress_signal.connect(lambda c, t, f: self.right.progress_bar.setValue(c) or self.right.progress_bar.setMaximum(t))
-        self.worker.log_signal.connect(self.right.append_log)
+        self.worker.log_batch_signal.connect(self.right.append_log_lines)
         self.worker.finished_signal.connect(self._batch_finished)
         self.worker.start()
 
@@ -335,6 +460,21 @@ class ImageMagickTool(QMainWindow):
         self.right.btn_stop.setText("STOP")
         QMessageBox.information(self, "Xong", "Hoàn tất xử lý!")
 
+    def _trace_path(self) -> Path:
+        return Path(self.settings.value("trace_file", str(CONFIG.trace_file)))
+
+    def _toggle_trace(self, enabled: bool):
+        """Bật/tắt tracing khi đang chạy; tắt thì ghi trace ra file ngay"""
+        self.settings.setValue("trace_enabled", enabled)
+        if enabled:
+            if not TRACER.enabled:
+                TRACER.enable(TRACER.output_path or self._trace_path())
+            self.right.append_log(f"⏺ Bật trace -> {TRACER.output_path}")
+        else:
+            TRACER.disable()
+            TRACER.flush()
+            self.right.append_log(f"⏹ Đã tắt trace, ghi ra {TRACER.output_path}")
+
     def _show_help(self):
         HelpDialog(self).exec()
 
@@ -342,15 +482,28 @@ class ImageMagickTool(QMainWindow):
         # Lưu settings (đã lưu output_dir real-time ở _select_output rồi)
         if self.input_dir and self.input_dir.exists(): 
             self.settings.setValue("last_input_dir", str(self.input_dir))
+        self.settings.setValue("command_usage", json.dumps(COMMAND_INDEX.usage(), ensure_ascii=False))
+        # Gộp log preset vào presets.json -> file luôn đầy đủ khi copy/chia sẻ hoặc mở bằng bản cũ
+        try:
+            self.left.presets.close()
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Không gộp được presets.json: {e}")
         
+        if self.input_archive:
+            self.input_archive.close()
+
         # Shutdown workers
         if self.preview_controller: 
             self.preview_controller.shutdown()
+        self.thumbnailer.shutdown()
         if self.worker and self.worker.isRunning(): 
             self.worker.stop()
             self.worker.terminate()
         if self.file_loader_worker and self.file_loader_worker.isRunning():
+            self.file_loader_worker.stop()
             self.file_loader_worker.quit()
             self.file_loader_worker.wait()
+        for loader in list(self._retired_loaders):
+            loader.wait()
         
         event.accept()
\ No newline at end of file
@@ -1,11 +1,16 @@
 import json
 from pathlib import Path
-from qtpy.QtWidgets import (QWidget, QVBoxLayout, QSplitter, QLabel, QListWidget, 
+from collections import OrderedDict
+from typing import Dict, List
+from qtpy.QtWidgets import (QWidget, QVBoxLayout, QSplitter, QLabel, QListWidget, QListView, QLineEdit,
                              QGridLayout, QMenu, QAction, QInputDialog, QMessageBox, QFileDialog)
-from qtpy.QtCore import Qt, Signal
+from qtpy.QtCore import Qt, Signal, QTimer, QSize, QPoint
+from qtpy.QtGui import QIcon, QImage, QPixmap, QColor
 
 from config import CONFIG
+from core.presets import PresetStore
 from widgets import create_button, create_groupbox
+from workers.metadata_index import ImageMeta, parse_filter
 
 # =============
 # LEFT PANEL
@@ -16,6 +21,7 @@ class LeftPanel(QWidget):
     req_select_output = Signal()
     file_selected = Signal(int)
     preset_applied = Signal(str)
+    req_thumbnails = Signal(list)   # rel_files cần thumbnail, theo thứ tự ưu tiên
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -47,14 +53,60 @@ class LeftPanel(QWidget):
 
     def _create_file_list_group(self):
         group, layout = create_groupbox("Danh sách File")
+        self.btn_grid = create_button("Lưới ảnh", self._toggle_grid, height=26)
+        self.btn_grid.setCheckable(True)
         self.list_files = QListWidget()
+        self.list_files.setUniformItemSizes(True)
+        self.list_files.setTextElideMode(Qt.ElideMiddle)
         self.list_files.currentRowChanged.connect(self.file_selected.emit)
+        self._list_icon_size = self.list_files.iconSize()
+
+        # Lọc theo metadata index (header ảnh), VD: "mp>40 cmyk"
+        self.txt_filter = QLineEdit()
+        self.txt_filter.setPlaceholderText("Lọc: mp>40 cmyk format=png depth=16 animated...")
+        self.txt_filter.setClearButtonEnabled(True)
+        self.txt_filter.textChanged.connect(self._on_filter_changed)
+        self.lbl_filter = QLabel("")
+        self.lbl_filter.setVisible(False)
+        self.metadata: Dict[str, ImageMeta] = {}
+        self._filter = None
+
+        layout.addWidget(self.btn_grid)
+        layout.addWidget(self.txt_filter)
+        layout.addWidget(self.lbl_filter)
         layout.addWidget(self.list_files)
+
+        # Thumbnail: chỉ xin ảnh cho các ô đang hiện + vùng lân cận (gom lại khi cuộn/resize/thêm item)
+        self._thumb_rows = OrderedDict()        # LRU các row đang giữ icon
+        self._thumb_wanted: Dict[str, int] = {} # rel_file đã xin -> row
+        self._thumb_timer = QTimer(self)
+        self._thumb_timer.setSingleShot(True)
+        self._thumb_timer.setInterval(60)
+        self._thumb_timer.timeout.connect(self._request_visible_thumbnails)
+        bar = self.list_files.verticalScrollBar()
+        bar.valueChanged.connect(self._schedule_thumbnails)
+        bar.rangeChanged.connect(self._schedule_thumbnails)
+        model = self.list_files.model()
+        model.rowsInserted.connect(self._schedule_thumbnails)
+        model.rowsInserted.connect(self._filter_inserted_rows)
+        model.modelReset.connect(self._reset_thumbnails)
+        model.rowsRemoved.connect(self._reset_thumbnails)
         return group
 
     def _create_presets_group(self):
         group, layout = create_groupbox("Presets Manager")
+        self.presets = PresetStore()
+        try:
+            self.presets.load()
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Không đọc được {CONFIG.preset_file}: {e}")
+        self.txt_preset_search = QLineEdit()
+        self.txt_preset_search.setPlaceholderText("Tìm preset (tên hoặc lệnh)...")
+        self.txt_preset_search.setClearButtonEnabled(True)
+        self.txt_preset_search.textChanged.connect(self.update_presets_list)
+        layout.addWidget(self.txt_preset_search)
         self.list_presets = QListWidget()
+        self.list_presets.setUniformItemSizes(True)
         self.list_presets.itemDoubleClicked.connect(self._on_preset_dbl_click)
         self.list_presets.setContextMenuPolicy(Qt.CustomContextMenu)
         self.list_presets.customContextMenuRequested.connect(self._show_preset_context_menu)
@@ -73,24 +125,170 @@ class LeftPanel(QWidget):
         self.update_presets_list()
         return group
 
+    # --- Metadata Filter ---
+    def set_metadata(self, metadata: Dict[str, ImageMeta]):
+        """Nhận kết quả index header (FileLoaderWorker) -> áp lại bộ lọc đang nhập"""
+        self.metadata = metadata
+        self._apply_filter()
+
+    def _on_filter_changed(self, text: str):
+        try:
+            self._filter = parse_filter(text) if text.strip() else None
+        except ValueError as e:
+            self._filter = None
+            self.lbl_filter.setText(f"⚠️ {e}")
+            self.lbl_filter.setVisible(True)
+            return
+        self._apply_filter()
+
+    def _matches(self, row: int) -> bool:
+        meta = self.metadata.get(self.list_files.item(row).text())
+        return meta is not None and self._filter(meta)
+
+    def _apply_filter(self):
+        lw = self.list_files
+        count = lw.count()
+        if self._filter is None:
+            for row in range(count):
+                lw.setRowHidden(row, False)
+            self.lbl_filter.setVisible(False)
+            return
+        matched = 0
+        for row in range(count):
+            visible = self._matches(row)
+            lw.setRowHidden(row, not visible)
+            matched += visible
+        pending = "" if self.metadata else " (đang đọc metadata...)"
+        self.lbl_filter.setText(f"{matched}/{count} file khớp{pending}")
+        self.lbl_filter.setVisible(True)
+        self._schedule_thumbnails()
+
+    def _filter_inserted_rows(self, parent, first: int, last: int):
+        """Item được thêm dần theo lô -> lọc luôn các row mới"""
+        if self._filter is not None:
+            for row in range(first, last + 1):
+                self.list_files.setRowHidden(row, not self._matches(row))
+
+    def adjacent_row(self, row: int, step: int) -> int:
+        """Row hiển thị kế tiếp (bỏ qua row bị lọc ẩn), -1 nếu hết"""
+        row += step
+        while 0 <= row < self.list_files.count():
+            if not self.list_files.isRowHidden(row):
+                return row
+            row += step
+        return -1
+
+    # --- Thumbnail Grid ---
+    @property
+    def grid_mode(self) -> bool:
+        return self.list_files.viewMode() == QListView.IconMode
+
+    def _toggle_grid(self, checked: bool):
+        lw = self.list_files
+        if checked:
+            size = CONFIG.thumbnail_size
+            lw.setViewMode(QListView.IconMode)
+            lw.setIconSize(QSize(size, size))
+            lw.setGridSize(QSize(size + 16, size + 32))
+            lw.setResizeMode(QListView.Adjust)
+            lw.setMovement(QListView.Static)
+            lw.setWrapping(True)
+        else:
+            lw.setViewMode(QListView.ListMode)
+            lw.setGridSize(QSize())
+            lw.setIconSize(self._list_icon_size)
+            lw.setWrapping(False)
+            self._clear_icons()
+        if lw.currentItem():
+            lw.scrollToItem(lw.currentItem())
+        self._schedule_thumbnails()
+
+    def _schedule_thumbnails(self, *args):
+        if self.grid_mode:
+            self._thumb_timer.start()
+
+    def _reset_thumbnails(self, *args):
+        """Danh sách bị clear/xóa row -> row cũ không còn đúng"""
+        self._thumb_rows.clear()
+        self._thumb_wanted.clear()
+
+    def _clear_icons(self):
+        count = self.list_files.count()
+        for row in self._thumb_rows:
+            if row < count:
+                self.list_files.item(row).setIcon(QIcon())
+        self._reset_thumbnails()
+        self.req_thumbnails.emit([])
+
+    def _priority_rows(self) -> List[int]:
+        """Row đang hiện (trên -> dưới), rồi 1 màn hình phía dưới, rồi 1 màn hình phía trên"""
+        lw = self.list_files
+        count = lw.count()
+        if not count:
+            return []
+        grid = lw.gridSize()
+        viewport = lw.viewport().rect()
+        cols = max(1, viewport.width() // max(1, grid.width()))
+        page = cols * (viewport.height() // max(1, grid.height()) + 2)
+        first = lw.indexAt(QPoint(grid.width() // 2, grid.height() // 2)).row()
+        if first < 0:
+            # Điểm rơi vào khe giữa các ô -> ước lượng theo vị trí thanh cuộn
+            bar = lw.verticalScrollBar()
+            first = int(count * bar.value() / max(1, bar.maximum() + bar.pageStep()))
+        first -= first % cols
+        visible = range(first, min(count, first + page))
+        below = range(visible.stop, min(count, visible.stop + page))
+        above = range(first - 1, max(-1, first - 1 - page), -1)
+        return [*visible, *below, *above]
+
+    def _request_visible_thumbnails(self):
+        if not self.grid_mode:
+            return
+        wanted = {}
+        for row in self._priority_rows():
+            if self.list_files.isRowHidden(row):
+                continue
+            if row in self._thumb_rows:
+                self._thumb_rows.move_to_end(row)  # Đang hiện -> không bị đẩy ra khỏi LRU
+            else:
+                wanted.setdefault(self.list_files.item(row).text(), row)
+        self._thumb_wanted = wanted
+        self.req_thumbnails.emit(list(wanted))
+
+    def set_thumbnail(self, rel_file: str, image: QImage):
+        """Slot nhận thumbnail từ ThumbnailService (bỏ qua nếu đã cuộn đi/đổi danh sách)"""
+        lw = self.list_files
+        row = self._thumb_wanted.pop(rel_file, None)
+        if row is None or not self.grid_mode or row >= lw.count() or lw.item(row).text() != rel_file:
+            return
+        lw.item(row).setIcon(QIcon(QPixmap.fromImage(image)))
+        self._thumb_rows[row] = None
+        # Giới hạn số icon trong RAM: giải phóng icon dùng lâu nhất (đã cuộn ra xa)
+        while len(self._thumb_rows) > CONFIG.thumbnail_memory_items:
+            old_row, _ = self._thumb_rows.popitem(last=False)
+            if old_row < lw.count():
+                lw.item(old_row).setIcon(QIcon())
+
     # --- Preset Logic ---
-    def update_presets_list(self):
+    def update_presets_list(self, *args):
+        """Dựng lại danh sách theo ô tìm kiếm (đọc lại file chỉ khi bị sửa từ bên ngoài)"""
+        try:
+            self.presets.refresh()
+        except (OSError, ValueError):
+            pass  # Giữ bản trong RAM
         self.list_presets.clear()
-        if CONFIG.preset_file.exists():
-            try:
-                with open(CONFIG.preset_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for k in sorted(data.keys()):
-                        self.list_presets.addItem(k)
-            except: pass
+        for name in self.presets.search(self.txt_preset_search.text()):
+            self.list_presets.addItem(name)
+            item = self.list_presets.item(self.list_presets.count() - 1)
+            plan = self.presets.compiled(name)
+            item.setToolTip(plan.command_string + (f"\n⚠️ {plan.problem}" if not plan.valid else ""))
+            if not plan.valid:
+                item.setForeground(QColor("#E65100"))
 
     def _on_preset_dbl_click(self, item):
-        preset_name = item.text()
-        if CONFIG.preset_file.exists():
-            with open(CONFIG.preset_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if preset_name in data:
-                    self.preset_applied.emit(data[preset_name])
+        command = self.presets.get(item.text())
+        if command is not None:
+            self.preset_applied.emit(command)
 
     def _save_preset_dialog(self):
         cmd = self.get_current_command_callback()
@@ -99,51 +297,47 @@ class LeftPanel(QWidget):
             return
         name, ok = QInputDialog.getText(self, "Save Preset", "Tên Preset:")
         if ok and name:
-            data = {}
-            if CONFIG.preset_file.exists():
-                with open(CONFIG.preset_file, 'r', encoding='utf-8') as f:
-                    try: data = json.load(f)
-                    except: pass
-            data[name] = cmd
-            with open(CONFIG.preset_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            self.update_presets_list()
+            self._write_presets(self.presets.set, name, cmd)
 
     def _delete_preset(self):
         item = self.list_presets.currentItem()
         if not item: return
         reply = QMessageBox.question(self, 'Xóa', f"Xóa preset '{item.text()}'?", QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
-            with open(CONFIG.preset_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            if item.text() in data:
-                del data[item.text()]
-                with open(CONFIG.preset_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                self.update_presets_list()
+            self._write_presets(self.presets.delete, item.text())
+
+    def _write_presets(self, action, *args) -> bool:
+        """Gọi 1 thao tác ghi của PresetStore, báo lỗi ghi file, rồi cập nhật danh sách"""
+        try:
+            action(*args)
+        except OSError as e:
+            QMessageBox.warning(self, "Lỗi", f"Không ghi được preset: {e}")
+            return False
+        finally:
+            self.update_presets_list()
+        return True
 
     def _import_presets(self):
         path, _ = QFileDialog.getOpenFileName(self, "Import Presets", "", "JSON (*.json)")
         if not path: return
         try:
             with open(path, 'r', encoding='utf-8') as f: new_data = json.load(f)
-            current_data = {}
-            if CONFIG.preset_file.exists():
-                with open(CONFIG.preset_file, 'r', encoding='utf-8') as f: current_data = json.load(f)
-            current_data.update(new_data)
-            with open(CONFIG.preset_file, 'w', encoding='utf-8') as f:
-                json.dump(current_data, f, ensure_ascii=False, indent=2)
-            self.update_presets_list()
-            QMessageBox.information(self, "OK", "Import thành công!")
-        except Exception as e:
+            if not isinstance(new_data, dict):
+                raise ValueError("File preset phải là JSON dạng {tên: lệnh}")
+        except (OSError, ValueError) as e:
             QMessageBox.warning(self, "Lỗi", str(e))
+            return
+        if self._write_presets(self.presets.update, new_data):
+            QMessageBox.information(self, "OK", f"Import thành công {len(new_data)} preset!")
 
     def _export_presets(self):
-        if not CONFIG.preset_file.exists(): return
+        if not len(self.presets): return
         path, _ = QFileDialog.getSaveFileName(self, "Export", "presets_backup.json", "JSON (*.json)")
         if path:
-            with open(CONFIG.preset_file, 'r', encoding='utf-8') as f: content = f.read()
-            with open(path, 'w', encoding='utf-8') as f: f.write(content)
+            try:
+                self.presets.export(Path(path))
+            except OSError as e:
+                QMessageBox.warning(self, "Lỗi", str(e))
 
     def _show_preset_context_menu(self, pos):
         item = self.list_presets.itemAt(pos)
@@ -158,10 +352,4 @@ class LeftPanel(QWidget):
         old_name = item.text()
         new_name, ok = QInputDialog.getText(self, "Rename", "Tên mới:", text=old_name)
         if ok and new_name and new_name != old_name:
-            with open(CONFIG.preset_file, 'r', encoding='utf-8') as f: data = json.load(f)
-            if old_name in data:
-                data[new_name] = data[old_name]
-                del data[old_name]
-                with open(CONFIG.preset_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                self.update_presets_list()
\ No newline at end of file
+            self._write_presets(self.presets.rename, old_name, new_name)
@@ -1,5 +1,6 @@
 from qtpy.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel)
-from qtpy.QtCore import Qt, Signal
+from qtpy.QtCore import Qt, Signal, QTimer
+from qtpy.QtGui import QPixmap
 
 from widgets import ImageCanvas, create_button
 
@@ -10,10 +11,19 @@ class MiddlePanel(QWidget):
     req_prev_image = Signal()
     req_next_image = Signal()
     req_refresh_preview = Signal()
+    req_diff_update = Signal()      # Vùng đang xem đổi (pan/zoom) khi bật Diff
+    DIFF_DEBOUNCE_MS = 80
 
     def __init__(self, parent=None):
         super().__init__(parent)
         self.split_view_enabled = False
+        self.diff_enabled = False
+        self.diff_generation = None     # DiffSession của heatmap đang hiện ở panel trái (None = chưa có)
+        # Pan/zoom liên tục -> chỉ tính diff khi dừng lại ~80 ms
+        self._diff_timer = QTimer(self)
+        self._diff_timer.setSingleShot(True)
+        self._diff_timer.setInterval(self.DIFF_DEBOUNCE_MS)
+        self._diff_timer.timeout.connect(self.req_diff_update.emit)
         self._init_ui()
 
     def _init_ui(self):
@@ -42,6 +52,16 @@ class MiddlePanel(QWidget):
             "Split View: OFF", self._toggle_split_view,
             "background-color: #607D8B; color: white; font-weight: bold;", 35
         )
+        self.btn_diff = create_button(
+            "Diff: OFF", self._toggle_diff,
+            "background-color: #607D8B; color: white; font-weight: bold;", 35
+        )
+        self.btn_diff.setToolTip("Panel trái hiện heatmap sai khác gốc/preview + PSNR/SSIM của vùng đang xem")
+
+        self.lbl_metrics = QLabel("")
+        self.lbl_metrics.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.lbl_metrics.setStyleSheet("font-family: Consolas, monospace; color: #E65100;")
+        self.lbl_metrics.hide()
         
         self.lbl_info = QLabel("No Image")
         self.lbl_info.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -50,9 +70,11 @@ class MiddlePanel(QWidget):
         nav_layout.addWidget(self.btn_prev)
         nav_layout.addWidget(self.lbl_info, 1)
         nav_layout.addWidget(self.btn_toggle_split)
+        nav_layout.addWidget(self.btn_diff)
         nav_layout.addWidget(self.btn_next)
         
         layout.addWidget(self.preview_container)
+        layout.addWidget(self.lbl_metrics)
         layout.addLayout(nav_layout)
 
     def _toggle_split_view(self):
@@ -68,12 +90,69 @@ class MiddlePanel(QWidget):
             self.btn_toggle_split.setStyleSheet("background-color: #607D8B; color: white; font-weight: bold;")
             self.image_canvas_left.hide()
             self.image_canvas.reset_view_flag = True
+            if self.diff_enabled:
+                self._set_diff(False)
         
         self.req_refresh_preview.emit()
 
+    # === DIFF MODE ===
+    def _toggle_diff(self):
+        self._set_diff(not self.diff_enabled)
+        if self.diff_enabled and not self.split_view_enabled:
+            self._toggle_split_view()  # Heatmap hiện ở panel trái (đã emit refresh)
+        else:
+            self.req_refresh_preview.emit()
+
+    def _set_diff(self, enabled: bool):
+        self.diff_enabled = enabled
+        self.diff_generation = None
+        self._diff_timer.stop()
+        if enabled:
+            self.btn_diff.setText("Diff: ON")
+            self.btn_diff.setStyleSheet("background-color: #E65100; color: white; font-weight: bold;")
+            self.lbl_metrics.setText("Đang tính sai khác...")
+            self.lbl_metrics.show()
+        else:
+            self.btn_diff.setText("Diff: OFF")
+            self.btn_diff.setStyleSheet("background-color: #607D8B; color: white; font-weight: bold;")
+            self.lbl_metrics.hide()
+
+    def visible_region(self):
+        """Vùng ảnh preview đang thấy ở panel phải (x, y, w, h theo pixel preview)"""
+        canvas = self.image_canvas
+        rect = canvas.mapToScene(canvas.viewport().rect()).boundingRect()
+        return rect.x(), rect.y(), rect.width(), rect.height()
+
+    def set_diff_result(self, result):
+        """Nhận DiffResult từ Diff Worker: chỉ vẽ thêm phần heatmap vừa tính vào pixmap đang hiện"""
+        if not self.diff_enabled:
+            return
+        canvas = self.image_canvas_left
+        if result.generation != self.diff_generation:
+            # Session mới (ảnh gốc/preview đổi) -> 1 pixmap đen đủ kích thước, sau đó chỉ vẽ thêm patch
+            pixmap = QPixmap(*result.size)
+            pixmap.fill(Qt.GlobalColor.black)
+            canvas.set_image(pixmap, reset_view=canvas.reset_view_flag)
+            canvas.reset_view_flag = False
+            self.diff_generation = result.generation
+        if result.patch is not None:
+            canvas.update_image_region(result.patch, *result.origin)
+        metrics = result.metrics
+        if metrics is None:
+            return
+        psnr = "∞" if metrics.psnr == float('inf') else f"{metrics.psnr:.2f} dB"
+        x, y, w, h = metrics.region
+        self.lbl_metrics.setText(
+            f"PSNR {psnr} | SSIM {metrics.ssim:.4f} | Δ̄ {metrics.mean_abs:.2f} | Δmax {metrics.max_abs}"
+            f"  (vùng đang xem {w}x{h} @ {x},{y})")
+
     def _sync_from_left(self, state):
         self.image_canvas.apply_sync_state(state)
+        if self.diff_enabled:
+            self._diff_timer.start()
     
     def _sync_from_right(self, state):
         if self.split_view_enabled:
-            self.image_canvas_left.apply_sync_state(state)
\ No newline at end of file
+            self.image_canvas_left.apply_sync_state(state)
+        if self.diff_enabled:
+            self._diff_timer.start()
\ No newline at end of file
@@ -1,8 +1,8 @@
-from qtpy.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QSplitter, 
-                             QProgressBar, QTextEdit)
+from qtpy.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QSplitter, QLabel,
+                             QProgressBar, QListView, QAbstractItemView)
 from qtpy.QtCore import Qt, Signal
 
-from widgets import SmartCommandEdit, create_button, create_groupbox
+from widgets import SmartCommandEdit, LogRingModel, HistogramWidget, create_button, create_groupbox
 
 # =============
 # RIGHT PANEL
@@ -11,6 +11,7 @@ class RightPanel(QWidget):
     req_start_batch = Signal()
     req_stop_batch = Signal()
     req_help = Signal()
+    req_toggle_trace = Signal(bool)
     command_changed = Signal()
 
     def __init__(self, parent=None):
@@ -25,8 +26,9 @@ class RightPanel(QWidget):
         splitter = QSplitter(Qt.Orientation.Vertical)
         splitter.addWidget(self._create_batch_group())
         splitter.addWidget(self._create_log_group())
+        splitter.addWidget(self._create_stats_group())
         splitter.addWidget(self._create_command_group())
-        splitter.setSizes([120, 200, 200])
+        splitter.setSizes([120, 200, 160, 200])
         
         layout.addWidget(splitter)
         layout.addLayout(self._create_footer())
@@ -51,12 +53,45 @@ class RightPanel(QWidget):
 
     def _create_log_group(self):
         group, layout = create_groupbox("Progress Log")
-        self.txt_log = QTextEdit()
-        self.txt_log.setReadOnly(True)
-        self.txt_log.setStyleSheet("background-color: #2b2b2b; color: #00ff00; font-family: Consolas;")
-        layout.addWidget(self.txt_log)
+        self.log_model = LogRingModel(parent=self)
+        self.log_view = QListView()
+        self.log_view.setModel(self.log_model)
+        self.log_view.setUniformItemSizes(True)  # Không cần đo từng dòng -> cuộn nhanh với nhiều dòng
+        self.log_view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.log_view.setStyleSheet("background-color: #2b2b2b; color: #00ff00; font-family: Consolas;")
+        layout.addWidget(self.log_view)
         return group
 
+    def _create_stats_group(self):
+        group, layout = create_groupbox("Histogram (Gốc / Preview)")
+        layout.setSpacing(2)
+        self.hist_original = HistogramWidget()
+        self.hist_preview = HistogramWidget()
+        self.lbl_stats = QLabel("")
+        self.lbl_stats.setStyleSheet("font-family: Consolas; font-size: 11px;")
+        self.lbl_stats.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        for w in [self.hist_original, self.hist_preview, self.lbl_stats]:
+            layout.addWidget(w)
+        self._stats = {"Gốc": None, "Preview": None}
+        return group
+
+    def set_stats(self, which: str, stats):
+        """which: 'original' | 'preview' (stats = PixelStats hoặc None)"""
+        if which == "original":
+            self.hist_original.set_stats(stats)
+            self._stats["Gốc"] = stats
+        else:
+            self.hist_preview.set_stats(stats)
+            self._stats["Preview"] = stats
+        lines = []
+        for name, st in self._stats.items():
+            if st is None:
+                continue
+            lines.append(f"{name}:")
+            for ch, mean, std, low, high in zip("RGBL", st.mean, st.std, st.clip_low, st.clip_high):
+                lines.append(f"  {ch} μ={mean:6.1f} σ={std:5.1f}  clip {low:4.1f}% / {high:4.1f}%")
+        self.lbl_stats.setText("\n".join(lines))
+
     def _create_command_group(self):
         group, layout = create_groupbox("Command Input")
         self.txt_command = SmartCommandEdit()
@@ -69,10 +104,24 @@ class RightPanel(QWidget):
         footer = QHBoxLayout()
         self.btn_help = create_button("Hướng dẫn", self.req_help.emit, "background-color: #008CBA; color: white; font-weight: bold;", 40)
         self.btn_clear = create_button("Clear Command", lambda: self.txt_command.clear(), "background-color: #ff5722; color: white; font-weight: bold;", 40)
+        self.btn_trace = create_button("⏺ Trace", self.req_toggle_trace.emit, "", 40)
+        self.btn_trace.setCheckable(True)
+        self.btn_trace.setToolTip("Ghi thời gian pipeline ra file Chrome Trace (mở bằng chrome://tracing hoặc Perfetto)")
         footer.addWidget(self.btn_help)
         footer.addWidget(self.btn_clear)
+        footer.addWidget(self.btn_trace)
         return footer
 
     def append_log(self, msg):
-        self.txt_log.append(msg)
-        self.txt_log.verticalScrollBar().setValue(self.txt_log.verticalScrollBar().maximum())
\ No newline at end of file
+        self.append_log_lines([msg])
+
+    def append_log_lines(self, lines):
+        """Thêm 1 lô dòng log. Chỉ tự cuộn xuống nếu người dùng đang ở cuối log."""
+        scrollbar = self.log_view.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum()
+        self.log_model.append_lines([part for line in lines for part in str(line).split("\n")])
+        if at_bottom:
+            self.log_view.scrollToBottom()
+
+    def clear_log(self):
+        self.log_model.clear()
\ No newline at end of file
@@ -3,6 +3,9 @@
 from .decorators import handle_errors
 from .parsers import SafeParse
 from .environment import auto_setup_dependencies
+from .tracing import TRACER, Tracer
+from .resources import RESOURCES, ResourceProfile, build_profile
 
 # Export ra ngoài để các module khác sử dụng
-__all__ = ['handle_errors', 'SafeParse', 'auto_setup_dependencies']
\ No newline at end of file
+__all__ = ['handle_errors', 'SafeParse', 'auto_setup_dependencies', 'TRACER', 'Tracer',
+           'RESOURCES', 'ResourceProfile', 'build_profile']
\ No newline at end of file
@@ -71,7 +71,8 @@ def _check_dependencies():
     REQUIRED = [
         ("PySide6", "PySide6"),
         ("qtpy", "QtPy"),
-        ("wand", "Wand")
+        ("wand", "Wand"),
+        ("numpy", "numpy")
     ]
     
     missing = []
@@ -0,0 +1,175 @@
+# utils/resources.py
+import os
+import ctypes
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional
+
+# ========================================================
+# IMAGEMAGICK RESOURCE LIMITS (thread / memory / map / area / disk)
+# ========================================================
+# Lưu ý: giới hạn tài nguyên của ImageMagick là toàn cục theo PROCESS (MagickCore),
+# không thể đặt riêng cho từng thread:
+# - CLI (batch/watch/ab/benchmark): engine áp profile của batch trong lúc chạy (using())
+# - GUI: profile preview là profile nền (pin() lúc khởi động). Batch trong GUI vẫn áp profile
+#   của nó trong lúc chạy (using()), xong thì trả về profile nền -> batch không bị giới hạn preview
+# - using() lồng nhau / chạy song song (batch + A/B...): profile vào sau cùng có hiệu lực,
+#   thoát ra thì áp lại profile còn đang chạy (không khôi phục snapshot cũ đè lên batch khác)
+RESOURCE_TYPES = ('thread', 'memory', 'map', 'area', 'disk')
+
+GIB = 1024 ** 3
+
+
+class _MemoryStatusEx(ctypes.Structure):
+    """MEMORYSTATUSEX của Win32 (GlobalMemoryStatusEx)"""
+    _fields_ = [
+        ('dwLength', ctypes.c_ulong),
+        ('dwMemoryLoad', ctypes.c_ulong),
+        ('ullTotalPhys', ctypes.c_ulonglong),
+        ('ullAvailPhys', ctypes.c_ulonglong),
+        ('ullTotalPageFile', ctypes.c_ulonglong),
+        ('ullAvailPageFile', ctypes.c_ulonglong),
+        ('ullTotalVirtual', ctypes.c_ulonglong),
+        ('ullAvailVirtual', ctypes.c_ulonglong),
+        ('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+    ]
+
+
+def _windows_physical_memory() -> int:
+    status = _MemoryStatusEx()
+    status.dwLength = ctypes.sizeof(_MemoryStatusEx)
+    if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+        return 0
+    return int(status.ullTotalPhys)
+
+
+def physical_memory() -> int:
+    """Tổng RAM vật lý (bytes): sysconf (Linux/macOS), GlobalMemoryStatusEx (Windows); 0 nếu không đọc được"""
+    try:
+        if os.name == 'nt':
+            return _windows_physical_memory()
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+class ResourceProfile(NamedTuple):
+    """
+    Giới hạn áp cho ImageMagick + số worker batch gợi ý.
+    None = giữ nguyên giá trị mặc định của ImageMagick.
+    memory/map/disk: bytes. area: số pixel tối đa của 1 ảnh giữ trong RAM (lớn hơn -> pixel cache ra disk).
+    """
+    name: str
+    thread: Optional[int] = None
+    memory: Optional[int] = None
+    map: Optional[int] = None
+    area: Optional[int] = None
+    disk: Optional[int] = None
+    workers: Optional[int] = None
+
+
+def build_profile(name: str, cpu_count: Optional[int] = None, ram_bytes: Optional[int] = None) -> ResourceProfile:
+    """
+    Các profile có sẵn:
+    - preview:    ít thread (chừa CPU cho UI và batch), RAM vừa phải
+    - throughput: 1 thread IM x N worker (mỗi file 1 core, không tranh chấp OpenMP)
+    - latency:    N thread IM x 1 worker (từng file xong nhanh nhất)
+    - default:    không đặt gì (hành vi cũ)
+    """
+    cpus = max(1, cpu_count or os.cpu_count() or 1)
+    ram = ram_bytes if ram_bytes is not None else physical_memory()
+    # Không đọc được RAM -> giả định 8GB
+    ram = ram or 8 * GIB
+
+    if name == 'preview':
+        return ResourceProfile(name, thread=max(1, cpus // 2), memory=min(2 * GIB, ram // 4),
+                               map=min(4 * GIB, ram // 2), area=256_000_000, workers=None)
+    if name == 'throughput':
+        return ResourceProfile(name, thread=1, memory=ram // 2, map=ram, area=None, workers=cpus)
+    if name == 'latency':
+        return ResourceProfile(name, thread=cpus, memory=ram // 2, map=ram, area=None, workers=1)
+    if name == 'default':
+        return ResourceProfile(name)
+    raise ValueError(f"Profile không tồn tại: '{name}' (preview, throughput, latency, default)")
+
+
+PROFILE_NAMES = ('preview', 'throughput', 'latency', 'default')
+
+
+class ResourceManager:
+    """Đọc/ghi wand.resource.limits, hỗ trợ đổi profile tạm thời (context manager)"""
+    def __init__(self):
+        self.active: Optional[str] = None
+        self.base: Optional[str] = None        # Profile nền đã pin() (GUI: preview)
+        self._stack: List[ResourceProfile] = []  # Các using() đang chạy, theo thứ tự vào
+        self._idle = None                        # (snapshot, tên) khi không có using() nào
+        self._defaults: Optional[Dict[str, int]] = None  # Giá trị mặc định của ImageMagick (trước lần đổi đầu tiên)
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _limits():
+        from wand.resource import limits
+        return limits
+
+    def snapshot(self) -> Dict[str, int]:
+        """Giá trị hiện tại của các giới hạn"""
+        limits = self._limits()
+        return {r: int(limits.get_resource_limit(r)) for r in RESOURCE_TYPES}
+
+    def apply(self, profile: ResourceProfile) -> Dict[str, int]:
+        """Áp profile. Returns: snapshot trước khi đổi (để khôi phục)"""
+        with self._lock:
+            previous = self.snapshot()
+            if self._defaults is None:
+                self._defaults = previous
+            limits = self._limits()
+            for resource in RESOURCE_TYPES:
+                # None = mặc định của ImageMagick (không kế thừa giới hạn của profile nền, VD area của preview)
+                value = getattr(profile, resource)
+                limits.set_resource_limit(resource, int(value if value is not None else self._defaults[resource]))
+            self.active = profile.name
+            return previous
+
+    def restore(self, snapshot: Dict[str, int], name: Optional[str] = None):
+        with self._lock:
+            limits = self._limits()
+            for resource, value in snapshot.items():
+                limits.set_resource_limit(resource, value)
+            self.active = name
+
+    def pin(self, profile: ResourceProfile):
+        """Đặt profile nền cho cả process (GUI). using() áp đè tạm thời rồi trả về profile này."""
+        with self._lock:
+            self.apply(profile)
+            self.base = profile.name
+
+    @contextmanager
+    def using(self, profile: ResourceProfile):
+        """with RESOURCES.using(build_profile('throughput')): ... -> tự trả lại giới hạn cũ"""
+        with self._lock:
+            previous_name = self.active
+            previous = self.apply(profile)
+            if not self._stack:
+                self._idle = (previous, previous_name)
+            self._stack.append(profile)
+        try:
+            yield profile
+        finally:
+            with self._lock:
+                self._stack.remove(profile)
+                if self._stack:
+                    self.apply(self._stack[-1])
+                else:
+                    self.restore(*self._idle)
+
+    def describe(self) -> str:
+        """Chuỗi ngắn gọn cho log. VD: thread=1 memory=4.0GB ..."""
+        def fmt(resource, value):
+            if resource in ('memory', 'map', 'disk'):
+                return f"{resource}={value / GIB:.1f}GB" if value < 2 ** 62 else f"{resource}=∞"
+            return f"{resource}={value}"
+        return " ".join(fmt(r, v) for r, v in self.snapshot().items())
+
+
+# Instance dùng chung toàn ứng dụng
+RESOURCES = ResourceManager()
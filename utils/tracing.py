@@ -0,0 +1,139 @@
+# utils/tracing.py
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from pathlib import Path
+from typing import Optional
+
+# ========================================================
+# TRACING (Chrome Trace / Perfetto)
+# ========================================================
+class _NullSpan:
+    """Span rỗng dùng khi tắt tracing - không làm gì cả"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Span thật: đo thời gian từ __enter__ đến __exit__"""
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start_ns')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start_ns = 0
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.start_ns, cat=self.cat, **self.args)
+        return False
+
+
+class Tracer:
+    """
+    Ghi lại các span (begin/end) của pipeline ra file JSON theo chuẩn Chrome Trace.
+    Mở file bằng chrome://tracing hoặc https://ui.perfetto.dev.
+    Khi tắt: span() chỉ kiểm tra 1 cờ bool và trả về span rỗng dùng chung.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.output_path: Optional[Path] = None
+        self._events = []
+        self._thread_names = {}
+        self._lock = threading.Lock()
+        self._origin_ns = time.perf_counter_ns()
+        self._pid = os.getpid()
+        self._atexit_registered = False
+
+    def enable(self, output_path: Path):
+        """Bật tracing, file sẽ được ghi khi thoát chương trình (hoặc gọi flush)"""
+        self.output_path = Path(output_path)
+        self.enabled = True
+        if not self._atexit_registered:
+            atexit.register(self.flush)
+            self._atexit_registered = True
+
+    def disable(self):
+        self.enabled = False
+
+    @staticmethod
+    def now() -> int:
+        """Mốc thời gian (ns) dùng cho các span đo xuyên thread (queue wait, signal)"""
+        return time.perf_counter_ns()
+
+    def span(self, name: str, cat: str = "pipeline", **args):
+        """Context manager đo 1 đoạn code. VD: with TRACER.span("decode"): ..."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    def complete(self, name: str, start_ns: int, end_ns: int = None, cat: str = "pipeline", **args):
+        """Ghi 1 span đã biết thời điểm bắt đầu (VD: bắt đầu ở thread khác)"""
+        if not self.enabled or not start_ns:
+            return
+        if end_ns is None:
+            end_ns = time.perf_counter_ns()
+
+        tid = threading.get_ident()
+        if tid not in self._thread_names:
+            self.name_thread(threading.current_thread().name)
+
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": (start_ns - self._origin_ns) / 1000.0,
+            "dur": max(0, end_ns - start_ns) / 1000.0,
+            "pid": self._pid,
+            "tid": tid,
+        }
+        if args:
+            event["args"] = {k: str(v) for k, v in args.items()}
+        # list.append là thao tác atomic -> không cần lock ở đường nóng
+        self._events.append(event)
+
+    def name_thread(self, name: str):
+        """Đặt tên cho thread hiện tại trong trace (QThread mặc định tên 'Dummy-N')"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._thread_names[threading.get_ident()] = name
+
+    def flush(self):
+        """Ghi toàn bộ event ra file JSON"""
+        if not self.output_path or not self._events:
+            return
+        with self._lock:
+            metadata = [
+                {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+                for tid, name in self._thread_names.items()
+            ]
+            events = metadata + list(self._events)
+        try:
+            temp_path = self.output_path.with_suffix(self.output_path.suffix + '.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+            os.replace(temp_path, self.output_path)
+            print(f"[+] Đã ghi trace: {self.output_path} ({len(events)} events)", file=sys.stderr)
+        except Exception as e:
+            print(f"[!] Không thể ghi trace: {e}", file=sys.stderr)
+
+
+# Instance dùng chung toàn ứng dụng
+TRACER = Tracer()
@@ -1,12 +1,17 @@
 # widgets.py
 
 import re
-from typing import Callable, Tuple
-from qtpy.QtWidgets import QPushButton, QGroupBox, QVBoxLayout, QPlainTextEdit, QCompleter, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QFrame
-from qtpy.QtCore import Qt
-from qtpy.QtGui import QColor, QTextCharFormat, QFont, QSyntaxHighlighter, QKeyEvent, QTextCursor, QPainter
+import math
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+from qtpy.QtWidgets import (QPushButton, QGroupBox, QVBoxLayout, QPlainTextEdit, QCompleter, QGraphicsView,
+                            QGraphicsScene, QGraphicsItem, QStyleOptionGraphicsItem, QFrame, QWidget, QToolTip)
+from qtpy.QtCore import Qt, QAbstractListModel, QModelIndex, QRectF, QTimer, QPointF, QStringListModel
+from qtpy.QtGui import (QColor, QTextCharFormat, QFont, QSyntaxHighlighter, QKeyEvent, QTextCursor, QPainter,
+                        QPixmap, QPolygonF, QTextBlockUserData)
 
 from config import CONFIG
+from core.completion import COMMAND_INDEX
 
 
 # ==================
@@ -29,13 +34,78 @@ def create_groupbox(title: str, layout_type=QVBoxLayout) -> Tuple[QGroupBox, QVB
     group.setLayout(layout)
     return group, layout
 
+class LogRingModel(QAbstractListModel):
+    """
+    Model log dạng vòng (deque có giới hạn): chỉ giữ `capacity` dòng cuối.
+    Thêm theo lô (append_lines) -> 1 lần beginInsertRows cho cả lô thay vì từng dòng.
+    """
+    def __init__(self, capacity: int = CONFIG.log_view_lines, parent=None):
+        super().__init__(parent)
+        self.capacity = max(1, capacity)
+        self._lines = deque()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._lines)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and 0 <= index.row() < len(self._lines):
+            return self._lines[index.row()]
+        return None
+
+    def append_lines(self, lines: List[str]):
+        if not lines:
+            return
+        lines = lines[-self.capacity:]
+        # Bỏ các dòng cũ nhất nếu vượt sức chứa
+        overflow = len(self._lines) + len(lines) - self.capacity
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow):
+                self._lines.popleft()
+            self.endRemoveRows()
+        first = len(self._lines)
+        self.beginInsertRows(QModelIndex(), first, first + len(lines) - 1)
+        self._lines.extend(lines)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._lines.clear()
+        self.endResetModel()
+
+def _common_length(same: Callable[[int], bool], limit: int) -> int:
+    """n lớn nhất (<= limit) mà same(n) đúng - chia đôi, mỗi lần so 1 slice (memcmp trong C)"""
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if same(mid):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class _BlockTokens(QTextBlockUserData):
+    """Cache của 1 block: text lần highlight trước + các span (start, length, style)"""
+    def __init__(self, text: str, spans: List[Tuple[int, int, str]]):
+        super().__init__()
+        self.text = text
+        self.spans = spans
+
+
 class CommandSyntaxHighlighter(QSyntaxHighlighter):
+    """
+    Highlight lệnh/số theo từng token (cách nhau bởi khoảng trắng), tăng dần:
+    - Mỗi block giữ span của lần trước (QTextBlockUserData); khi sửa chỉ tokenize lại
+      đoạn từ token đầu tới token cuối bị thay đổi, span phía sau được dời theo độ lệch.
+    - Kết quả phân loại từng token được cache (token lặp lại như -resize, 50% không chạy lại regex)
+      -> chuỗi lệnh script dài hàng nghìn ký tự trên 1 dòng vẫn gõ mượt.
+    """
+    TOKEN_CACHE_SIZE = 4096
+
     def __init__(self, parent=None):
         super().__init__(parent)
         
-        # ✅ FIX: Chuẩn hóa valid_commands - loại bỏ '-' và lowercase
-        self.valid_commands = {cmd.lstrip('-').lower() for cmd in CONFIG.commands}
-        
         # Style definitions
         self.styles = {
             'VALID': self._fmt("#4CAF50", bold=True),      # Green: Valid command
@@ -43,11 +113,13 @@ class CommandSyntaxHighlighter(QSyntaxHighlighter):
             'NUM':   self._fmt("#9C27B0")                  # Purple: Numbers/Geometry
         }
 
-        # Regex pattern (unchanged)
+        # Regex pattern (áp dụng trong từng token)
         self.pattern = re.compile(r"""
             (?P<CMD>-(?![0-9])[\w-]+) |  # Command group
             (?P<NUM>[+\-]?\d+(?:x\d+)?(?:[+\-]\d+)*\.?\d*%?) # Number group
         """, re.VERBOSE | re.IGNORECASE)
+        self._token_re = re.compile(r"\S+")
+        self._token_cache: Dict[str, Tuple[Tuple[int, int, str], ...]] = {}
 
     def _fmt(self, color, bold=False, wave=False):
         """Helper to create format"""
@@ -60,35 +132,85 @@ class CommandSyntaxHighlighter(QSyntaxHighlighter):
             f.setUnderlineColor(QColor(color))
         return f
 
+    def _classify(self, token: str) -> Tuple[Tuple[int, int, str], ...]:
+        """Các span (offset trong token, length, style) của 1 token - có cache"""
+        spans = self._token_cache.get(token)
+        if spans is None:
+            found = []
+            for match in self.pattern.finditer(token):
+                if match.group('CMD'):
+                    key = 'VALID' if COMMAND_INDEX.is_command(match.group('CMD')) else 'ERROR'
+                else:
+                    key = 'NUM'
+                found.append((match.start(), len(match.group()), key))
+            if len(self._token_cache) >= self.TOKEN_CACHE_SIZE:
+                self._token_cache.clear()
+            spans = self._token_cache[token] = tuple(found)
+        return spans
+
+    def _tokenize(self, text: str, start: int, end: int) -> List[Tuple[int, int, str]]:
+        spans = []
+        for match in self._token_re.finditer(text, start, end):
+            base = match.start()
+            spans.extend((base + offset, length, key) for offset, length, key in self._classify(match.group()))
+        return spans
+
+    def _spans(self, text: str, cached: Optional[_BlockTokens]) -> List[Tuple[int, int, str]]:
+        if cached is None:
+            return self._tokenize(text, 0, len(text))
+        old = cached.text
+        if old == text:
+            return cached.spans
+        # Đoạn bị sửa: bỏ phần đầu + phần cuối giống nhau
+        limit = min(len(old), len(text))
+        head = _common_length(lambda n: old[:n] == text[:n], limit)
+        tail = _common_length(lambda n: old[len(old) - n:] == text[len(text) - n:], limit - head)
+        # Nới ra tới biên token (khoảng trắng) -> token chỉ đổi 1 phần vẫn được phân loại lại
+        start = head
+        while start > 0 and not text[start - 1].isspace():
+            start -= 1
+        end = len(text) - tail
+        while end < len(text) and not text[end].isspace():
+            end += 1
+        delta = len(text) - len(old)
+        old_end = end - delta
+        before = [span for span in cached.spans if span[0] + span[1] <= start]
+        after = [(pos + delta, length, key) for pos, length, key in cached.spans if pos >= old_end]
+        return before + self._tokenize(text, start, end) + after
+
     def highlightBlock(self, text):
         """Highlight syntax with case-insensitive validation"""
-        for match in self.pattern.finditer(text):
-            if match.group('CMD'):
-                # ✅ FIX: Strip '-' and lowercase for comparison
-                cmd_name = match.group('CMD').lstrip('-').lower()
-                
-                # Choose style: VALID or ERROR
-                key = 'VALID' if cmd_name in self.valid_commands else 'ERROR'
-                self.setFormat(match.start(), len(match.group()), self.styles[key])
-                
-            elif match.group('NUM'):
-                self.setFormat(match.start(), len(match.group()), self.styles['NUM'])
+        cached = self.currentBlockUserData()
+        spans = self._spans(text, cached if isinstance(cached, _BlockTokens) else None)
+        self.setCurrentBlockUserData(_BlockTokens(text, spans))
+        styles = self.styles
+        for pos, length, key in spans:
+            self.setFormat(pos, length, styles[key])
 
 
 class SmartCommandEdit(QPlainTextEdit):
-    """Text edit with case-insensitive autocomplete"""
+    """
+    Text edit with case-insensitive autocomplete.
+    Gợi ý lấy từ COMMAND_INDEX (trie): gõ '-re' -> lệnh xếp theo số lần dùng;
+    gõ tham số của lệnh có danh sách giá trị (VD: -colorspace c) -> gợi ý giá trị;
+    đang gõ tham số -> tooltip cú pháp của lệnh.
+    """
+    MAX_SUGGESTIONS = 30
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setPlaceholderText("Nhập lệnh... (Gõ '-' để autocomplete)")
         
-        # ✅ Autocomplete đã case-insensitive (Qt.CaseInsensitive)
-        self.completer = QCompleter(CONFIG.commands, self)
+        # Model do trie điền sẵn (đã lọc + xếp hạng) -> QCompleter không tự lọc lại
+        self.completion_model = QStringListModel(self)
+        self.completer = QCompleter(self.completion_model, self)
         self.completer.setCaseSensitivity(Qt.CaseInsensitive)  # ✅ CRITICAL
         self.completer.setWidget(self)
-        self.completer.setCompletionMode(QCompleter.PopupCompletion)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
         self.completer.activated.connect(self._insert_completion)
+        self._completion_command = None   # Lệnh đang được gợi ý giá trị (None = đang gợi ý lệnh)
+        self._hint_command = None
         
-        # ✅ Use fixed highlighter
         self.highlighter = CommandSyntaxHighlighter(self.document())
     
     def _insert_completion(self, completion):
@@ -112,12 +234,17 @@ class SmartCommandEdit(QPlainTextEdit):
         cursor.insertText(completion + " ")
         
         self.setTextCursor(cursor)
+        if self._completion_command:
+            COMMAND_INDEX.record(self._completion_command, completion)
+        else:
+            COMMAND_INDEX.record(completion)
         
         # ✅ CẢI TIẾN: Đóng popup sau khi chèn
         self.completer.popup().hide()
+        self._show_hint()
     
-    def _get_word_under_cursor(self):
-        """Get the word under cursor position"""
+    def _words_before_cursor(self) -> Tuple[str, str]:
+        """(từ đang gõ, từ liền trước nó) trong block hiện tại"""
         cursor = self.textCursor()
         text = cursor.block().text()
         pos = cursor.positionInBlock()
@@ -125,7 +252,53 @@ class SmartCommandEdit(QPlainTextEdit):
             (i for i in range(pos, -1, -1) if i == 0 or text[i-1] in (' ', '\n', '\t')), 
             0
         )
-        return text[start:pos]
+        previous = text[:start].split()
+        return text[start:pos], previous[-1] if previous else ""
+
+    def _get_word_under_cursor(self):
+        """Get the word under cursor position"""
+        return self._words_before_cursor()[0]
+
+    def _show_hint(self):
+        """Tooltip cú pháp khi con trỏ đang ở vị trí tham số của 1 lệnh"""
+        word, previous = self._words_before_cursor()
+        command = previous if not word.startswith('-') else None
+        hint = COMMAND_INDEX.hint(command) if command and COMMAND_INDEX.is_command(command) else None
+        if hint is None:
+            if self._hint_command:
+                QToolTip.hideText()
+                self._hint_command = None
+            return
+        if hint.name != self._hint_command:
+            self._hint_command = hint.name
+            text = f"<b>{hint.name}</b> {hint.summary}" + (f"<br>{hint.syntax}" if hint.syntax else "")
+            QToolTip.showText(self.viewport().mapToGlobal(self.cursorRect().bottomLeft()), text, self)
+
+    def _update_completions(self):
+        word, previous = self._words_before_cursor()
+        if word.startswith('-') and len(word) > 1:  # Ít nhất '-x' mới hiện
+            self._completion_command = None
+            suggestions = COMMAND_INDEX.complete_command(word, self.MAX_SUGGESTIONS)
+        elif word and previous and COMMAND_INDEX.is_command(previous):
+            self._completion_command = previous
+            suggestions = COMMAND_INDEX.complete_value(previous, word, self.MAX_SUGGESTIONS)
+        else:
+            suggestions = []
+        # Đã gõ đúng hết 1 gợi ý duy nhất -> không cần popup
+        if len(suggestions) == 1 and suggestions[0].casefold() == word.casefold():
+            suggestions = []
+
+        popup = self.completer.popup()
+        if not suggestions:
+            popup.hide()
+            return
+        self.completion_model.setStringList(suggestions)
+        # Tính toán vị trí hiển thị popup
+        cr = self.cursorRect()
+        cr.setWidth(popup.sizeHintForColumn(0) + popup.verticalScrollBar().sizeHint().width() + 10)
+        self.completer.complete(cr)
+        # ✅ CẢI TIẾN: Tự động chọn item đầu tiên
+        popup.setCurrentIndex(self.completion_model.index(0, 0))
     
     def keyPressEvent(self, event: QKeyEvent):
         # ✅ CẢI TIẾN: Xử lý khi popup đang mở
@@ -137,72 +310,178 @@ class SmartCommandEdit(QPlainTextEdit):
                     self.completer.popup().hide()
                     event.accept()
                     return
-                    
+
                 elif event.key() in (Qt.Key.Key_Enter, Qt.Key_Return, Qt.Key_Tab):
-                    # ENTER/TAB: Chèn lệnh được chọn + khoảng trắng + đóng popup
-                    if self.completer.popup().currentIndex().isValid():
-                        selected_text = self.completer.popup().currentIndex().data()
-                        self._insert_completion(selected_text)
-                    else:
-                        # Nếu không có mục nào được chọn, chọn mục đầu tiên
-                        if self.completer.completionCount() > 0:
-                            self.completer.setCurrentRow(0)
-                            selected_text = self.completer.currentCompletion()
-                            self._insert_completion(selected_text)
-                    
+                    # ENTER/TAB: Chèn gợi ý được chọn (mặc định mục đầu = dùng nhiều nhất)
+                    index = self.completer.popup().currentIndex()
+                    if not index.isValid() and self.completion_model.rowCount() > 0:
+                        index = self.completion_model.index(0, 0)
+                    if index.isValid():
+                        self._insert_completion(index.data())
+
                     event.accept()
                     return
-                    
+
             elif event.key() in (Qt.Key_Up, Qt.Key_Down):
                 # Mũi tên lên/xuống: Di chuyển trong popup
                 event.ignore()
                 return
-        
+
         # ✅ Xử lý phím bình thường
         super().keyPressEvent(event)
-        
-        # ✅ Hiển thị autocomplete khi gõ '-'
-        word = self._get_word_under_cursor()
-        
-        if word.startswith('-') and len(word) > 1:  # Ít nhất '-x' mới hiện
-            self.completer.setCompletionPrefix(word)
-            
-            if self.completer.completionCount() > 0:
-                # Tính toán vị trí hiển thị popup
-                cr = self.cursorRect()
-                cr.setWidth(
-                    self.completer.popup().sizeHintForColumn(0) + 
-                    self.completer.popup().verticalScrollBar().sizeHint().width() + 10
-                )
-                self.completer.complete(cr)
-                
-                # ✅ CẢI TIẾN: Tự động chọn item đầu tiên
-                if not self.completer.popup().currentIndex().isValid():
-                    self.completer.popup().setCurrentIndex(
-                        self.completer.completionModel().index(0, 0)
-                    )
-            else:
-                self.completer.popup().hide()
-        else:
-            # Ẩn popup khi không còn gõ lệnh
-            self.completer.popup().hide()
+
+        # ✅ Gợi ý lệnh khi gõ '-', gợi ý giá trị/cú pháp khi gõ tham số
+        self._update_completions()
+        self._show_hint()
+
+
+class HistogramWidget(QWidget):
+    """
+    Vẽ histogram R/G/B (+ luma) từ PixelStats (tính sẵn ở preview worker, UI chỉ vẽ).
+    Trục dọc chuẩn hóa theo bin cao nhất trong khoảng 1..254 để cột clip (0/255) không đè cả biểu đồ.
+    """
+    COLORS = (QColor(255, 70, 70, 110), QColor(70, 220, 70, 110), QColor(80, 140, 255, 110))
+    LUMA_COLOR = QColor(230, 230, 230)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.stats = None
+        self.setMinimumHeight(60)
+
+    def set_stats(self, stats):
+        self.stats = stats
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(30, 30, 30))
+        if self.stats is None or not self.stats.pixels:
+            return
+        histograms = self.stats.histograms
+        peak = max(1, int(histograms[:, 1:255].max()))
+        w, h = self.width(), self.height()
+
+        def polygon(hist):
+            points = [QPointF(0, h)]
+            for i, count in enumerate(hist.tolist()):
+                points.append(QPointF(i * w / 255, h - min(1.0, count / peak) * h))
+            points.append(QPointF(w, h))
+            return QPolygonF(points)
+
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.setPen(Qt.PenStyle.NoPen)
+        for color, hist in zip(self.COLORS, histograms[:3]):
+            painter.setBrush(color)
+            painter.drawPolygon(polygon(hist))
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        painter.setPen(self.LUMA_COLOR)
+        painter.drawPolyline(polygon(histograms[3]))
+
+
+class PyramidPixmapItem(QGraphicsItem):
+    """
+    Thay QGraphicsPixmapItem cho ảnh lớn (cùng API setPixmap()/pixmap()).
+
+    - Giữ 1 pyramid: level 0 = ảnh gốc, level k = 1/2^k (tạo dần khi cần, mỗi level
+      thu nhỏ từ level trước -> chất lượng tốt, chi phí 1 lần).
+    - paint() chọn level gần nhất >= độ phân giải màn hình (thu nhỏ lúc vẽ luôn < 2 lần)
+      và chỉ vẽ phần bị lộ (exposedRect), căn theo lưới pixel của level đó.
+    -> Pan/zoom ảnh 50 MP không phải smooth-scale cả ảnh gốc mỗi khung hình.
+    """
+    MIN_LEVEL_SIZE = 256  # Không tạo level nhỏ hơn kích thước này
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pixmap = QPixmap()
+        self._levels: List[QPixmap] = []
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)  # Cần exposedRect
+
+    def setPixmap(self, pixmap: QPixmap):
+        self.prepareGeometryChange()
+        self._pixmap = QPixmap(pixmap)
+        self._levels = [self._pixmap]
+        self.update()
+
+    def pixmap(self) -> QPixmap:
+        return self._pixmap
+
+    def update_region(self, image, x: int, y: int):
+        """Vẽ đè image tại (x, y) lên ảnh gốc + các level đã tạo, chỉ repaint vùng đó"""
+        if self._pixmap.isNull():
+            return
+        w, h = image.width(), image.height()
+        for level in self._levels:  # level 0 chính là self._pixmap
+            fx = level.width() / self._pixmap.width()
+            fy = level.height() / self._pixmap.height()
+            painter = QPainter(level)
+            painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+            painter.drawImage(QRectF(x * fx, y * fy, w * fx, h * fy), image)
+            painter.end()
+        self.update(QRectF(x, y, w, h))
+
+    def boundingRect(self) -> QRectF:
+        return QRectF(0, 0, self._pixmap.width(), self._pixmap.height())
+
+    def _level(self, k: int) -> QPixmap:
+        """Level k (hoặc level nhỏ nhất cho phép nếu k quá lớn)"""
+        while len(self._levels) <= k:
+            last = self._levels[-1]
+            if min(last.width(), last.height()) // 2 < self.MIN_LEVEL_SIZE:
+                break
+            self._levels.append(last.scaled(last.width() // 2, last.height() // 2,
+                                            Qt.AspectRatioMode.IgnoreAspectRatio,
+                                            Qt.TransformationMode.SmoothTransformation))
+        return self._levels[min(k, len(self._levels) - 1)]
+
+    def paint(self, painter, option, widget=None):
+        if self._pixmap.isNull():
+            return
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        if exposed.isEmpty():
+            return
+        scale = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        level = self._level(int(math.floor(math.log2(1 / scale))) if 0 < scale < 1 else 0)
+
+        # Căn vùng cần vẽ ra ngoài theo pixel của level (tránh lệch nửa pixel giữa các lần vẽ)
+        fx = level.width() / self._pixmap.width()
+        fy = level.height() / self._pixmap.height()
+        left, top = math.floor(exposed.left() * fx), math.floor(exposed.top() * fy)
+        right = min(level.width(), math.ceil(exposed.right() * fx))
+        bottom = min(level.height(), math.ceil(exposed.bottom() * fy))
+        source = QRectF(left, top, right - left, bottom - top)
+        target = QRectF(left / fx, top / fy, (right - left) / fx, (bottom - top) / fy)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing, False)  # Antialias mép pixmap gây viền mờ khi pan
+        painter.drawPixmap(target, level, source)
+        painter.restore()
+
 
 class ImageCanvas(QGraphicsView):
     """
     Canvas cải tiến với thuật toán Sync dựa trên Viewport Center & Absolute Scale.
     Đã FIX lỗi RecursionError (lặp vô tận).
+    Sync được gom lại: mỗi khung hình (~16 ms) gửi tối đa 1 trạng thái (trạng thái mới nhất).
     """
+    SYNC_INTERVAL_MS = 16
+
     def __init__(self, parent=None, sync_callback=None):
         super().__init__(parent)
         self.scene = QGraphicsScene(self)
         self.setScene(self.scene)
-        self.pixmap_item = QGraphicsPixmapItem()
+        self.pixmap_item = PyramidPixmapItem()
         self.scene.addItem(self.pixmap_item)
         
         self.sync_callback = sync_callback
         self.is_syncing = False # Cờ chặn loop vô tận
         self.reset_view_flag = False
 
+        # Gom các lần cuộn/zoom trong 1 khung hình thành 1 lần sync
+        self._sync_timer = QTimer(self)
+        self._sync_timer.setSingleShot(True)
+        self._sync_timer.setInterval(self.SYNC_INTERVAL_MS)
+        self._sync_timer.timeout.connect(self._flush_view_state)
+
         self.min_scale = 0.01   # Zoom out tối đa 1%
         self.max_scale = 50.0   # Zoom in tối đa 5000%
         self.zoom_factor = 1.15 # Tốc độ zoom (mượt hơn 1.2)
@@ -237,6 +516,10 @@ class ImageCanvas(QGraphicsView):
         if reset_view:
             self._broadcast_view_state()
 
+    def update_image_region(self, image, x: int, y: int):
+        """Cập nhật 1 vùng của ảnh đang hiện (không dựng lại pyramid, không đổi view)"""
+        self.pixmap_item.update_region(image, x, y)
+
     def wheelEvent(self, event):
         if self.is_syncing:
             return
@@ -275,6 +558,11 @@ class ImageCanvas(QGraphicsView):
             self._broadcast_view_state()
 
     def _broadcast_view_state(self):
+        """Hẹn gửi trạng thái cho View kia ở khung hình tới (nhiều lần gọi -> 1 lần gửi)"""
+        if self.sync_callback and not self._sync_timer.isActive():
+            self._sync_timer.start()
+
+    def _flush_view_state(self):
         """Gửi trạng thái hiện tại (Scale + Center Point) cho View kia"""
         if self.sync_callback and self.pixmap_item.pixmap():
             current_scale = self.transform().m11()
@@ -288,7 +576,7 @@ class ImageCanvas(QGraphicsView):
             self.sync_callback(state)
 
     def apply_sync_state(self, state):
-        """Nhận lệnh từ View kia và áp dụng"""
+        """Nhận lệnh từ View kia và áp dụng (bỏ qua phần không đổi)"""
         if not self.pixmap_item.pixmap():
             return
 
@@ -301,15 +589,22 @@ class ImageCanvas(QGraphicsView):
             if target_scale < self.min_scale or target_scale > self.max_scale:
                 return
             
-            # 2. Áp dụng Scale
-            target_scale = state['scale']
-            new_transform = self.transform()
-            new_transform.reset() 
-            new_transform.scale(target_scale, target_scale)
-            self.setTransform(new_transform)
+            # 2. Áp dụng Scale - chỉ khi thật sự đổi (setTransform vẽ lại toàn bộ viewport)
+            current = self.transform()
+            if not (math.isclose(current.m11(), target_scale, rel_tol=1e-9)
+                    and math.isclose(current.m22(), target_scale, rel_tol=1e-9)
+                    and current.m12() == 0 and current.m21() == 0):
+                new_transform = self.transform()
+                new_transform.reset() 
+                new_transform.scale(target_scale, target_scale)
+                self.setTransform(new_transform)
 
             # 3. Áp dụng Center (Hàm này sẽ trigger scrollContentsBy -> Cần is_syncing chặn lại)
-            self.centerOn(state['center_x'], state['center_y'])
+            # Pan thuần: viewport chỉ cuộn (blit) và vẽ lại dải vừa lộ ra
+            center = self.mapToScene(self.viewport().rect().center())
+            tolerance = 0.5 / target_scale  # Nửa pixel màn hình
+            if abs(center.x() - state['center_x']) > tolerance or abs(center.y() - state['center_y']) > tolerance:
+                self.centerOn(state['center_x'], state['center_y'])
         
         except Exception as e:
             print(f"Sync error: {e}")
@@ -1,8 +1,45 @@
+from .journal import BatchJournal
+from .manifest import BatchManifest
+from .engine import BatchEngine, FileTask, FileResult, scan_input, scan_for_conflicts
+from .fanout import Rendition, RenditionEngine
+from .watcher import FolderWatcher
+from .archive_io import ARCHIVE_SUFFIXES, ArchiveSource, ArchiveWriter, is_archive_path
+from .metadata_index import ImageMeta, MetadataIndex, index_files, parse_filter
+from .thumbnailer import ThumbnailService
+from .pixel_stats import PixelStats, compute_stats, DiffMetrics, DiffSession
+from .ab_compare import ABRunner, Candidate, SampleResult, stratified_sample
 from .file_loader import FileLoaderWorker
 from .batch_processor import BatchWorker
 from .preview_engine import PreviewController, PreviewRequest, PreviewResult
 
 __all__ = [
+    'BatchEngine',
+    'BatchJournal',
+    'BatchManifest',
+    'FileTask',
+    'FileResult',
+    'scan_input',
+    'scan_for_conflicts',
+    'Rendition',
+    'RenditionEngine',
+    'FolderWatcher',
+    'ARCHIVE_SUFFIXES',
+    'ArchiveSource',
+    'ArchiveWriter',
+    'is_archive_path',
+    'ImageMeta',
+    'MetadataIndex',
+    'index_files',
+    'parse_filter',
+    'ThumbnailService',
+    'PixelStats',
+    'compute_stats',
+    'DiffMetrics',
+    'DiffSession',
+    'ABRunner',
+    'Candidate',
+    'SampleResult',
+    'stratified_sample',
     'FileLoaderWorker',
     'BatchWorker', 
     'PreviewController',
@@ -0,0 +1,247 @@
+# workers/ab_compare.py
+import os
+import re
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from wand.image import Image as WandImage
+
+from config import CONFIG
+from utils import TRACER, RESOURCES, build_profile
+from .engine import BatchEngine, FileTask, FileResult, STATUS_OK
+from .pixel_stats import DiffSession, rgba_view
+
+# ==================================================
+# A/B PRESET (So sánh nhiều preset trên 1 mẫu ảnh)
+# ==================================================
+class Candidate(NamedTuple):
+    """1 preset tham gia so sánh: tên (= subfolder trong output) + chuỗi lệnh"""
+    name: str
+    command_string: str
+
+
+class SampleResult(NamedTuple):
+    candidate: str
+    rel_file: str
+    status: str
+    input_bytes: int
+    output_bytes: int
+    megapixels: float     # Kích thước ảnh input (MP)
+    elapsed_s: float      # Decode + lệnh + encode + ghi (không tính bước đo chất lượng)
+    psnr: Optional[float] # So với ảnh gốc (đưa về kích thước output); None = không đo được
+    ssim: Optional[float]
+    message: str
+
+
+def _size_bucket(size: int, edges: List[int]) -> int:
+    return sum(size > edge for edge in edges)
+
+
+def stratified_sample(files: Dict[str, int], count: int, buckets: int = None, seed: int = None) -> List[str]:
+    """
+    Chọn `count` file từ files (rel_file -> dung lượng bytes), phân tầng theo
+    (đuôi file, nhóm dung lượng theo phân vị) -> mẫu nhỏ vẫn có đủ JPEG nhỏ/lớn, PNG, TIFF...
+    Mỗi tầng lấy số file tỉ lệ với kích thước tầng (ít nhất 1 nếu còn suất), chọn ngẫu nhiên có seed.
+    """
+    buckets = CONFIG.ab_size_buckets if buckets is None else max(1, buckets)
+    rng = random.Random(CONFIG.ab_seed if seed is None else seed)
+    if count <= 0 or count >= len(files):
+        return sorted(files)
+
+    sizes = sorted(files.values())
+    edges = [sizes[len(sizes) * i // buckets] for i in range(1, buckets)]
+    strata: Dict[Tuple[str, int], List[str]] = defaultdict(list)
+    for rel_file in sorted(files):
+        strata[(Path(rel_file).suffix.lower(), _size_bucket(files[rel_file], edges))].append(rel_file)
+
+    # Phân bổ theo phương pháp số dư lớn nhất (Hamilton), ưu tiên tầng chưa có suất nào
+    total = len(files)
+    quotas = {key: count * len(members) / total for key, members in strata.items()}
+    alloc = {key: int(q) for key, q in quotas.items()}
+    remaining = count - sum(alloc.values())
+    order = sorted(strata, key=lambda k: (alloc[k] > 0, -(quotas[k] - alloc[k]), k))
+    for key in order[:remaining]:
+        alloc[key] += 1
+
+    sample = []
+    for key, members in strata.items():
+        sample += rng.sample(members, min(alloc[key], len(members)))
+    return sorted(sample)
+
+
+def _safe_folder(name: str) -> str:
+    """Tên preset -> tên folder output"""
+    return re.sub(r'[\\/:*?"<>|]+', '_', name).strip(' .') or "preset"
+
+
+class _CandidateEngine(BatchEngine):
+    """BatchEngine của 1 preset, chỉ dùng process_file (pool chung do ABRunner quản lý)"""
+    def __init__(self, candidate: Candidate, file_structure, input_dir: Path, output_dir: Path, **kwargs):
+        super().__init__(file_structure, input_dir, output_dir / _safe_folder(candidate.name),
+                         candidate.command_string, overwrite_mode="overwrite", use_journal=False, **kwargs)
+        self.candidate = candidate
+        self.operations, self.plan_hash = self._compile_plan()
+
+
+class ABRunner:
+    """
+    Chạy mỗi file mẫu 1 lần cho mỗi preset trên CÙNG 1 pool thread.
+    Các cặp (file, preset) được xếp xen kẽ -> mọi preset chịu cùng mức tranh chấp CPU,
+    nên throughput được tính trên thời gian xử lý của từng file (không phải wall time chung).
+    Sau khi ghi, output được đọc lại và so với ảnh gốc (PSNR/SSIM, numpy, đưa ảnh gốc về kích thước output).
+
+    Callbacks (gọi từ thread worker):
+        on_log(message: str)
+        on_sample(result: SampleResult, done: int, total: int)
+    """
+    def __init__(self, candidates: List[Candidate], input_dir: Path, output_dir: Path,
+                 rel_files: List[str], workers: int = 1, measure_quality: bool = True,
+                 on_log: Callable[[str], None] = None,
+                 on_sample: Callable[[SampleResult, int, int], None] = None):
+        names = [_safe_folder(c.name) for c in candidates]
+        if len(candidates) < 2:
+            raise ValueError("Cần ít nhất 2 preset để so sánh")
+        if len(set(names)) != len(names):
+            raise ValueError(f"Tên preset bị trùng (sau khi đổi thành tên folder): {', '.join(names)}")
+        self.candidates = list(candidates)
+        self.input_dir = Path(input_dir)
+        self.output_dir = Path(output_dir)
+        self.rel_files = list(rel_files)
+        self.workers = max(1, int(workers))
+        self.measure_quality = measure_quality
+        self.on_log = on_log or (lambda msg: None)
+        self.on_sample = on_sample or (lambda result, done, total: None)
+
+        file_structure: Dict[str, List[str]] = defaultdict(list)
+        for rel_file in self.rel_files:
+            path = Path(rel_file)
+            file_structure["" if str(path.parent) == "." else str(path.parent)].append(path.name)
+        self.file_structure = dict(file_structure)
+        self.results: List[SampleResult] = []
+        self.wall_s = 0.0
+        self.is_running = True
+        self._lock = threading.Lock()
+
+    def stop(self):
+        self.is_running = False
+
+    def run(self) -> List[dict]:
+        """Chạy toàn bộ (blocking). Trả về bảng tổng hợp, mỗi preset 1 dòng."""
+        engines = [_CandidateEngine(c, self.file_structure, self.input_dir, self.output_dir,
+                                    workers=self.workers, use_metadata_index=False, on_log=self.on_log)
+                   for c in self.candidates]
+        tasks = list(engines[0].iter_tasks())
+        # Xen kẽ preset theo từng file, đảo thứ tự preset mỗi file để không preset nào luôn chạy trước
+        jobs = []
+        for i, task in enumerate(tasks):
+            shift = i % len(engines)
+            jobs += [(engines[(shift + k) % len(engines)], task) for k in range(len(engines))]
+        for engine in engines:
+            engine.total = len(tasks)
+
+        self.on_log(f"🆚 So sánh {len(engines)} preset trên {len(tasks)} file mẫu ({len(jobs)} lượt, "
+                    f"{self.workers} worker)")
+        start = time.perf_counter()
+        try:
+            with RESOURCES.using(build_profile("throughput" if self.workers > 1 else "latency")):
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ABRunner") as pool:
+                    futures = [pool.submit(self._run_job, engine, task) for engine, task in jobs]
+                    try:
+                        for future in futures:
+                            future.result()
+                    except KeyboardInterrupt:
+                        # Ctrl+C (CLI): hủy các lượt chưa chạy, chỉ đợi các file đang xử lý dở
+                        self.stop()
+                        pool.shutdown(wait=True, cancel_futures=True)
+                        raise
+        finally:
+            for engine in engines:
+                if engine.input_archive:
+                    engine.input_archive.close()
+            self.wall_s = time.perf_counter() - start
+        return self.summary()
+
+    def _run_job(self, engine: _CandidateEngine, task: FileTask):
+        if not self.is_running:
+            return
+        with TRACER.span("ab_file", "ab", preset=engine.candidate.name, index=task.index):
+            result = engine.process_file(task, engine.operations)
+            sample = self._sample_result(engine, result)
+        with self._lock:
+            self.results.append(sample)
+            done = len(self.results)
+        self.on_sample(sample, done, len(self.candidates) * len(self.rel_files))
+
+    def _sample_result(self, engine: _CandidateEngine, result: FileResult) -> SampleResult:
+        input_path = result.input_path
+        try:
+            input_bytes = os.stat(input_path).st_size if not engine.input_archive else 0
+        except OSError:
+            input_bytes = 0
+        megapixels, psnr, ssim = 0.0, None, None
+        if result.status == STATUS_OK and self.measure_quality:
+            try:
+                with TRACER.span("ab_quality", "ab"):
+                    megapixels, psnr, ssim = self._quality(engine, input_path, result.out_path)
+            except Exception as e:
+                self.on_log(f"⚠️ Không đo được chất lượng {result.out_path}: {e}")
+        return SampleResult(engine.candidate.name, result.task.rel_file, result.status, input_bytes,
+                            result.size_bytes, megapixels, result.elapsed_s, psnr, ssim, result.message)
+
+    @staticmethod
+    def _quality(engine: _CandidateEngine, input_path: Path, out_path: Path) -> Tuple[float, float, float]:
+        """(MP ảnh gốc, PSNR, SSIM) của output so với ảnh gốc đưa về cùng kích thước"""
+        if engine.input_archive:
+            source = WandImage(blob=engine.input_archive.read(input_path.relative_to(engine.input_dir).as_posix()))
+        else:
+            source = WandImage(filename=f"{input_path}[0]")
+        with source, WandImage(filename=f"{out_path}[0]") as output:
+            megapixels = source.width * source.height / 1_000_000
+            with WandImage(image=source.sequence[0]) as ref:
+                if ref.size != output.size:
+                    ref.auto_orient()  # Preset có -auto-orient -> so cùng hướng
+                if ref.size != output.size:
+                    ref.resize(output.width, output.height)
+                pixels = []
+                for img in (ref, output):
+                    img.depth = 8
+                    pixels.append(rgba_view(img.make_blob(format='RGBA'), img.width, img.height))
+        metrics = DiffSession(*pixels).update()
+        return megapixels, metrics.psnr, metrics.ssim
+
+    def summary(self) -> List[dict]:
+        """Tổng hợp theo preset: throughput, dung lượng, chất lượng"""
+        rows = []
+        for candidate in self.candidates:
+            samples = [r for r in self.results if r.candidate == candidate.name]
+            ok = [r for r in samples if r.status == STATUS_OK]
+            busy = sum(r.elapsed_s for r in ok)
+            psnrs = [r.psnr for r in ok if r.psnr is not None]
+            finite = [p for p in psnrs if p != float('inf')]
+            ssims = [r.ssim for r in ok if r.ssim is not None]
+            input_bytes = sum(r.input_bytes for r in ok)
+            output_bytes = sum(r.output_bytes for r in ok)
+            rows.append({
+                "preset": candidate.name,
+                "command": candidate.command_string,
+                "files": len(samples),
+                "failed": len(samples) - len(ok),
+                # Throughput của 1 worker (tổng thời gian xử lý của preset này)
+                "files_per_s": round(len(ok) / busy, 3) if busy else None,
+                "mp_per_s": round(sum(r.megapixels for r in ok) / busy, 2) if busy and self.measure_quality else None,
+                "avg_latency_s": round(busy / len(ok), 4) if ok else None,
+                "output_bytes": output_bytes,
+                "avg_output_kb": round(output_bytes / len(ok) / 1024, 1) if ok else None,
+                "size_ratio": round(output_bytes / input_bytes, 4) if input_bytes else None,
+                # PSNR bỏ qua file giống hệt gốc (inf, đếm riêng); min = file tệ nhất
+                "psnr_mean": round(sum(finite) / len(finite), 2) if finite else None,
+                "psnr_min": round(min(finite), 2) if finite else None,
+                "identical": len(psnrs) - len(finite),
+                "ssim_mean": round(sum(ssims) / len(ssims), 4) if ssims else None,
+            })
+        return rows
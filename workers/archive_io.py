@@ -0,0 +1,231 @@
+# workers/archive_io.py
+import io
+import os
+import re
+import time
+import tarfile
+import zipfile
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils import TRACER
+
+# ==========================================
+# ARCHIVE OUTPUT (Ghi output vào ZIP / TAR)
+# ==========================================
+ARCHIVE_KINDS = ('zip', 'tar')
+
+
+class ArchiveWriter:
+    """
+    Ghi tuần tự các blob đã encode vào 1 chuỗi file nén: <base>-001.zip, <base>-002.zip, ...
+    (tách part mới khi part hiện tại vượt split_bytes; 0 = không tách).
+
+    - Mỗi part được ghi vào <part>.tmp và chỉ os.replace sang tên thật khi đóng xong
+      (central directory của ZIP đã ghi) -> part nào có tên thật là part đọc được.
+    - add_done(rel_file): file input đã xong, nhưng chỉ báo on_part_closed(rel_files) khi part
+      chứa output cuối cùng của nó đã đóng -> journal không ghi nhận output còn nằm trong .tmp.
+    - ZIP dùng STORED (JPEG/WebP/PNG đã nén sẵn, nén lại chỉ tốn CPU).
+    """
+    def __init__(self, output_dir: Path, base_name: str, kind: str = 'zip', split_bytes: int = 0,
+                 fsync: bool = False, on_part_closed: Callable[[List[str]], None] = None):
+        if kind not in ARCHIVE_KINDS:
+            raise ValueError(f"Loại archive không hỗ trợ: '{kind}' ({', '.join(ARCHIVE_KINDS)})")
+        self.output_dir = Path(output_dir)
+        self.base_name = base_name
+        self.kind = kind
+        self.split_bytes = max(0, split_bytes)
+        self.fsync = fsync
+        self.on_part_closed = on_part_closed or (lambda rel_files: None)
+
+        self.parts: List[Path] = []     # Các part đã đóng trong lần chạy này
+        self.entries = 0
+        self._index = 0
+        self._file = None
+        self._archive = None
+        self._part_entries = 0
+        self._done: List[str] = []
+        self._lock = threading.Lock()
+
+    # --- Tên part ---
+    def _part_path(self, index: int) -> Path:
+        return self.output_dir / f"{self.base_name}-{index:03d}.{self.kind}"
+
+    def existing_parts(self) -> List[Path]:
+        pattern = re.compile(rf"{re.escape(self.base_name)}-(\d{{3,}})\.{self.kind}$")
+        if not self.output_dir.is_dir():
+            return []
+        return sorted(p for p in self.output_dir.iterdir() if pattern.match(p.name))
+
+    def open(self, resume: bool):
+        """
+        resume=True: giữ các part cũ, đánh số tiếp (job đang chạy dở).
+        resume=False: xóa các part cũ cùng tên (chạy lại từ đầu = ghi đè).
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        # .tmp còn sót lại = part chưa đóng của lần chạy bị crash -> không đọc được, bỏ
+        for stale in self.output_dir.glob(f"{self.base_name}-*.{self.kind}.tmp"):
+            stale.unlink(missing_ok=True)
+        existing = self.existing_parts()
+        if resume and existing:
+            self._index = max(int(re.findall(r"-(\d+)\.", p.name)[-1]) for p in existing)
+        else:
+            for part in existing:
+                part.unlink(missing_ok=True)
+            self._index = 0
+        return self
+
+    # --- Ghi ---
+    def add(self, arcname: str, blob: bytes):
+        """Thêm 1 file (thread-safe, ghi tuần tự)"""
+        with self._lock:
+            if self._archive is not None and self.split_bytes and self._part_entries \
+                    and self._file.tell() + len(blob) > self.split_bytes:
+                self._close_part()
+            if self._archive is None:
+                self._open_part()
+            with TRACER.span("archive_add", "batch", bytes=len(blob)):
+                if self.kind == 'zip':
+                    info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+                    info.compress_type = zipfile.ZIP_STORED
+                    self._archive.writestr(info, blob)
+                else:
+                    info = tarfile.TarInfo(arcname)
+                    info.size = len(blob)
+                    info.mtime = int(time.time())
+                    self._archive.addfile(info, io.BytesIO(blob))
+            self._part_entries += 1
+            self.entries += 1
+
+    def add_done(self, rel_file: str):
+        """File input đã ghi hết output -> báo ra ngoài khi part hiện tại đóng"""
+        with self._lock:
+            if self._archive is None:
+                # Không có output nào đang chờ (VD: file bị skip) -> báo ngay
+                self.on_part_closed([rel_file])
+            else:
+                self._done.append(rel_file)
+
+    def close(self):
+        with self._lock:
+            self._close_part()
+
+    def _open_part(self):
+        self._index += 1
+        path = self._part_path(self._index)
+        self._file = open(path.with_name(path.name + '.tmp'), 'wb')
+        if self.kind == 'zip':
+            self._archive = zipfile.ZipFile(self._file, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self._archive = tarfile.open(fileobj=self._file, mode='w', format=tarfile.PAX_FORMAT)
+        self._part_entries = 0
+
+    def _close_part(self):
+        if self._archive is None:
+            return
+        path = self._part_path(self._index)
+        temp = path.with_name(path.name + '.tmp')
+        with TRACER.span("archive_close", "batch", part=path.name):
+            self._archive.close()
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(temp, path)
+        self._archive = self._file = None
+        self.parts.append(path)
+        done, self._done = self._done, []
+        self.on_part_closed(done)
+
+
+# ==========================================
+# ARCHIVE INPUT (Đọc ZIP / TAR như 1 folder)
+# ==========================================
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def is_archive_path(path: Path) -> bool:
+    """Input là file ZIP/TAR (thay vì folder)"""
+    path = Path(path)
+    return path.name.lower().endswith(ARCHIVE_SUFFIXES) and path.is_file()
+
+
+class ArchiveSource:
+    """
+    Đọc các file ảnh bên trong 1 archive mà không giải nén ra đĩa.
+
+    - list_files(): danh sách member (đường dẫn bên trong archive, dạng a/b.jpg)
+    - read(rel_file): bytes của member -> WandImage(blob=...)
+    - Mỗi thread có handle riêng (threading.local): zipfile/tarfile không an toàn khi
+      nhiều thread cùng seek trên 1 file object.
+    Lưu ý: .tar.gz/.tar.bz2/.tar.xz không seek được -> mỗi lần đọc phải giải nén lại từ đầu
+    member trước đó, chậm hơn nhiều so với .zip/.tar khi có nhiều file.
+    """
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.is_zip = zipfile.is_zipfile(self.path)
+        self._local = threading.local()
+        self._handles = []
+        self._names: Dict[str, str] = {}   # Đường dẫn chuẩn hóa -> tên member gốc
+        self._lock = threading.Lock()
+
+    def _handle(self):
+        handle = getattr(self._local, 'handle', None)
+        if handle is None:
+            handle = zipfile.ZipFile(self.path) if self.is_zip else tarfile.open(self.path)
+            self._local.handle = handle
+            with self._lock:
+                self._handles.append(handle)
+        return handle
+
+    @staticmethod
+    def _normalize(name: str) -> str:
+        return re.sub(r'^(\./)+', '', name.replace('\\', '/')).lstrip('/')
+
+    def _index(self) -> Dict[str, str]:
+        """Tất cả member là file (đọc mục lục 1 lần)"""
+        with self._lock:
+            if self._names:
+                return self._names
+        handle = self._handle()
+        if self.is_zip:
+            members = [info.filename for info in handle.infolist() if not info.is_dir()]
+        else:
+            members = [info.name for info in handle.getmembers() if info.isfile()]
+        names = {self._normalize(name): name for name in members}
+        with self._lock:
+            self._names = names
+        return names
+
+    def list_files(self, extensions: Tuple[str, ...]) -> List[str]:
+        """Các member là file ảnh (bỏ file ẩn, __MACOSX)"""
+        files = []
+        for normalized in self._index():
+            parts = normalized.split('/')
+            if parts[0] == '__MACOSX' or any(p.startswith('.') for p in parts):
+                continue
+            if Path(normalized).suffix.lower() in extensions:
+                files.append(normalized)
+        return files
+
+    def read(self, rel_file: str) -> bytes:
+        """Đọc toàn bộ bytes của 1 member (rel_file có thể dùng '\\' trên Windows)"""
+        normalized = self._normalize(str(rel_file))
+        name = self._index().get(normalized, normalized)
+        handle = self._handle()
+        with TRACER.span("archive_read", "batch", member=normalized):
+            if self.is_zip:
+                return handle.read(name)
+            member = handle.extractfile(name)
+            if member is None:
+                raise FileNotFoundError(f"Không phải file: {normalized}")
+            with member:
+                return member.read()
+
+    def close(self):
+        with self._lock:
+            for handle in self._handles:
+                handle.close()
+            self._handles.clear()
+        self._local = threading.local()
@@ -0,0 +1,94 @@
+# workers/autoscale.py
+import os
+import time
+from typing import NamedTuple, Optional
+
+# ==========================================
+# AUTOSCALE (Tự điều chỉnh số worker batch)
+# ==========================================
+class PoolSample(NamedTuple):
+    """Số liệu đo được trong 1 chu kỳ"""
+    workers: int
+    cpu_util: float      # 0..1, CPU của process / (thời gian thực x số core)
+    throughput: float    # file/giây
+    latency_s: float     # thời gian xử lý trung bình 1 file
+    wait_s: float        # thời gian chờ trung bình trước khi file được xử lý (RAM budget)
+
+
+class CpuMeter:
+    """Đo % CPU của chính process bằng os.times() (không cần psutil)"""
+    def __init__(self):
+        self.cpu_count = os.cpu_count() or 1
+        self._last = self._read()
+
+    @staticmethod
+    def _read():
+        t = os.times()
+        return t.user + t.system, time.monotonic()
+
+    def sample(self) -> float:
+        cpu, wall = self._read()
+        last_cpu, last_wall = self._last
+        self._last = (cpu, wall)
+        elapsed = wall - last_wall
+        if elapsed <= 0:
+            return 0.0
+        return min(1.0, (cpu - last_cpu) / (elapsed * self.cpu_count))
+
+
+class Autoscaler:
+    """
+    Hill-climbing trên throughput (file/s):
+    - CPU còn rảnh -> thử thêm worker (việc nặng I/O: encode webp, ghi disk...),
+      giữ lại nếu throughput tăng > 5%.
+    - CPU bão hòa -> thử bớt worker (việc nặng CPU: kuwahara...),
+      giữ lại nếu throughput không giảm quá 5% (ít worker hơn = latency thấp hơn, ít RAM hơn).
+    - Lần thử không có lợi -> trả lại số cũ và đứng yên vài chu kỳ.
+    """
+    IMPROVE = 1.05       # Ngưỡng 5% để coi là tốt hơn/tệ hơn
+    CPU_BUSY = 0.90      # Trên mức này coi như hết core
+    HOLD_CYCLES = 3      # Giữ nguyên vài chu kỳ sau khi quay lại/chạm ngưỡng (tránh dao động)
+
+    def __init__(self, min_workers: int, max_workers: int, initial: int):
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.current = min(self.max_workers, max(self.min_workers, initial))
+        self.direction = +1
+        self.hold = 0
+        self.previous: Optional[PoolSample] = None
+
+    def _clamp(self, value: int) -> int:
+        return min(self.max_workers, max(self.min_workers, value))
+
+    def step(self, sample: PoolSample) -> int:
+        """Nhận số liệu của chu kỳ vừa qua, trả về số worker cho chu kỳ tiếp theo"""
+        prev, self.previous = self.previous, sample
+        if sample.throughput <= 0:
+            return self.current  # Chưa có file nào xong -> chưa đủ dữ liệu
+        if self.hold > 0:
+            self.hold -= 1
+            return self.current
+
+        if prev is not None and prev.workers != sample.workers:
+            # Đánh giá lần đổi ở chu kỳ trước
+            if self.direction > 0:
+                worse = sample.throughput <= prev.throughput * self.IMPROVE
+            else:
+                worse = sample.throughput < prev.throughput / self.IMPROVE
+            if worse:
+                # Không có lợi -> trả lại số worker cũ và đứng yên 1 thời gian
+                self.current = prev.workers
+                self.hold = self.HOLD_CYCLES
+                return self.current
+            if self.direction > 0 and sample.cpu_util >= self.CPU_BUSY:
+                # Có lợi nhưng đã hết CPU -> dừng ở đây (không thử giảm ngay)
+                self.hold = self.HOLD_CYCLES
+                return self.current
+        else:
+            self.direction = +1 if sample.cpu_util < self.CPU_BUSY else -1
+
+        new_size = self._clamp(self.current + self.direction)
+        if new_size == self.current:
+            self.hold = self.HOLD_CYCLES
+        self.current = new_size
+        return self.current
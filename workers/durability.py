@@ -0,0 +1,77 @@
+# workers/durability.py
+import os
+import threading
+from pathlib import Path
+from typing import Callable, List, Set
+
+from utils import TRACER
+
+# =========================================
+# FSYNC THEO CHECKPOINT (Ghi output bền vững)
+# =========================================
+class OutputSyncer:
+    """
+    Gom fsync của các file output thành từng đợt (mỗi `every` file) thay vì fsync từng file.
+
+    Thứ tự đảm bảo tại mỗi checkpoint:
+        1. fsync các file output đã ghi + thư mục chứa chúng (để os.replace cũng bền vững)
+        2. on_checkpoint(rel_files) -> ghi journal + fsync journal
+    Nhờ vậy journal không bao giờ chứa file mà output chưa nằm an toàn trên đĩa
+    (mất điện giữa chừng -> resume làm lại tối đa `every` file cuối).
+    """
+    def __init__(self, every: int, on_checkpoint: Callable[[List[str]], None]):
+        self.every = max(1, every)
+        self.on_checkpoint = on_checkpoint
+        self.checkpoints = 0
+        self._outputs: List[Path] = []
+        self._done: List[str] = []
+        self._lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+
+    def add_output(self, path: Path):
+        """File output vừa os.replace xong (gọi từ thread worker)"""
+        with self._lock:
+            self._outputs.append(Path(path))
+
+    def add_done(self, rel_file: str):
+        """File input đã xử lý xong -> chờ checkpoint mới ghi vào journal"""
+        with self._lock:
+            self._done.append(rel_file)
+            due = len(self._done) >= self.every
+        if due:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """fsync output -> báo on_checkpoint. Các worker khác vẫn ghi tiếp trong lúc fsync."""
+        with self._checkpoint_lock:
+            with self._lock:
+                outputs, self._outputs = self._outputs, []
+                done, self._done = self._done, []
+            if not outputs and not done:
+                return
+            with TRACER.span("fsync_checkpoint", "batch", files=len(outputs)):
+                folders: Set[Path] = set()
+                for path in outputs:
+                    self._fsync_path(path)
+                    folders.add(path.parent)
+                if os.name != 'nt':
+                    # Windows không mở được thư mục để fsync (NTFS ghi metadata rename theo journal riêng)
+                    for folder in folders:
+                        self._fsync_path(folder, directory=True)
+                self.on_checkpoint(done)
+            self.checkpoints += 1
+
+    @staticmethod
+    def _fsync_path(path: Path, directory: bool = False):
+        # Windows: _commit cần handle có quyền ghi
+        flags = os.O_RDONLY if directory or os.name != 'nt' else os.O_RDWR
+        try:
+            fd = os.open(str(path), flags)
+        except OSError:
+            return  # File đã bị xóa/di chuyển sau khi ghi
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
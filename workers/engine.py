@@ -0,0 +1,899 @@
+# workers/engine.py
+import os
+import re
+import shutil
+import tempfile
+import time
+import queue
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from wand.image import Image as WandImage
+from wand.exceptions import BlobError, CorruptImageError, MissingDelegateError
+
+from config import CONFIG
+from core.parser import CommandParser
+from utils import TRACER, RESOURCES, build_profile
+from .journal import BatchJournal
+from .manifest import BatchManifest
+from .autoscale import Autoscaler, CpuMeter, PoolSample
+from .archive_io import ARCHIVE_KINDS, ArchiveSource, ArchiveWriter, is_archive_path
+from .durability import OutputSyncer
+from .metadata_index import ImageMeta, MetadataIndex, index_files
+from .target_size import LOSSY_FORMATS, QualityPredictor, encode_to_target, target_size_of
+from .scheduler import (MemoryBudget, bytes_per_pixel, default_budget_bytes,
+                        estimate_peak_bytes, order_by_cost)
+from .tiling import (TilePlan, can_tile, open_tiled_output, plan_tiles, process_tiles,
+                     stage_image, tile_cost_bytes, tile_edge)
+
+# ============================================================
+# BATCH ENGINE (Không phụ thuộc Qt - dùng chung cho GUI và CLI)
+# ============================================================
+STATUS_OK = "ok"
+STATUS_SKIPPED = "skipped"
+STATUS_FAILED = "failed"
+
+OVERWRITE_MODES = ("overwrite", "skip", "incremental")
+
+
+# === Quét file ===
+def natural_key(text):
+    """
+    Tạo key sắp xếp tự nhiên:
+    1. Chuẩn hóa Unicode (NFC) -> Sắp xếp đúng tiếng Việt (a < á < b).
+    2. Tách số ra khỏi chữ -> Sắp xếp đúng số học (img1 < img2 < img10).
+    """
+    text = str(text)
+    # Chuẩn hóa về NFC để các ký tự tiếng Việt có dấu được xử lý đồng nhất
+    text = unicodedata.normalize('NFC', text.lower())
+
+    # Tách chuỗi thành list gồm chuỗi và số: "img10" -> ['img', 10, '']
+    return [int(c) if c.isdigit() else c for c in re.split(r'(\d+)', text)]
+
+
+def scan_input(input_path: Path, extensions: Tuple[str, ...]) -> Tuple[Dict[str, List[str]], List[str]]:
+    """
+    Quét đệ quy folder bằng os.scandir (nhanh hơn rglob), sắp xếp tự nhiên.
+    input_path là file ZIP/TAR -> liệt kê member theo đường dẫn bên trong archive.
+
+    Returns:
+        (file_structure: {rel_folder: [filename, ...]}, flat_file_list: [rel_path, ...])
+    """
+    file_structure: Dict[str, List[str]] = {}
+    temp_list: List[str] = []
+
+    if is_archive_path(input_path):
+        source = ArchiveSource(input_path)
+        try:
+            members = source.list_files(extensions)
+        finally:
+            source.close()
+        for member in members:
+            rel = Path(member)
+            rel_path_str = str(rel.parent) if rel.parent != Path('.') else ""
+            file_structure.setdefault(rel_path_str, []).append(rel.name)
+            temp_list.append(str(rel))
+        return _sorted_scan(file_structure, temp_list)
+
+    def add_to_structure(file_path: Path):
+        """Thêm file vào cấu trúc dữ liệu"""
+        rel_path = file_path.relative_to(input_path).parent
+        rel_path_str = str(rel_path) if rel_path != Path('.') else ""
+
+        if rel_path_str not in file_structure:
+            file_structure[rel_path_str] = []
+
+        file_structure[rel_path_str].append(file_path.name)
+
+        full_rel_path = Path(rel_path_str) / file_path.name if rel_path_str else Path(file_path.name)
+        temp_list.append(str(full_rel_path))
+
+    def scan_directory(path: Path):
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        file_path = Path(entry.path)
+                        if file_path.suffix.lower() in extensions:
+                            try:
+                                add_to_structure(file_path)
+                            except ValueError:
+                                continue
+                    elif entry.is_dir(follow_symlinks=False):
+                        # Đệ quy vào subfolder
+                        scan_directory(Path(entry.path))
+        except PermissionError:
+            # Bỏ qua folder không có quyền truy cập
+            pass
+        except OSError:
+            # Bỏ qua lỗi hệ thống (symlink lỗi, etc.)
+            pass
+
+    scan_directory(input_path)
+    return _sorted_scan(file_structure, temp_list)
+
+
+def _sorted_scan(file_structure: Dict[str, List[str]], flat_list: List[str]) -> Tuple[Dict[str, List[str]], List[str]]:
+    """Sắp xếp tự nhiên từng folder và danh sách phẳng"""
+    for key in file_structure:
+        file_structure[key].sort(key=natural_key)
+
+    return file_structure, sorted(flat_list, key=natural_key)
+
+
+# === Xác định output ===
+def extract_format(command_string: str) -> Optional[str]:
+    """Trích xuất format đích từ command (-format jpg -> 'jpeg')"""
+    return format_from_operations(CommandParser.parse(command_string))
+
+
+def format_from_operations(operations) -> Optional[str]:
+    """Như extract_format nhưng nhận danh sách lệnh đã parse"""
+    for cmd, value in operations:
+        if cmd == 'format' and value:
+            fmt = value.lower().strip()
+            return 'jpeg' if fmt == 'jpg' else ('tiff' if fmt == 'tif' else fmt)
+    return None
+
+
+def get_output_path(input_path: Path, output_subfolder: Path, target_format: Optional[str]) -> Tuple[Path, str]:
+    """Xác định tên file output"""
+    stem = input_path.stem
+
+    if target_format:
+        ext_map = {'jpeg': '.jpg', 'tiff': '.tif'}
+        new_ext = ext_map.get(target_format, f'.{target_format}')
+        out_filename = f"{stem}{new_ext}"
+    else:
+        out_filename = input_path.name
+
+    out_path = output_subfolder / out_filename
+
+    # Tránh ghi đè nếu input == output
+    if input_path == out_path:
+        out_filename = f"{stem}_processed{out_path.suffix}"
+        out_path = output_subfolder / out_filename
+
+    return out_path, out_filename
+
+
+def scan_for_conflicts(file_structure: Dict[str, List[str]],
+                       input_dir: Path, output_dir: Path,
+                       command_string: str) -> Tuple[bool, List[str]]:
+    """
+    Quét nhanh xem có file nào bị trùng trong output folder không.
+
+    Returns:
+        (has_conflicts: bool, conflict_files: List[str])
+    """
+    conflicts = []
+    target_format = extract_format(command_string)
+
+    for rel_path, file_list in file_structure.items():
+        output_subfolder = output_dir / rel_path if rel_path else output_dir
+
+        for filename in file_list:
+            input_path = input_dir / rel_path / filename if rel_path else input_dir / filename
+            out_path, _ = get_output_path(input_path, output_subfolder, target_format)
+
+            if out_path.exists():
+                conflicts.append(str(out_path.name))
+
+    return (len(conflicts) > 0, conflicts)
+
+
+class InvalidImageError(ValueError):
+    """Ảnh đọc được nhưng không hợp lệ để xử lý (VD: 1x1)"""
+
+
+# === Data Transfer Objects ===
+class FileTask:
+    """1 file cần xử lý trong batch"""
+    __slots__ = ('index', 'rel_path', 'filename')
+
+    def __init__(self, index: int, rel_path: str, filename: str):
+        self.index = index
+        self.rel_path = rel_path
+        self.filename = filename
+
+    @property
+    def rel_file(self) -> str:
+        """Đường dẫn tương đối của file input (dùng làm key)"""
+        return str(Path(self.rel_path) / self.filename) if self.rel_path else self.filename
+
+
+class FileResult:
+    """Kết quả xử lý 1 file"""
+    def __init__(self, task: FileTask, status: str, message: str, input_path: Path,
+                 out_path: Optional[Path] = None, size_bytes: int = 0, elapsed_s: float = 0.0):
+        self.task = task
+        self.status = status
+        self.message = message
+        self.input_path = input_path
+        self.out_path = out_path
+        self.size_bytes = size_bytes
+        self.elapsed_s = elapsed_s
+
+
+# === Engine ===
+class BatchEngine:
+    """
+    Engine xử lý hàng loạt: quét task -> pool N worker -> ping/decode/apply/encode/ghi atomic.
+    Không import Qt: BatchWorker (GUI) và cli.py (headless) cùng dùng class này.
+
+    Callbacks (gọi từ thread worker, phải thread-safe):
+        on_log(message: str)
+        on_result(result: FileResult, done: int, total: int)
+    """
+    def __init__(self, file_structure: Dict[str, List[str]],
+                 input_dir: Path, output_dir: Path, command_string: str,
+                 overwrite_mode: str = "overwrite", workers: int = 1,
+                 resume: bool = True, use_journal: bool = True, hash_inputs: bool = False,
+                 memory_budget_mb: Optional[int] = None, resource_profile: Optional[str] = None,
+                 autoscale: bool = False, max_workers: Optional[int] = None,
+                 fsync_every: Optional[int] = None,
+                 archive: Optional[str] = None, archive_split_mb: int = 0,
+                 use_metadata_index: Optional[bool] = None,
+                 on_log: Callable[[str], None] = None,
+                 on_result: Callable[[FileResult, int, int], None] = None):
+        self.file_structure = file_structure
+        self.input_dir = Path(input_dir)
+        self.output_dir = Path(output_dir)
+        self.command_string = command_string
+        self.overwrite_mode = overwrite_mode
+        self.workers = max(1, int(workers))
+        self.autoscale = autoscale
+        self.max_workers = max(self.workers, max_workers or CONFIG.autoscale_max_workers or 2 * (os.cpu_count() or 1))
+        self.resume = resume
+        self.use_journal = use_journal
+        self.journal: Optional[BatchJournal] = None
+        # fsync output theo đợt N file (0 = không fsync, để OS tự ghi xuống đĩa)
+        self.fsync_every = CONFIG.output_fsync_every if fsync_every is None else max(0, fsync_every)
+        self.syncer: Optional[OutputSyncer] = None
+        # Ghi output vào ZIP/TAR thay vì từng file (không stat được output -> chỉ hỗ trợ ghi đè)
+        if archive and archive not in ARCHIVE_KINDS:
+            raise ValueError(f"Loại archive không hỗ trợ: '{archive}' ({', '.join(ARCHIVE_KINDS)})")
+        if archive and overwrite_mode != "overwrite":
+            raise ValueError("Output dạng archive chỉ hỗ trợ chế độ ghi đè (overwrite)")
+        self.archive = archive
+        self.archive_split_mb = max(0, archive_split_mb or 0)
+        self.archive_writer: Optional[ArchiveWriter] = None
+        # Input là file ZIP/TAR: đọc member vào RAM, không giải nén ra đĩa
+        self.input_archive = ArchiveSource(self.input_dir) if is_archive_path(self.input_dir) else None
+        if self.input_archive and overwrite_mode == "incremental":
+            raise ValueError("Input dạng archive không hỗ trợ chế độ incremental")
+        self._input_cache = threading.local()  # Blob vừa đọc từ archive (ping rồi decode cùng 1 file)
+        self.hash_inputs = hash_inputs
+        # Header đã index (rel_file -> ImageMeta): ước lượng RAM + bỏ qua ping khi xử lý
+        self.use_metadata_index = CONFIG.metadata_index_enabled if use_metadata_index is None else use_metadata_index
+        self.metadata: Dict[str, ImageMeta] = {}
+        self.manifest: Optional[BatchManifest] = None
+        self.plan_hash: Optional[str] = None
+        self.tile_plan: Optional[TilePlan] = None
+        self.memory_budget_mb = CONFIG.memory_budget_mb if memory_budget_mb is None else memory_budget_mb
+        self.resource_profile = resource_profile or CONFIG.batch_resource_profile
+        if self.resource_profile == "auto":
+            self.resource_profile = "throughput" if self.workers > 1 or self.autoscale else "latency"
+        self.on_log = on_log or (lambda msg: None)
+        self.on_result = on_result or (lambda result, done, total: None)
+
+        self.is_running = True
+        self.processed_count = 0
+        self.skipped_count = 0
+        self.failed_count = 0
+        self.resumed_count = 0
+        self.done_count = 0
+        self.total = 0
+        self.target_format = extract_format(command_string)
+
+        self._lock = threading.Lock()
+        self._latency_sum = 0.0   # Tổng thời gian xử lý các file (đo latency cho autoscale)
+        self._wait_sum = 0.0      # Tổng thời gian chờ RAM budget
+        self._active_workers = self.workers
+        self._scale_cond = threading.Condition()
+        self._created_folders = set()
+        self.quality_predictor = QualityPredictor()  # -target-size: học quality từ các file trước
+
+    # --- Public API ---
+    def iter_tasks(self):
+        """Sinh danh sách task theo đúng thứ tự file_structure"""
+        index = 0
+        for rel_path, file_list in self.file_structure.items():
+            for filename in file_list:
+                yield FileTask(index, rel_path, filename)
+                index += 1
+
+    def run(self) -> dict:
+        """Chạy toàn bộ batch (blocking). Trả về thống kê."""
+        start = time.perf_counter()
+        operations, self.plan_hash = self._compile_plan()
+        self.tile_plan = self._plan_tiling(operations)
+        tasks = list(self.iter_tasks())
+        self.total = len(tasks)
+
+        self._log_start(self.total)
+        if self.overwrite_mode == "incremental":
+            self.manifest = BatchManifest.for_output(self.output_dir, use_hash=self.hash_inputs).load()
+        manifest_keys = [key for t in tasks for key in self._manifest_keys(t.rel_file)]
+        tasks = self._open_journal(tasks, self.plan_hash)
+        if self.archive:
+            # Journal chỉ ghi nhận file khi part chứa output của nó đã đóng
+            self.archive_writer = ArchiveWriter(
+                self.output_dir, self.input_dir.name or "batch", self.archive,
+                split_bytes=self.archive_split_mb * 1024 * 1024, fsync=bool(self.fsync_every),
+                on_part_closed=self._on_checkpoint).open(resume=self.resumed_count > 0)
+        elif self.fsync_every:
+            self.syncer = OutputSyncer(self.fsync_every, self._on_checkpoint)
+
+        try:
+            with RESOURCES.using(self._resource_limits()):
+                restore = f" - xong sẽ trả về {RESOURCES.base}" if RESOURCES.base else ""
+                self.on_log(f"⚙️ ImageMagick [{RESOURCES.active}{restore}]: {RESOURCES.describe()}\n")
+                self._run_pool(tasks, operations)
+        except KeyboardInterrupt:
+            # Ctrl+C ở bất kỳ bước nào (ước lượng RAM, đọc metadata, pool 1 worker...):
+            # đánh dấu dừng TRƯỚC khi đóng journal -> không ghi #done, lần sau resume tiếp
+            self.stop()
+            raise
+        finally:
+            if self.input_archive:
+                self.input_archive.close()
+            if self.archive_writer:
+                self.archive_writer.close()
+                parts = ", ".join(p.name for p in self.archive_writer.parts) or "không có"
+                self.on_log(f"📦 Archive: {self.archive_writer.entries} file -> {parts}")
+            if self.syncer:
+                # Checkpoint cuối: các file đã xong phải vào journal trước khi đóng
+                self.syncer.checkpoint()
+                self.on_log(f"💾 fsync: {self.syncer.checkpoints} checkpoint (mỗi {self.fsync_every} file)")
+            if self.manifest:
+                # Chỉ dọn entry của input đã bị xóa khi đã quét hết danh sách
+                self.manifest.close(keep=manifest_keys if self.is_running else None)
+            if self.journal:
+                # Chỉ đánh dấu xong khi chạy hết và không có file lỗi (lần sau sẽ retry file lỗi)
+                self.journal.close(completed=self.is_running and self.failed_count == 0)
+
+        if self.is_running:
+            self._log_finish(self.total)
+        else:
+            self.on_log("\n⚠️ Đã dừng xử lý!")
+
+        return self.summary(time.perf_counter() - start)
+
+    def plan_key(self) -> str:
+        """Hash kế hoạch xử lý của batch này (dùng để tra journal trước khi chạy)"""
+        return self._compile_plan()[1]
+
+    def _compile_plan(self):
+        """Parse lệnh 1 lần cho cả batch. Returns: (operations, plan_hash)"""
+        operations = CommandParser.parse(self.command_string)
+        return operations, CommandParser.plan_hash(operations)
+
+    def _plan_tiling(self, operations) -> Optional[TilePlan]:
+        """Chuỗi lệnh có xử lý theo tile được không (chỉ gồm lệnh điểm/cục bộ/cài đặt)"""
+        if CONFIG.tile_threshold_mp <= 0 or self.input_archive:
+            # Tile cần stage file lên disk -> không áp dụng cho member của archive (đọc vào RAM)
+            return None
+        return plan_tiles(operations)
+
+    def _resource_limits(self):
+        """Profile ImageMagick của batch; có tile -> 'area' = ngưỡng tile (decode ảnh lớn vào cache trên disk)"""
+        profile = build_profile(self.resource_profile)
+        if self.tile_plan is not None:
+            cap = CONFIG.tile_threshold_mp * 1_000_000
+            profile = profile._replace(area=min(profile.area or cap, cap))
+        return profile
+
+    def _is_tiled(self, width: int, height: int) -> bool:
+        return self.tile_plan is not None and width * height >= CONFIG.tile_threshold_mp * 1_000_000
+
+    def _manifest_keys(self, rel_file: str) -> List[str]:
+        """Các key manifest ứng với 1 file input (1 output -> 1 key)"""
+        return [rel_file]
+
+    def _open_journal(self, tasks: List[FileTask], plan_hash: str) -> List[FileTask]:
+        """Mở journal, bỏ qua các file đã xong ở lần chạy dang dở trước (không stat output)"""
+        if not self.use_journal:
+            return tasks
+        try:
+            # Có OutputSyncer -> journal chỉ fsync tại checkpoint (sau khi output đã fsync)
+            self.journal = BatchJournal.for_job(self.input_dir, self.output_dir,
+                                                fsync_every=0 if self.fsync_every else 64)
+            completed = self.journal.open(plan_hash, resume=self.resume)
+        except OSError as e:
+            self.journal = None
+            self.on_log(f"⚠️ Không thể mở journal (resume sẽ không khả dụng): {e}")
+            return tasks
+
+        if not completed:
+            return tasks
+        remaining = [t for t in tasks if t.rel_file not in completed]
+        self.resumed_count = len(tasks) - len(remaining)
+        self.done_count = self.resumed_count
+        self.on_log(f"↩️ Resume: {self.resumed_count} file đã xong ở lần chạy trước, còn {len(remaining)} file\n")
+        return remaining
+
+    def stop(self):
+        """Dừng processing (các file đang xử lý dở vẫn được hoàn tất)"""
+        self.is_running = False
+
+    def summary(self, elapsed_s: float = 0.0) -> dict:
+        return {
+            "total": self.total,
+            "processed": self.processed_count,
+            "skipped": self.skipped_count,
+            "failed": self.failed_count,
+            "resumed": self.resumed_count,
+            "stopped": not self.is_running,
+            "elapsed_s": round(elapsed_s, 3),
+            **self._target_summary(),
+        }
+
+    def _target_summary(self) -> dict:
+        """Thống kê -target-size (rỗng nếu batch không dùng)"""
+        predictor = self.quality_predictor
+        if not predictor.images:
+            return {}
+        return {"target_images": predictor.images,
+                "encodes_per_image": round(predictor.average_encodes, 2),
+                "target_missed": predictor.missed}
+
+    # --- Pool ---
+    def _run_pool(self, tasks: List[FileTask], operations):
+        """Chia task cho N thread (Wand gọi C qua ctypes nên nhả GIL khi xử lý)"""
+        budget, costs = self._plan_memory(tasks, operations)
+        if budget:
+            tasks = order_by_cost(tasks, costs)
+
+        task_queue = queue.Queue()
+        for task in tasks:
+            task_queue.put(task)
+
+        def worker_loop(worker_id):
+            TRACER.name_thread(f"BatchEngine-{worker_id}")
+            while self.is_running:
+                # Worker vượt quá số đang cho phép (autoscale) -> tạm nghỉ
+                if worker_id >= self._active_workers:
+                    with self._scale_cond:
+                        self._scale_cond.wait(timeout=0.25)
+                    if task_queue.empty():
+                        return
+                    continue
+                try:
+                    task = task_queue.get_nowait()
+                except queue.Empty:
+                    return
+                cost = costs.get(task.index, 0)
+                if budget:
+                    wait_start = time.perf_counter()
+                    with TRACER.span("memory_wait", "batch", cost_mb=cost >> 20):
+                        if not budget.acquire(cost, lambda: self.is_running):
+                            return
+                    with self._lock:
+                        self._wait_sum += time.perf_counter() - wait_start
+                try:
+                    self._run_task(task, operations)
+                finally:
+                    if budget:
+                        budget.release(cost)
+
+        pool_size = self._pool_size()
+        if pool_size == 1:
+            worker_loop(0)
+            return
+
+        finished = threading.Event()
+        threads = [threading.Thread(target=worker_loop, args=(i,), daemon=True) for i in range(pool_size)]
+        if self.autoscale:
+            threads.append(threading.Thread(target=self._autoscale_loop, args=(finished,), daemon=True))
+        for t in threads:
+            t.start()
+        try:
+            for t in threads[:pool_size]:
+                t.join()
+        except KeyboardInterrupt:
+            # Ctrl+C (CLI): không nhận task mới, đợi các file đang ghi dở hoàn tất
+            self.stop()
+            for t in threads[:pool_size]:
+                t.join()
+            raise
+        finally:
+            finished.set()
+
+        if budget:
+            self.on_log(f"🧠 RAM ước lượng cao nhất cùng lúc: {budget.peak_in_use / 2**20:.0f} MB")
+
+    def _pool_size(self) -> int:
+        """Số thread tạo ra: autoscale tạo sẵn tối đa, chỉ cho _active_workers thread nhận việc"""
+        return self.max_workers if self.autoscale else self.workers
+
+    # --- Autoscale ---
+    def _autoscale_loop(self, finished: threading.Event):
+        """Định kỳ đo CPU/throughput/latency và điều chỉnh số worker đang hoạt động"""
+        TRACER.name_thread("BatchEngine-autoscale")
+        scaler = Autoscaler(1, self.max_workers, self.workers)
+        meter = CpuMeter()
+        with self._lock:
+            last_done, last_latency, last_wait = self.done_count, self._latency_sum, self._wait_sum
+        last_time = time.monotonic()
+        self.on_log(f"📈 Autoscale: bắt đầu với {scaler.current} worker (tối đa {self.max_workers})")
+
+        while not finished.wait(CONFIG.autoscale_interval_s):
+            now = time.monotonic()
+            with self._lock:
+                done, latency_sum, wait_sum = self.done_count, self._latency_sum, self._wait_sum
+            files = done - last_done
+            sample = PoolSample(
+                workers=self._active_workers,
+                cpu_util=meter.sample(),
+                throughput=files / (now - last_time) if now > last_time else 0.0,
+                latency_s=(latency_sum - last_latency) / files if files else 0.0,
+                wait_s=(wait_sum - last_wait) / files if files else 0.0,
+            )
+            last_done, last_latency, last_wait, last_time = done, latency_sum, wait_sum, now
+
+            new_size = scaler.step(sample)
+            if new_size != self._active_workers:
+                self.on_log(f"📈 Autoscale: {self._active_workers} → {new_size} worker "
+                            f"(CPU {sample.cpu_util:.0%}, {sample.throughput:.2f} file/s, "
+                            f"{sample.latency_s * 1000:.0f} ms/file, chờ RAM {sample.wait_s * 1000:.0f} ms)")
+                with self._scale_cond:
+                    self._active_workers = new_size
+                    self._scale_cond.notify_all()
+
+        self.on_log(f"📈 Autoscale: kết thúc với {self._active_workers} worker")
+
+    # --- Memory budget ---
+    def _plan_memory(self, tasks: List[FileTask], operations) -> Tuple[Optional[MemoryBudget], Dict[int, int]]:
+        """
+        Ping kích thước từng file (song song) và ước lượng RAM đỉnh theo chuỗi lệnh.
+        Chỉ bật khi chạy nhiều worker: 1 worker thì không có gì để điều phối.
+        """
+        if self._pool_size() <= 1 or self.memory_budget_mb < 0 or not tasks:
+            return None, {}
+        budget_bytes = self.memory_budget_mb * 2**20 if self.memory_budget_mb > 0 else default_budget_bytes()
+        if budget_bytes <= 0:
+            self.on_log("⚠️ Không đọc được dung lượng RAM -> tắt ngân sách RAM "
+                        "(đặt memory_budget_mb trong config để bật lại)")
+            return None, {}
+
+        bpp = bytes_per_pixel()
+        if self.use_metadata_index:
+            self._load_metadata(tasks)
+            costs = {}
+            for task in tasks:
+                meta = self.metadata.get(task.rel_file)
+                # Không đọc được header -> lỗi sẽ được báo khi xử lý thật
+                costs[task.index] = self._estimate_cost(meta.width, meta.height, operations, bpp) if meta else 0
+        else:
+            def estimate(task: FileTask) -> Tuple[int, int]:
+                if not self.is_running:
+                    return task.index, 0
+                try:
+                    width, height = self._probe(self._get_input_path(task.rel_path, task.filename))
+                except Exception:
+                    return task.index, 0  # Lỗi sẽ được báo khi xử lý thật
+                return task.index, self._estimate_cost(width, height, operations, bpp)
+
+            with TRACER.span("memory_plan", "batch", files=len(tasks)):
+                with ThreadPoolExecutor(max_workers=self._pool_size()) as pool:
+                    costs = dict(pool.map(estimate, tasks))
+
+        largest = max(costs.values(), default=0)
+        self.on_log(f"🧠 Ngân sách RAM: {budget_bytes / 2**20:.0f} MB "
+                    f"(file nặng nhất ~{largest / 2**20:.0f} MB, chạy file lớn trước)")
+        return MemoryBudget(budget_bytes), costs
+
+    def _load_metadata(self, tasks: List[FileTask]):
+        """Đọc header từ index (chỉ ping file mới/đã đổi, song song)"""
+        try:
+            with MetadataIndex() as index:
+                self.metadata, pinged = index_files(index, self.input_dir, [t.rel_file for t in tasks],
+                                                    workers=self._pool_size(),
+                                                    should_continue=lambda: self.is_running)
+        except Exception as e:
+            # Index chỉ để tăng tốc: lỗi sqlite/đĩa -> chạy như không có index
+            self.on_log(f"⚠️ Không dùng được metadata index: {e}")
+            self.metadata = {}
+            return
+        self.on_log(f"🗂️ Metadata: {len(self.metadata)} file ({pinged} file mới đọc header)")
+
+    def _estimate_cost(self, width: int, height: int, operations, bpp: int) -> int:
+        """RAM đỉnh ước lượng khi xử lý 1 file (bytes)"""
+        if self._is_tiled(width, height):
+            return tile_cost_bytes(width, self.tile_plan, bpp)
+        return estimate_peak_bytes(width, height, operations, bpp)
+
+    def _run_task(self, task: FileTask, operations):
+        with TRACER.span("file", "batch", index=task.index):
+            result = self.process_file(task, operations)
+        self._record(result)
+
+    def _record(self, result: FileResult):
+        """Cập nhật bộ đếm và báo kết quả ra ngoài"""
+        with self._lock:
+            if result.status == STATUS_OK:
+                self.processed_count += 1
+            elif result.status == STATUS_SKIPPED:
+                self.skipped_count += 1
+            else:
+                self.failed_count += 1
+            self.done_count += 1
+            self._latency_sum += result.elapsed_s
+            done = self.done_count
+        if result.status != STATUS_FAILED:
+            if self.archive_writer:
+                self.archive_writer.add_done(result.task.rel_file)
+            elif self.syncer:
+                self.syncer.add_done(result.task.rel_file)
+            elif self.journal:
+                self.journal.record(result.task.rel_file)
+        self.on_result(result, done, self.total)
+
+    def _on_checkpoint(self, rel_files: List[str]):
+        """Output của các file này đã fsync (hoặc part archive đã đóng) -> giờ mới ghi journal"""
+        if not self.journal:
+            return
+        for rel_file in rel_files:
+            self.journal.record(rel_file)
+        self.journal.sync()
+
+    # --- Xử lý 1 file ---
+    def process_file(self, task: FileTask, operations) -> FileResult:
+        """Xử lý một file ảnh với atomic write"""
+        start = time.perf_counter()
+        input_path = self._get_input_path(task.rel_path, task.filename)
+        output_subfolder = self._get_output_folder(task.rel_path)
+        out_path, out_filename = get_output_path(input_path, output_subfolder, self.target_format)
+
+        log_prefix = f"[{task.index + 1}/{self.total or 1}] {input_path.name}"
+
+        def result(status, message, size_bytes=0):
+            return FileResult(task, status, f"{log_prefix}{message}", input_path,
+                              out_path if status == STATUS_OK else None,
+                              size_bytes, time.perf_counter() - start)
+
+        if self.overwrite_mode == "skip" and out_path.exists():
+            return result(STATUS_SKIPPED, " ... ⏭️ SKIPPED (already exists)")
+        if self.manifest:
+            try:
+                if self.manifest.is_unchanged(task.rel_file, input_path, self.plan_hash, out_path):
+                    return result(STATUS_SKIPPED, " ... ⏭️ SKIPPED (unchanged)")
+            except OSError:
+                pass  # Không stat/đọc được input -> để bước xử lý báo lỗi cụ thể
+
+        try:
+            # === BƯỚC 1: VALIDATION VỚI PING ===
+            width, height = self._probe(input_path, task.rel_file)
+
+            # === BƯỚC 2: DECODE + ÁP DỤNG LỆNH ===
+            with TRACER.span("decode", "batch"):
+                img = self._open_input(input_path)
+            if self._is_tiled(width, height) and can_tile(img):
+                # Ảnh cực lớn: xử lý theo tile (hàm tự close img sau khi stage)
+                size_bytes, note = self._process_tiled(img, out_path, input_path)
+            else:
+                with img:
+                    CommandParser.apply_commands(img, operations)
+
+                    # === BƯỚC 3+4: GHI AN TOÀN VỚI ATOMIC WRITE ===
+                    size_bytes, note = self._write_atomic(img, out_path, input_path)
+
+            if self.manifest:
+                self.manifest.update(task.rel_file, input_path, self.plan_hash, out_path)
+            return result(STATUS_OK, f" -> {out_filename} ({size_bytes / 1024:.1f} KB){note} ... ✓ OK", size_bytes)
+
+        except Exception as e:
+            return result(STATUS_FAILED, self._error_message(e))
+
+    def _probe(self, input_path: Path, rel_file: Optional[str] = None) -> Tuple[int, int]:
+        """
+        Đọc kích thước bằng ping (chỉ đọc header), hoặc lấy từ metadata index nếu đã có.
+        Raise InvalidImageError nếu ảnh 1x1.
+        """
+        meta = self.metadata.get(rel_file) if rel_file else None
+        if meta is not None:
+            width, height = meta.width, meta.height
+        else:
+            with TRACER.span("ping", "batch"):
+                if self.input_archive:
+                    ping = WandImage.ping(blob=self._read_member(input_path))
+                else:
+                    ping = WandImage.ping(filename=str(input_path))
+                with ping as ping_img:
+                    width, height = ping_img.width, ping_img.height
+        if width <= 1 or height <= 1:
+            raise InvalidImageError("INVALID SIZE (1x1)")
+        return width, height
+
+    def _decode(self, input_path: Path, rel_file: Optional[str] = None) -> WandImage:
+        """Kiểm tra header bằng ping (hoặc metadata index) rồi decode cả ảnh"""
+        self._probe(input_path, rel_file)
+        with TRACER.span("decode", "batch"):
+            return self._open_input(input_path)
+
+    def _open_input(self, input_path: Path) -> WandImage:
+        if self.input_archive:
+            blob = self._read_member(input_path)
+            self._input_cache.path = self._input_cache.blob = None  # Decode xong không cần giữ
+            return WandImage(blob=blob)
+        return WandImage(filename=str(input_path))
+
+    def _process_tiled(self, img, out_path: Path, input_path: Path) -> Tuple[int, str]:
+        """
+        Stage ảnh đã decode thành MPC, xử lý theo tile ghi ra PAM, rồi encode sang format output.
+        File tạm nằm trong folder output (cùng ổ -> os.replace được), xóa khi xong.
+        """
+        plan = self.tile_plan
+        work_dir = None
+        try:
+            with img:
+                work_dir = Path(tempfile.mkdtemp(prefix=".imtool-tiles-", dir=out_path.parent))
+                staged = stage_image(img, work_dir)
+            tiled = process_tiles(staged, plan, work_dir / "output.pam", lambda: self.is_running)
+            note = f" [tile {tile_edge(plan)}px, halo {plan.halo}px]"
+
+            if out_path.suffix.lower() == '.pam' and not plan.encode_ops and not self.archive_writer:
+                # Output PAM: file ghép chính là kết quả, không encode lại
+                with TRACER.span("write", "batch"):
+                    size_bytes = tiled.path.stat().st_size
+                    os.replace(str(tiled.path), str(out_path))
+                if self.syncer:
+                    self.syncer.add_output(out_path)
+                return size_bytes, note
+
+            with TRACER.span("decode", "batch", source="pam"):
+                output = open_tiled_output(tiled, staged)
+            with output:
+                CommandParser.apply_commands(output, plan.encode_ops)
+                size_bytes, encode_note = self._write_atomic(output, out_path, input_path,
+                                                             stream=not self.archive_writer)
+            return size_bytes, encode_note + note
+        finally:
+            if work_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _read_member(self, input_path: Path) -> bytes:
+        """Bytes của member trong archive (giữ lại blob gần nhất của thread để ping + decode chỉ đọc 1 lần)"""
+        cache = self._input_cache
+        if getattr(cache, 'path', None) != input_path:
+            cache.blob = self.input_archive.read(input_path.relative_to(self.input_dir).as_posix())
+            cache.path = input_path
+        return cache.blob
+
+    def _write_atomic(self, img, out_path: Path, input_path: Path,
+                      predictor: Optional[QualityPredictor] = None, stream: bool = False) -> Tuple[int, str]:
+        """
+        Encode vào RAM (make_blob) -> 1 lần write ra file .tmp -> os.replace sang out_path.
+        Trên ổ mạng tránh được nhiều lượt ghi nhỏ của encoder và 1 lần stat() chỉ để lấy dung lượng.
+        stream=True: để ImageMagick encode thẳng ra .tmp (ảnh tile quá lớn để giữ cả blob trong RAM).
+
+        Returns: (kích thước file (bytes), ghi chú cho log - VD: quality tìm được với -target-size)
+        """
+        output_format = img.format or input_path.suffix.lstrip('.').upper()
+        temp_output = out_path.with_suffix(out_path.suffix + '.tmp')
+        note = ""
+
+        target = target_size_of(img)
+        if target and output_format.upper() in LOSSY_FORMATS:
+            with TRACER.span("encode_target", "batch", format=output_format, target=target):
+                encoded = encode_to_target(img, target, predictor or self.quality_predictor)
+            blob = encoded.blob
+            note = f" [q{encoded.quality}, {encoded.encodes} encode{'' if encoded.met else ', ⚠ vượt mục tiêu'}]"
+        elif stream:
+            return self._save_atomic(img, out_path, temp_output, output_format), note
+        else:
+            with TRACER.span("encode", "batch", format=output_format):
+                blob = img.make_blob(output_format)
+
+        if self.archive_writer:
+            # Blob đi thẳng vào archive, giữ cấu trúc folder tương đối
+            self.archive_writer.add(out_path.relative_to(self.output_dir).as_posix(), blob)
+            return len(blob), note
+
+        with TRACER.span("write", "batch", bytes=len(blob)):
+            try:
+                with open(temp_output, 'wb', buffering=CONFIG.write_buffer_bytes) as f:
+                    f.write(blob)
+            except BaseException:
+                temp_output.unlink(missing_ok=True)
+                raise
+            # os.replace() là atomic operation
+            os.replace(str(temp_output), str(out_path))
+        if self.syncer:
+            self.syncer.add_output(out_path)
+        return len(blob), note
+
+    def _save_atomic(self, img, out_path: Path, temp_output: Path, output_format: str) -> int:
+        """Encode + ghi disk trong 1 lệnh của ImageMagick (không giữ blob trong RAM)"""
+        try:
+            with TRACER.span("encode", "batch", format=output_format, stream=True):
+                img.save(filename=f"{output_format}:{temp_output}")
+        except BaseException:
+            temp_output.unlink(missing_ok=True)
+            raise
+        with TRACER.span("write", "batch"):
+            size_bytes = temp_output.stat().st_size
+            os.replace(str(temp_output), str(out_path))
+        if self.syncer:
+            self.syncer.add_output(out_path)
+        return size_bytes
+
+    @staticmethod
+    def _error_message(error: Exception) -> str:
+        """Chuyển exception thành thông báo lỗi ngắn gọn cho log"""
+        if isinstance(error, InterruptedError):
+            return " ... ⏹️ STOPPED"
+        if isinstance(error, InvalidImageError):
+            return f" ... ✖ {error}"
+        if isinstance(error, (BlobError, CorruptImageError)):
+            return " ... ✖ CORRUPT FILE"
+        if isinstance(error, MissingDelegateError):
+            return " ... ✖ UNSUPPORTED FORMAT"
+        if isinstance(error, FileNotFoundError):
+            return " ... ✖ FILE NOT FOUND"
+        if isinstance(error, PermissionError):
+            return " ... ✖ PERMISSION DENIED"
+        return f" ... ✖ ERROR: {str(error)}"
+
+    # === Helper Methods ===
+    def _log_start(self, total):
+        """Log thông tin bắt đầu"""
+        self.on_log(f"Bắt đầu xử lý {total} file...")
+        self.on_log(f"Lệnh: {self.command_string}")
+        if self.workers > 1:
+            self.on_log(f"🧵 Số worker: {self.workers}")
+
+        if self.archive:
+            split = f", tách mỗi {self.archive_split_mb} MB" if self.archive_split_mb else ""
+            self.on_log(f"📦 Ghi output vào archive .{self.archive}{split}")
+
+        if self.overwrite_mode == "incremental":
+            self.on_log(f"🔁 Chế độ incremental: chỉ xử lý file mới/thay đổi{' (so sánh hash)' if self.hash_inputs else ''}")
+
+        if self.tile_plan is not None:
+            self.on_log(f"🧩 Ảnh ≥ {CONFIG.tile_threshold_mp} MP xử lý theo tile {tile_edge(self.tile_plan)}px "
+                        f"(halo {self.tile_plan.halo}px)")
+
+        if self.target_format:
+            self.on_log(f"📋 Định dạng output: .{self.target_format}\n")
+        else:
+            self.on_log("📋 Định dạng output: Giữ nguyên\n")
+
+    def _log_finish(self, total):
+        """Log thống kê cuối cùng"""
+        finished = self.processed_count + self.resumed_count
+        success_rate = (finished / total * 100) if total > 0 else 0
+
+        self.on_log(f"\n{'='*50}")
+        self.on_log(f"✓ Hoàn thành: {finished}/{total} file ({success_rate:.1f}%)")
+
+        if self.resumed_count > 0:
+            self.on_log(f"↩️ Từ lần chạy trước: {self.resumed_count} file")
+
+        if self.skipped_count > 0:
+            self.on_log(f"⏭️ Bỏ qua: {self.skipped_count} file (đã tồn tại/không đổi)")
+        if self.failed_count > 0:
+            self.on_log(f"⚠ Lỗi: {self.failed_count} file (corrupt/invalid/unsupported)")
+        target = self._target_summary()
+        if target:
+            missed = f", {target['target_missed']} ảnh vượt mục tiêu" if target['target_missed'] else ""
+            self.on_log(f"🎯 Target size: {target['target_images']} ảnh, "
+                        f"trung bình {target['encodes_per_image']:.2f} lần encode/ảnh{missed}")
+
+        self.on_log(f"{'='*50}")
+
+    def _get_output_folder(self, rel_path):
+        """Tạo output folder giữ nguyên cấu trúc"""
+        output_subfolder = self.output_dir / rel_path if rel_path else self.output_dir
+        if rel_path not in self._created_folders and not self.archive:
+            output_subfolder.mkdir(parents=True, exist_ok=True)
+            self._created_folders.add(rel_path)
+        return output_subfolder
+
+    def _get_input_path(self, rel_path, filename):
+        """Lấy đường dẫn input"""
+        return self.input_dir / rel_path / filename if rel_path else self.input_dir / filename
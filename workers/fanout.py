@@ -0,0 +1,172 @@
+# workers/fanout.py
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from core.parser import CommandParser
+from utils import TRACER
+from .engine import (BatchEngine, FileTask, FileResult, STATUS_OK, STATUS_SKIPPED, STATUS_FAILED,
+                     format_from_operations, get_output_path)
+from .scheduler import estimate_peak_bytes
+from .target_size import QualityPredictor
+
+# ==============================================
+# FAN-OUT (1 lần decode -> nhiều bản output)
+# ==============================================
+class Rendition(NamedTuple):
+    """1 phiên bản output: tên (= subfolder trong output) + chuỗi lệnh"""
+    name: str
+    command_string: str
+
+
+class _Branch(NamedTuple):
+    rendition: Rendition
+    operations: List[Tuple[str, Optional[str]]]  # Phần lệnh riêng (sau điểm rẽ nhánh)
+    target_format: Optional[str]
+    plan_hash: str                               # Hash của toàn bộ lệnh (prefix + nhánh)
+
+
+class FanOutPlan(NamedTuple):
+    prefix: List[Tuple[str, Optional[str]]]      # Phần lệnh chung, chạy 1 lần trước khi rẽ nhánh
+    branches: List[_Branch]
+
+
+def compile_renditions(renditions: List[Rendition]) -> FanOutPlan:
+    """Parse các rendition và tách phần lệnh đầu giống nhau ra làm prefix chung"""
+    plans = [CommandParser.parse(r.command_string) for r in renditions]
+    split = CommandParser.common_prefix_length(plans)
+    branches = [
+        _Branch(r, ops[split:], format_from_operations(ops), CommandParser.plan_hash(ops))
+        for r, ops in zip(renditions, plans)
+    ]
+    return FanOutPlan(plans[0][:split] if plans else [], branches)
+
+
+class RenditionEngine(BatchEngine):
+    """
+    BatchEngine cho nhiều rendition (VD: thumb / medium / full):
+    mỗi input chỉ decode 1 lần, chạy phần lệnh chung, rồi clone() cho từng nhánh.
+    Output của rendition 'thumb' nằm ở <output>/thumb/<cấu trúc folder gốc>.
+    """
+    def __init__(self, file_structure: Dict[str, List[str]],
+                 input_dir: Path, output_dir: Path, renditions: List[Rendition], **kwargs):
+        if not renditions:
+            raise ValueError("Cần ít nhất 1 rendition")
+        names = [r.name for r in renditions]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Tên rendition bị trùng: {', '.join(names)}")
+
+        command_string = " | ".join(f"{r.name}: {r.command_string}" for r in renditions)
+        super().__init__(file_structure, input_dir, output_dir, command_string, **kwargs)
+        self.renditions = list(renditions)
+        self.target_format = None  # Mỗi nhánh có format riêng
+        # -target-size: mỗi rendition học quality riêng (kích thước/mục tiêu khác nhau)
+        self.branch_predictors = {r.name: QualityPredictor() for r in self.renditions}
+
+    # --- Hooks của BatchEngine ---
+    def _compile_plan(self):
+        plan = compile_renditions(self.renditions)
+        combined = [("@rendition", b.rendition.name + ":" + b.plan_hash) for b in plan.branches]
+        return plan, CommandParser.plan_hash(combined)
+
+    def _plan_tiling(self, operations):
+        # Fan-out cần cả ảnh đã decode để clone cho từng nhánh
+        return None
+
+    def _estimate_cost(self, width: int, height: int, plan: FanOutPlan, bpp: int) -> int:
+        # Ảnh sau prefix được giữ lại trong lúc chạy từng nhánh (clone) -> cộng thêm 1 bản
+        branch_peak = max(estimate_peak_bytes(width, height, plan.prefix + b.operations, bpp)
+                          for b in plan.branches)
+        return branch_peak + width * height * bpp
+
+    def _manifest_keys(self, rel_file: str) -> List[str]:
+        return [self._manifest_key(r.name, rel_file) for r in self.renditions]
+
+    @staticmethod
+    def _manifest_key(name: str, rel_file: str) -> str:
+        return f"{name}\t{rel_file}"
+
+    def _log_start(self, total):
+        self.on_log(f"Bắt đầu xử lý {total} file -> {len(self.renditions)} rendition...")
+        plan = compile_renditions(self.renditions)
+        if plan.prefix:
+            shared = " ".join(f"-{cmd}" + (f" {value}" if value else "") for cmd, value in plan.prefix)
+            self.on_log(f"🔗 Lệnh chung (chạy 1 lần/ảnh): {shared}")
+        for branch in plan.branches:
+            fmt = f".{branch.target_format}" if branch.target_format else "giữ nguyên"
+            self.on_log(f"   • {branch.rendition.name}: {branch.rendition.command_string} (output: {fmt})")
+        if self.workers > 1:
+            self.on_log(f"🧵 Số worker: {self.workers}")
+        self.on_log("")
+
+    def _target_summary(self) -> dict:
+        # Gộp thống kê -target-size của các rendition
+        predictors = [p for p in self.branch_predictors.values() if p.images]
+        if not predictors:
+            return {}
+        images = sum(p.images for p in predictors)
+        return {"target_images": images,
+                "encodes_per_image": round(sum(p.encodes for p in predictors) / images, 2),
+                "target_missed": sum(p.missed for p in predictors)}
+
+    # --- Xử lý 1 file ---
+    def process_file(self, task: FileTask, plan: FanOutPlan) -> FileResult:
+        """Decode 1 lần -> prefix -> clone cho từng nhánh -> ghi atomic từng output"""
+        start = time.perf_counter()
+        input_path = self._get_input_path(task.rel_path, task.filename)
+        log_prefix = f"[{task.index + 1}/{self.total or 1}] {input_path.name}"
+
+        def result(status, message, out_path=None, size_bytes=0):
+            return FileResult(task, status, f"{log_prefix}{message}", input_path,
+                              out_path, size_bytes, time.perf_counter() - start)
+
+        # Chỉ giữ các nhánh cần làm (bỏ nhánh đã có output theo skip/incremental)
+        pending = []
+        for branch in plan.branches:
+            name = branch.rendition.name
+            subfolder = self._get_output_folder(str(Path(name) / task.rel_path) if task.rel_path else name)
+            out_path, out_filename = get_output_path(input_path, subfolder, branch.target_format)
+            if self.overwrite_mode == "skip" and out_path.exists():
+                continue
+            if self.manifest:
+                try:
+                    key = self._manifest_key(name, task.rel_file)
+                    if self.manifest.is_unchanged(key, input_path, branch.plan_hash, out_path):
+                        continue
+                except OSError:
+                    pass
+            pending.append((branch, out_path, out_filename))
+
+        if not pending:
+            return result(STATUS_SKIPPED, " ... ⏭️ SKIPPED (all renditions up to date)")
+
+        written = []
+        total_bytes = 0
+        try:
+            with self._decode(input_path, task.rel_file) as img:
+                CommandParser.apply_commands(img, plan.prefix)
+
+                for i, (branch, out_path, out_filename) in enumerate(pending):
+                    # Nhánh cuối dùng luôn ảnh gốc, không cần clone
+                    is_last = i == len(pending) - 1
+                    with TRACER.span("branch", "batch", rendition=branch.rendition.name):
+                        branch_img = img if is_last else img.clone()
+                        try:
+                            CommandParser.apply_commands(branch_img, branch.operations)
+                            size_bytes, note = self._write_atomic(
+                                branch_img, out_path, input_path, self.branch_predictors[branch.rendition.name])
+                        finally:
+                            if not is_last:
+                                branch_img.close()
+
+                    if self.manifest:
+                        key = self._manifest_key(branch.rendition.name, task.rel_file)
+                        self.manifest.update(key, input_path, branch.plan_hash, out_path)
+                    total_bytes += size_bytes
+                    written.append(f"{branch.rendition.name}/{out_filename} ({size_bytes / 1024:.1f} KB){note}")
+
+            return result(STATUS_OK, f" -> {', '.join(written)} ... ✓ OK", pending[0][1], total_bytes)
+
+        except Exception as e:
+            done = f" [đã ghi: {', '.join(written)}]" if written else ""
+            return result(STATUS_FAILED, self._error_message(e) + done)
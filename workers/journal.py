@@ -0,0 +1,146 @@
+# workers/journal.py
+import os
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional, Set
+
+# ==========================
+# JOB JOURNAL (Resume batch)
+# ==========================
+# Thư mục chứa dữ liệu trạng thái của tool bên trong output folder
+STATE_DIR_NAME = ".imtool"
+
+DONE_MARKER = "#done"
+
+
+class BatchJournal:
+    """
+    Journal append-only ghi lại các file input đã xử lý XONG (output đã os.replace).
+
+    Định dạng (mỗi dòng 1 entry, kết thúc bằng '\\n'):
+        <plan_hash>\\t<rel_input_path>
+        #done\\t<plan_hash>            <- job đã chạy hết, lần sau chạy lại từ đầu
+
+    - Dòng cuối bị ghi dở (app bị terminate giữa chừng) không có '\\n' -> bị bỏ qua.
+    - Entry chỉ được ghi SAU khi file output đã rename atomic -> không bao giờ
+      nhầm file ghi dở là file đã xong.
+    - Resume chỉ dựa vào journal, không cần stat lại toàn bộ output folder.
+    - fsync_every=0: không tự fsync, chỉ fsync khi gọi sync()/close() (dùng với OutputSyncer).
+    """
+    def __init__(self, path: Path, fsync_every: int = 64):
+        self.path = Path(path)
+        self.fsync_every = max(0, fsync_every)
+        self.plan_hash: Optional[str] = None
+        self._file = None
+        self._pending_sync = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def job_id(input_dir: Path, output_dir: Path) -> str:
+        """Định danh job theo cặp (input, output)"""
+        key = f"{Path(input_dir).resolve()}\n{Path(output_dir).resolve()}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+    @classmethod
+    def for_job(cls, input_dir: Path, output_dir: Path, **kwargs) -> 'BatchJournal':
+        path = Path(output_dir) / STATE_DIR_NAME / f"journal-{cls.job_id(input_dir, output_dir)}.log"
+        return cls(path, **kwargs)
+
+    # --- Đọc ---
+    def load(self, plan_hash: str) -> Set[str]:
+        """Danh sách file đã xong của lần chạy dang dở gần nhất với cùng plan_hash"""
+        completed: Set[str] = set()
+        if not self.path.exists():
+            return completed
+        try:
+            with open(self.path, 'r', encoding='utf-8', newline='\n') as f:
+                data = f.read()
+        except OSError:
+            return completed
+
+        lines = data.split('\n')
+        # Phần tử cuối là dòng ghi dở (hoặc chuỗi rỗng nếu file kết thúc bằng '\n')
+        for line in lines[:-1]:
+            entry_hash, _, rel_file = line.partition('\t')
+            if entry_hash == DONE_MARKER:
+                if rel_file == plan_hash:
+                    completed.clear()
+                continue
+            if entry_hash == plan_hash and rel_file:
+                completed.add(rel_file)
+        return completed
+
+    @classmethod
+    def peek(cls, input_dir: Path, output_dir: Path, plan_hash: str) -> int:
+        """Số file đã xong của job dang dở (0 nếu không có gì để resume)"""
+        return len(cls.for_job(input_dir, output_dir).load(plan_hash))
+
+    # --- Ghi ---
+    def open(self, plan_hash: str, resume: bool = True) -> Set[str]:
+        """
+        Mở journal để ghi tiếp.
+        Returns: tập file đã xong (rỗng nếu không resume).
+        """
+        self.plan_hash = plan_hash
+        completed = self.load(plan_hash) if resume else set()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if completed:
+            self._file = open(self.path, 'a', encoding='utf-8', newline='\n')
+            self._terminate_partial_line()
+        else:
+            # Job mới -> bắt đầu journal sạch (không để file phình mãi)
+            self._file = open(self.path, 'w', encoding='utf-8', newline='\n')
+        return completed
+
+    def _terminate_partial_line(self):
+        """Nếu dòng cuối bị ghi dở, thêm '\\n' để entry tiếp theo không bị dính vào"""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return
+                f.seek(-1, os.SEEK_END)
+                last = f.read(1)
+            if last != b'\n':
+                self._file.write('\n')
+        except OSError:
+            pass
+
+    def record(self, rel_file: str):
+        """Ghi nhận 1 file đã xong (thread-safe)"""
+        if not self._file or '\n' in rel_file:
+            return
+        with self._lock:
+            self._file.write(f"{self.plan_hash}\t{rel_file}\n")
+            self._file.flush()
+            self._pending_sync += 1
+            if self.fsync_every and self._pending_sync >= self.fsync_every:
+                self._sync()
+
+    def sync(self):
+        """fsync các entry đã ghi (checkpoint)"""
+        if not self._file:
+            return
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        try:
+            os.fsync(self._file.fileno())
+        except OSError:
+            pass
+        self._pending_sync = 0
+
+    def close(self, completed: bool = False):
+        """Đóng journal. completed=True -> đánh dấu job đã xong trọn vẹn."""
+        if not self._file:
+            return
+        with self._lock:
+            if completed:
+                self._file.write(f"{DONE_MARKER}\t{self.plan_hash}\n")
+                self._file.flush()
+            self._sync()
+            self._file.close()
+            self._file = None
@@ -0,0 +1,137 @@
+# workers/manifest.py
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from .journal import STATE_DIR_NAME
+
+# ====================================
+# MANIFEST (Batch incremental)
+# ====================================
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path: Path) -> str:
+    """Hash nội dung file (blake2b, đọc theo chunk 1MB)"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BatchManifest:
+    """
+    Ghi lại "dấu vân tay" của từng input đã tạo ra output:
+        rel_input -> {size, mtime_ns, hash, plan, output}
+
+    Lần chạy sau (overwrite_mode="incremental") chỉ xử lý file khi:
+    - input đổi (size/mtime khác, hoặc hash khác nếu bật use_hash), hoặc
+    - lệnh đổi (plan hash khác), hoặc
+    - file output đã bị xóa.
+
+    Lưu dạng JSON vào <output>/.imtool/manifest.json, ghi atomic (tmp + os.replace)
+    theo chu kỳ save_interval_s giây và khi close().
+    """
+    def __init__(self, path: Path, use_hash: bool = False, save_interval_s: float = 10.0):
+        self.path = Path(path)
+        self.use_hash = use_hash
+        self.save_interval_s = save_interval_s
+        self.entries: Dict[str, dict] = {}
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_output(cls, output_dir: Path, **kwargs) -> 'BatchManifest':
+        return cls(Path(output_dir) / STATE_DIR_NAME / MANIFEST_NAME, **kwargs)
+
+    # --- Đọc / Ghi file ---
+    def load(self) -> 'BatchManifest':
+        if not self.path.exists():
+            return self
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = dict(data.get("entries", {}))
+        except (OSError, ValueError) as e:
+            # Manifest hỏng -> coi như chưa có, lần này xử lý lại toàn bộ
+            print(f"[!] Manifest lỗi, bỏ qua: {e}")
+        return self
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self.entries)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": snapshot}, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def close(self, keep: Optional[Iterable[str]] = None):
+        """Lưu manifest. keep: danh sách input hiện có -> xóa entry của file đã bị xóa khỏi input."""
+        if keep is not None:
+            keep = set(keep)
+            with self._lock:
+                stale = [k for k in self.entries if k not in keep]
+                for k in stale:
+                    del self.entries[k]
+                self._dirty = self._dirty or bool(stale)
+        self.save()
+
+    # --- Kiểm tra / Cập nhật ---
+    def is_unchanged(self, rel_file: str, input_path: Path, plan_hash: str, out_path: Path) -> bool:
+        """True nếu input, lệnh và output đều không đổi so với lần xử lý trước"""
+        entry = self.entries.get(rel_file)
+        if not entry or entry.get("plan") != plan_hash:
+            return False
+        if not out_path.exists() or entry.get("output") != out_path.name:
+            return False
+
+        st = input_path.stat()
+        if st.st_size != entry.get("size"):
+            return False
+        if st.st_mtime_ns == entry.get("mtime_ns"):
+            return True
+
+        # mtime đổi nhưng size giữ nguyên (copy/rsync/touch) -> so nội dung nếu có hash
+        if self.use_hash and entry.get("hash"):
+            if file_digest(input_path) != entry["hash"]:
+                return False
+            self._put(rel_file, {**entry, "mtime_ns": st.st_mtime_ns})
+            return True
+        return False
+
+    def update(self, rel_file: str, input_path: Path, plan_hash: str, out_path: Path):
+        """Ghi nhận input đã tạo output thành công"""
+        st = input_path.stat()
+        self._put(rel_file, {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "hash": file_digest(input_path) if self.use_hash else None,
+            "plan": plan_hash,
+            "output": out_path.name,
+        })
+
+    def _put(self, rel_file: str, entry: dict):
+        with self._lock:
+            self.entries[rel_file] = entry
+            self._dirty = True
+            due = time.monotonic() - self._last_save >= self.save_interval_s
+        if due:
+            try:
+                self.save()
+            except OSError:
+                pass
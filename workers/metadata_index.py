@@ -0,0 +1,253 @@
+# workers/metadata_index.py
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from wand.image import Image as WandImage, ORIENTATION_TYPES
+
+from config import CONFIG
+from utils import TRACER
+from .archive_io import ArchiveSource, is_archive_path
+
+# ==========================================
+# METADATA INDEX (Header ảnh, lưu bằng sqlite)
+# ==========================================
+INDEX_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path        TEXT PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    width       INTEGER NOT NULL,
+    height      INTEGER NOT NULL,
+    format      TEXT NOT NULL,
+    colorspace  TEXT NOT NULL,
+    depth       INTEGER NOT NULL,
+    frames      INTEGER NOT NULL,
+    orientation INTEGER NOT NULL
+)
+"""
+_COLUMNS = "width, height, format, colorspace, depth, frames, orientation"
+_LOOKUP_CHUNK = 500     # Số tham số tối đa mỗi câu SELECT ... IN (...)
+_WRITE_CHUNK = 200      # Ghi xuống sqlite theo lô khi đang index
+
+
+class ImageMeta(NamedTuple):
+    """Thông tin đọc từ header (ping), không decode pixel"""
+    width: int
+    height: int
+    format: str          # JPEG, PNG, TIFF...
+    colorspace: str      # srgb, cmyk, gray...
+    depth: int           # bit/channel
+    frames: int          # Số frame/trang (GIF, TIFF nhiều trang)
+    orientation: int     # EXIF Orientation 1..8 (0 = không có)
+
+    @property
+    def megapixels(self) -> float:
+        return self.width * self.height / 1_000_000
+
+
+def read_meta(filename: Optional[str] = None, blob: Optional[bytes] = None) -> ImageMeta:
+    """Ping 1 ảnh (chỉ đọc header của mọi frame)"""
+    ping = WandImage.ping(blob=blob) if blob is not None else WandImage.ping(filename=filename)
+    with ping as img:
+        # ORIENTATION_TYPES xếp đúng theo giá trị EXIF ('undefined' = 0, 'top_left' = 1, ...)
+        orientation = img.orientation
+        orientation = ORIENTATION_TYPES.index(orientation) if orientation in ORIENTATION_TYPES else 0
+        return ImageMeta(img.width, img.height, (img.format or '').upper(), str(img.colorspace or ''),
+                         int(img.depth or 0), max(1, len(img.sequence)), orientation)
+
+
+class MetadataIndex:
+    """
+    Index header ảnh dùng chung cho mọi folder input (1 file sqlite, mặc định cạnh settings.ini).
+        path (tuyệt đối; member archive = <archive>!<member>) -> size, mtime_ns, ImageMeta
+
+    Entry chỉ hợp lệ khi size + mtime_ns khớp file hiện tại -> file đổi thì tự ping lại.
+    Thread-safe: 1 connection (check_same_thread=False) + lock, ghi theo lô trong 1 transaction.
+    """
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or CONFIG.metadata_index_file)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def open(self) -> 'MetadataIndex':
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            # Schema cũ -> index chỉ là cache, xóa đi tạo lại
+            conn.execute("DROP TABLE IF EXISTS files")
+            conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        conn.execute(_SCHEMA)
+        conn.commit()
+        self._conn = conn
+        return self
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __enter__(self):
+        return self.open() if self._conn is None else self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Đọc / Ghi ---
+    def get_many(self, signatures: Dict[str, Tuple[int, int]]) -> Dict[str, ImageMeta]:
+        """signatures: path -> (size, mtime_ns). Trả về entry còn hợp lệ."""
+        found: Dict[str, ImageMeta] = {}
+        paths = list(signatures)
+        with self._lock:
+            for i in range(0, len(paths), _LOOKUP_CHUNK):
+                chunk = paths[i:i + _LOOKUP_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT path, size, mtime_ns, {_COLUMNS} FROM files "
+                    f"WHERE path IN ({','.join('?' * len(chunk))})", chunk)
+                for path, size, mtime_ns, *meta in rows:
+                    if signatures[path] == (size, mtime_ns):
+                        found[path] = ImageMeta(*meta)
+        return found
+
+    def put_many(self, rows: Iterable[Tuple[str, int, int, ImageMeta]]):
+        """rows: (path, size, mtime_ns, meta)"""
+        rows = [(path, size, mtime_ns, *meta) for path, size, mtime_ns, meta in rows]
+        if not rows:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO files (path, size, mtime_ns, {_COLUMNS}) "
+                    f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def _signatures(input_dir: Path, rel_files: List[str],
+                archive: Optional[ArchiveSource]) -> Dict[str, Tuple[str, int, int]]:
+    """rel_file -> (path trong index, size, mtime_ns). Member archive dùng stat của file archive."""
+    result = {}
+    if archive is not None:
+        st = os.stat(archive.path)
+        prefix = str(archive.path.resolve())
+        for rel_file in rel_files:
+            result[rel_file] = (f"{prefix}!{Path(rel_file).as_posix()}", st.st_size, st.st_mtime_ns)
+        return result
+    root = input_dir.resolve()
+    for rel_file in rel_files:
+        try:
+            st = os.stat(root / rel_file)
+        except OSError:
+            continue
+        result[rel_file] = (str(root / rel_file), st.st_size, st.st_mtime_ns)
+    return result
+
+
+def index_files(index: MetadataIndex, input_dir: Path, rel_files: List[str], workers: int = None,
+                should_continue: Callable[[], bool] = lambda: True,
+                on_progress: Callable[[int, int], None] = None) -> Tuple[Dict[str, ImageMeta], int]:
+    """
+    Lấy metadata cho rel_files: đọc từ index, chỉ ping (song song) các file mới/đã đổi.
+    File ping lỗi (hỏng, không hỗ trợ) không có trong kết quả.
+
+    Returns:
+        ({rel_file: ImageMeta}, số file vừa ping)
+    """
+    input_dir = Path(input_dir)
+    workers = workers or CONFIG.metadata_index_workers or os.cpu_count() or 1
+    archive = ArchiveSource(input_dir) if is_archive_path(input_dir) else None
+    try:
+        signatures = _signatures(input_dir, rel_files, archive)
+        known = index.get_many({path: (size, mtime) for path, size, mtime in signatures.values()})
+        metas = {rel: known[sig[0]] for rel, sig in signatures.items() if sig[0] in known}
+        missing = [rel for rel in signatures if rel not in metas]
+        if not missing:
+            return metas, 0
+
+        def probe(rel_file: str) -> Tuple[str, Optional[ImageMeta]]:
+            if not should_continue():
+                return rel_file, None
+            try:
+                if archive is not None:
+                    return rel_file, read_meta(blob=archive.read(rel_file))
+                return rel_file, read_meta(filename=signatures[rel_file][0])
+            except Exception:
+                return rel_file, None  # Lỗi sẽ được báo khi xử lý thật
+
+        pending_rows = []
+        with TRACER.span("metadata_index", "index", files=len(missing)):
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                for done, (rel_file, meta) in enumerate(pool.map(probe, missing), 1):
+                    if meta is not None:
+                        metas[rel_file] = meta
+                        path, size, mtime_ns = signatures[rel_file]
+                        pending_rows.append((path, size, mtime_ns, meta))
+                    if len(pending_rows) >= _WRITE_CHUNK:
+                        index.put_many(pending_rows)
+                        pending_rows = []
+                    if on_progress:
+                        on_progress(done, len(missing))
+            index.put_many(pending_rows)
+        return metas, len(missing)
+    finally:
+        if archive is not None:
+            archive.close()
+
+
+# ==========================================
+# FILTER (VD: "mp>40 cmyk format=tiff")
+# ==========================================
+_FIELDS = {
+    'mp': lambda m: m.megapixels, 'w': lambda m: m.width, 'width': lambda m: m.width,
+    'h': lambda m: m.height, 'height': lambda m: m.height,
+    'format': lambda m: m.format, 'fmt': lambda m: m.format,
+    'cs': lambda m: m.colorspace, 'colorspace': lambda m: m.colorspace,
+    'depth': lambda m: m.depth, 'frames': lambda m: m.frames,
+    'orient': lambda m: m.orientation, 'orientation': lambda m: m.orientation,
+}
+# Từ khóa viết tắt
+_SHORTCUTS = {
+    'cmyk': 'cs=cmyk', 'gray': 'cs=gray', 'srgb': 'cs=srgb',
+    'animated': 'frames>1', 'rotated': 'orient>1', '16bit': 'depth=16',
+}
+_TERM = re.compile(r'^([a-z]+)(>=|<=|!=|=|>|<)(.+)$')
+_OPS = {
+    '=': lambda a, b: a == b, '!=': lambda a, b: a != b,
+    '>': lambda a, b: a > b, '<': lambda a, b: a < b,
+    '>=': lambda a, b: a >= b, '<=': lambda a, b: a <= b,
+}
+
+
+def parse_filter(text: str) -> Callable[[ImageMeta], bool]:
+    """
+    Biên dịch chuỗi lọc thành hàm ImageMeta -> bool (các điều kiện nối bằng AND).
+    Raise ValueError nếu sai cú pháp.
+    """
+    predicates = []
+    for term in text.lower().split():
+        term = _SHORTCUTS.get(term, term)
+        match = _TERM.match(term)
+        if not match or match.group(1) not in _FIELDS:
+            raise ValueError(f"Điều kiện lọc không hợp lệ: '{term}' "
+                             f"(VD: mp>40 cs=cmyk format=png depth=16 frames>1)")
+        field, op, value = match.groups()
+        getter = _FIELDS[field]
+        if field in ('format', 'fmt', 'cs', 'colorspace'):
+            if op not in ('=', '!='):
+                raise ValueError(f"'{field}' chỉ so sánh bằng = hoặc !=")
+            value = 'jpeg' if value == 'jpg' else value
+            predicates.append(lambda m, g=getter, f=_OPS[op], v=value: f(g(m).lower(), v))
+        else:
+            try:
+                number = float(value)
+            except ValueError:
+                raise ValueError(f"'{field}' cần giá trị số: '{value}'") from None
+            predicates.append(lambda m, g=getter, f=_OPS[op], v=number: f(g(m), v))
+    return lambda meta: all(p(meta) for p in predicates)
@@ -0,0 +1,209 @@
+# workers/pixel_stats.py
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# ==========================================
+# PIXEL STATISTICS (Histogram cho preview)
+# ==========================================
+CHANNELS = ('R', 'G', 'B', 'L')   # L = luma (Rec.601)
+
+# Hệ số luma nhân 256 (số nguyên -> tính bằng uint16, không cần float)
+_LUMA_WEIGHTS = np.array([77, 150, 29], dtype=np.uint16)
+_CHANNEL_OFFSETS = np.array([0, 256, 512], dtype=np.uint16)
+
+
+class PixelStats(NamedTuple):
+    """Histogram 256 bin cho R, G, B, Luma + thống kê suy ra từ histogram"""
+    histograms: np.ndarray          # shape (4, 256), int64
+    mean: Tuple[float, ...]         # Theo CHANNELS
+    std: Tuple[float, ...]
+    clip_low: Tuple[float, ...]     # % pixel = 0
+    clip_high: Tuple[float, ...]    # % pixel = 255
+    pixels: int
+
+
+def rgba_view(pixel_data: bytes, width: int, height: int) -> np.ndarray:
+    """Xem buffer RGBA8888 (make_blob format='RGBA') dưới dạng mảng (H, W, 4), không copy"""
+    if len(pixel_data) != width * height * 4:
+        raise ValueError(f"Buffer RGBA không phải 8 bit/kênh ({len(pixel_data)} bytes cho {width}x{height})")
+    return np.frombuffer(pixel_data, dtype=np.uint8).reshape(height, width, 4)
+
+
+def compute_stats(pixels: np.ndarray) -> PixelStats:
+    """
+    Tính histogram từ mảng (H, W, 4) uint8 - chính buffer dùng để tạo QImage (không decode lại).
+    1 lần bincount cho cả 3 channel (cộng offset 0/256/512), mean/std/clip suy ra từ histogram.
+    """
+    rgb = pixels[..., :3].reshape(-1, 3)
+    n = rgb.shape[0]
+    if n == 0:
+        empty = (0.0,) * len(CHANNELS)
+        return PixelStats(np.zeros((len(CHANNELS), 256), dtype=np.int64), empty, empty, empty, empty, 0)
+
+    wide = rgb.astype(np.uint16)
+    rgb_hist = np.bincount((wide + _CHANNEL_OFFSETS).ravel(), minlength=768).reshape(3, 256)
+    luma = (wide @ _LUMA_WEIGHTS) >> 8
+    luma_hist = np.bincount(luma, minlength=256)[:256]
+    histograms = np.vstack([rgb_hist, luma_hist])
+
+    levels = np.arange(256, dtype=np.float64)
+    mean = histograms @ levels / n
+    variance = histograms @ (levels ** 2) / n - mean ** 2
+    std = np.sqrt(np.maximum(variance, 0.0))
+    clip_low = histograms[:, 0] * 100.0 / n
+    clip_high = histograms[:, 255] * 100.0 / n
+    return PixelStats(histograms, tuple(mean.tolist()), tuple(std.tolist()),
+                      tuple(clip_low.tolist()), tuple(clip_high.tolist()), n)
+
+
+# ==========================================
+# DIFF (Heatmap + PSNR/SSIM giữa gốc và preview)
+# ==========================================
+class DiffMetrics(NamedTuple):
+    """Chỉ số của vùng đã tính (các tile giao với vùng đang xem)"""
+    psnr: float          # dB (inf = giống hệt)
+    ssim: float          # SSIM trên luma, cửa sổ 8x8 không chồng lấn
+    mean_abs: float      # Sai khác tuyệt đối trung bình (0..255, trung bình R/G/B)
+    max_abs: int         # Sai khác lớn nhất (0..255)
+    region: Tuple[int, int, int, int]   # x, y, w, h (pixel ảnh gốc, đã căn theo tile)
+    tiles_computed: int  # Số tile vừa tính ở lần gọi này (0 = lấy hoàn toàn từ cache)
+
+
+def _heatmap_lut() -> np.ndarray:
+    """Bảng màu 256 mức: đen -> tím -> đỏ -> cam -> vàng nhạt (RGBA)"""
+    stops = np.array([0.0, 0.25, 0.5, 0.75, 1.0])
+    colors = np.array([[0, 0, 0], [90, 20, 140], [220, 40, 40], [250, 150, 20], [255, 255, 200]], dtype=np.float64)
+    x = np.linspace(0.0, 1.0, 256)
+    lut = np.empty((256, 4), dtype=np.uint8)
+    for c in range(3):
+        lut[:, c] = np.round(np.interp(x, stops, colors[:, c]))
+    lut[:, 3] = 255
+    return lut
+
+
+_HEATMAP_LUT = _heatmap_lut()
+_LUMA_FLOAT = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+_SSIM_WINDOW = 8
+
+
+class DiffSession:
+    """
+    So sánh 2 ảnh RGBA cùng kích thước theo tile (TILE x TILE), tính dần theo vùng đang xem:
+    - update(region) chỉ tính các tile chưa tính trong vùng (vectorized trên cả khối tile đó),
+      lưu lại SSE / tổng SSIM / max của từng tile -> pan/zoom lại vùng cũ không phải tính lại.
+    - heatmap: mảng (H, W, 4) dùng chung, tile chưa tính có màu đen.
+    - last_block: vùng heatmap (x, y, w, h) vừa được ghi ở lần update() gần nhất (None = không đổi)
+      -> UI chỉ cần vẽ thêm vùng này, không copy lại cả heatmap.
+    """
+    TILE = 64
+
+    def __init__(self, original: np.ndarray, preview: np.ndarray, gain: float = 4.0):
+        if original.shape != preview.shape:
+            raise ValueError(f"Kích thước khác nhau: {original.shape} vs {preview.shape}")
+        self.a, self.b = original, preview
+        self.gain = gain
+        self.height, self.width = original.shape[:2]
+        rows, cols = -(-self.height // self.TILE), -(-self.width // self.TILE)
+        self.done = np.zeros((rows, cols), dtype=bool)
+        self.sse = np.zeros((rows, cols), dtype=np.float64)
+        self.abs_sum = np.zeros((rows, cols), dtype=np.float64)
+        self.samples = np.zeros((rows, cols), dtype=np.int64)      # Số giá trị (pixel x 3 channel)
+        self.ssim_sum = np.zeros((rows, cols), dtype=np.float64)
+        self.ssim_windows = np.zeros((rows, cols), dtype=np.int64)
+        self.max_abs = np.zeros((rows, cols), dtype=np.uint8)
+        self.heatmap = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+        self.heatmap[..., 3] = 255
+        self.last_block: Optional[Tuple[int, int, int, int]] = None
+
+    def _tile_range(self, region) -> Tuple[int, int, int, int]:
+        x, y, w, h = region if region else (0, 0, self.width, self.height)
+        x0, y0 = max(0, int(x)), max(0, int(y))
+        x1, y1 = min(self.width, int(np.ceil(x + w))), min(self.height, int(np.ceil(y + h)))
+        if x1 <= x0 or y1 <= y0:
+            return 0, 0, 0, 0
+        t = self.TILE
+        return y0 // t, -(-y1 // t), x0 // t, -(-x1 // t)
+
+    def update(self, region: Tuple[float, float, float, float] = None) -> DiffMetrics:
+        r0, r1, c0, c1 = self._tile_range(region)
+        computed = 0
+        self.last_block = None
+        pending = ~self.done[r0:r1, c0:c1]
+        if pending.any():
+            # Khối chữ nhật nhỏ nhất bao các tile chưa tính
+            rows = np.flatnonzero(pending.any(axis=1))
+            cols = np.flatnonzero(pending.any(axis=0))
+            computed = int(pending.sum())
+            self._compute_block(r0 + rows[0], r0 + rows[-1] + 1, c0 + cols[0], c0 + cols[-1] + 1)
+        return self._metrics(r0, r1, c0, c1, computed)
+
+    def _compute_block(self, r0: int, r1: int, c0: int, c1: int):
+        t = self.TILE
+        y0, y1 = r0 * t, min(self.height, r1 * t)
+        x0, x1 = c0 * t, min(self.width, c1 * t)
+        self.last_block = (x0, y0, x1 - x0, y1 - y0)
+        a = self.a[y0:y1, x0:x1, :3].astype(np.float32)
+        b = self.b[y0:y1, x0:x1, :3].astype(np.float32)
+        diff = np.abs(a - b)
+
+        # Heatmap theo sai khác lớn nhất giữa 3 channel (khuếch đại để thấy sai khác nhỏ)
+        per_pixel_max = diff.max(axis=2)
+        level = np.clip(per_pixel_max * self.gain, 0, 255).astype(np.uint8)
+        self.heatmap[y0:y1, x0:x1] = _HEATMAP_LUT[level]
+
+        # Tổng theo tile (reduceat xử lý được tile cuối bị cắt)
+        row_starts = np.arange(0, y1 - y0, t)
+        col_starts = np.arange(0, x1 - x0, t)
+
+        def per_tile(values, ufunc=np.add):
+            return ufunc.reduceat(ufunc.reduceat(values, row_starts, axis=0), col_starts, axis=1)
+
+        tiles = (slice(r0, r1), slice(c0, c1))
+        self.sse[tiles] = per_tile((diff * diff).sum(axis=2, dtype=np.float64))
+        self.abs_sum[tiles] = per_tile(diff.sum(axis=2, dtype=np.float64))
+        self.max_abs[tiles] = per_tile(per_pixel_max, np.maximum).astype(np.uint8)
+        row_sizes = np.diff(np.append(row_starts, y1 - y0))
+        col_sizes = np.diff(np.append(col_starts, x1 - x0))
+        self.samples[tiles] = np.outer(row_sizes, col_sizes) * 3
+
+        # SSIM trên luma, cửa sổ 8x8 không chồng lấn (khối bắt đầu ở biên tile -> cửa sổ không cắt qua tile)
+        win = _SSIM_WINDOW
+        h8, w8 = (y1 - y0) // win * win, (x1 - x0) // win * win
+        ssim_sum = np.zeros((r1 - r0, c1 - c0))
+        ssim_windows = np.zeros((r1 - r0, c1 - c0), dtype=np.int64)
+        if h8 and w8:
+            la = (a[:h8, :w8] @ _LUMA_FLOAT).reshape(h8 // win, win, w8 // win, win)
+            lb = (b[:h8, :w8] @ _LUMA_FLOAT).reshape(h8 // win, win, w8 // win, win)
+            mu_a, mu_b = la.mean(axis=(1, 3)), lb.mean(axis=(1, 3))
+            var_a, var_b = la.var(axis=(1, 3)), lb.var(axis=(1, 3))
+            cov = (la * lb).mean(axis=(1, 3)) - mu_a * mu_b
+            ssim_map = ((2 * mu_a * mu_b + _SSIM_C1) * (2 * cov + _SSIM_C2)) / \
+                       ((mu_a ** 2 + mu_b ** 2 + _SSIM_C1) * (var_a + var_b + _SSIM_C2))
+            per = t // win
+            win_rows = np.arange(0, ssim_map.shape[0], per)
+            win_cols = np.arange(0, ssim_map.shape[1], per)
+            sums = np.add.reduceat(np.add.reduceat(ssim_map.astype(np.float64), win_rows, axis=0), win_cols, axis=1)
+            counts = np.outer(np.diff(np.append(win_rows, ssim_map.shape[0])),
+                              np.diff(np.append(win_cols, ssim_map.shape[1])))
+            ssim_sum[:sums.shape[0], :sums.shape[1]] = sums
+            ssim_windows[:counts.shape[0], :counts.shape[1]] = counts
+        self.ssim_sum[tiles] = ssim_sum
+        self.ssim_windows[tiles] = ssim_windows
+        self.done[tiles] = True
+
+    def _metrics(self, r0: int, r1: int, c0: int, c1: int, computed: int) -> DiffMetrics:
+        tiles = (slice(r0, r1), slice(c0, c1))
+        samples = int(self.samples[tiles].sum())
+        t = self.TILE
+        region = (c0 * t, r0 * t, min(self.width, c1 * t) - c0 * t, min(self.height, r1 * t) - r0 * t)
+        if samples == 0:
+            return DiffMetrics(float('inf'), 1.0, 0.0, 0, region, computed)
+        mse = float(self.sse[tiles].sum()) / samples
+        psnr = float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+        windows = int(self.ssim_windows[tiles].sum())
+        ssim = float(self.ssim_sum[tiles].sum()) / windows if windows else 1.0
+        return DiffMetrics(float(psnr), ssim, float(self.abs_sum[tiles].sum()) / samples,
+                           int(self.max_abs[tiles].max()), region, computed)
@@ -1,8 +1,12 @@
-from qtpy.QtCore import QThread, Signal, QObject, Slot
+import numpy as np
+from qtpy.QtCore import Qt, QThread, Signal, QObject, Slot
 from qtpy.QtGui import QImage
 from wand.image import Image as WandImage
 
 from core import CommandParser
+from config import CONFIG
+from utils import TRACER
+from .pixel_stats import DiffSession, compute_stats, rgba_view
 
 # ================
 # Preview Engine
@@ -15,14 +19,36 @@ class PreviewRequest:
         self.request_id = request_id
         self.image_blob = image_blob
         self.command_string = command_string
+        self.created_ns = TRACER.now()  # Mốc để đo thời gian chờ trong queue
 
 
 class PreviewResult:
     """Gói dữ liệu kết quả trả về"""
-    def __init__(self, request_id: int, qimage: QImage = None, error: str = None):
+    def __init__(self, request_id: int, qimage: QImage = None, error: str = None, stats=None):
         self.request_id = request_id
         self.qimage = qimage 
         self.error = error
+        self.stats = stats  # PixelStats (histogram) của chính buffer tạo qimage
+        self.emitted_ns = TRACER.now()  # Mốc để đo thời gian truyền signal về UI
+
+
+def _to_qimage(img, cat: str):
+    """Wand -> QImage RGBA, kèm histogram tính từ cùng buffer (không decode lại)"""
+    with TRACER.span("to_qimage", cat):
+        # make_blob('RGBA') theo depth của ảnh (VD lệnh -depth 16 -> 2 byte/kênh) -> ép về 8 bit
+        img.depth = 8
+        pixel_data = img.make_blob(format='RGBA')
+        qimg = QImage(
+            pixel_data,
+            img.width,
+            img.height,
+            QImage.Format_RGBA8888
+        ).copy()
+    stats = None
+    if CONFIG.preview_stats_enabled:
+        with TRACER.span("pixel_stats", cat):
+            stats = compute_stats(rgba_view(pixel_data, img.width, img.height))
+    return qimg, stats
 
 
 # === Original Image Processor (Thread 1) ===
@@ -31,26 +57,23 @@ class OriginalImageProcessor(QObject):
     Worker xử lý ảnh gốc cho panel TRÁI.
     Không apply command, chỉ hiển thị ảnh gốc.
     """
-    result_signal = Signal(QImage)
+    result_signal = Signal(object)
 
-    @Slot(bytes)
-    def process_original(self, image_blob: bytes):
+    @Slot(object)
+    def process_original(self, request: PreviewRequest):
         """
         Xử lý ảnh gốc đơn giản - không apply command.
         Chỉ chuyển đổi blob → QImage.
         """
+        TRACER.name_thread("OriginalWorker")
+        TRACER.complete("queue_wait", request.created_ns, cat="queue")
         try:
-            with WandImage(blob=image_blob) as img:
-                # Chỉ chuyển sang QImage, không làm gì thêm
-                pixel_data = img.make_blob(format='RGBA')
-                qimg = QImage(
-                    pixel_data,
-                    img.width,
-                    img.height,
-                    QImage.Format_RGBA8888
-                ).copy()
-                
-                self.result_signal.emit(qimg)
+            with TRACER.span("decode", "original"):
+                img = WandImage(blob=request.image_blob)
+            with img:
+                # Histogram ảnh gốc tính từ cùng buffer tạo QImage (không chiếm UI thread)
+                qimg, stats = _to_qimage(img, "original")
+                self.result_signal.emit(PreviewResult(request.request_id, qimage=qimg, stats=stats))
                 
         except Exception as e:
             print(f"[OriginalWorker] Error: {e}")
@@ -85,18 +108,21 @@ class PreviewImageProcessor(QObject):
         Xử lý request với vòng lặp.
         Tránh stack overflow khi user gõ phím liên tục.
         """
+        TRACER.name_thread("PreviewWorker")
         current_req = request
         
         while current_req:
             self._is_busy = True
+            TRACER.complete("queue_wait", current_req.created_ns, cat="queue",
+                            request_id=current_req.request_id)
             
             try:
                 # Xử lý ảnh với command
-                qimg = self._process_image(current_req)
+                qimg, stats = self._process_image(current_req)
                 
                 # Gửi kết quả về UI
                 self.result_signal.emit(
-                    PreviewResult(current_req.request_id, qimage=qimg)
+                    PreviewResult(current_req.request_id, qimage=qimg, stats=stats)
                 )
 
             except Exception as e:
@@ -111,23 +137,128 @@ class PreviewImageProcessor(QObject):
                 current_req = self._pending_request
                 self._pending_request = None
 
-    def _process_image(self, request: PreviewRequest) -> QImage:
-        """Xử lý ảnh với ImageMagick command"""
-        with WandImage(blob=request.image_blob) as img:
+    def _process_image(self, request: PreviewRequest):
+        """Xử lý ảnh với ImageMagick command. Returns: (QImage, PixelStats | None)"""
+        with TRACER.span("decode", "preview"):
+            img = WandImage(blob=request.image_blob)
+        with img:
             if request.command_string:
                 operations = CommandParser.parse(request.command_string)
                 CommandParser.apply_commands(img, operations)
             
             # Direct QImage Output
-            pixel_data = img.make_blob(format='RGBA')
-            qimg = QImage(
-                pixel_data,
-                img.width,
-                img.height,
-                QImage.Format_RGBA8888
-            ).copy()
-            
-            return qimg
+            return _to_qimage(img, "preview")
+
+# === Diff Processor (Thread 3) ===
+class DiffRequest:
+    """
+    So sánh gốc/preview trong vùng đang xem (region: x, y, w, h theo pixel của preview).
+    reset=True: UI chưa có heatmap của session hiện tại -> tạo session mới (tính lại vùng đang xem).
+    """
+    def __init__(self, request_id: int, original: QImage, preview: QImage, region, reset: bool = False):
+        self.request_id = request_id
+        self.original = original
+        self.preview = preview
+        self.region = region
+        self.reset = reset
+
+
+class DiffResult:
+    """
+    Kết quả diff: chỉ gồm phần heatmap vừa tính (patch, đặt tại origin), không phải cả ảnh.
+    generation đổi = DiffSession mới -> UI tạo lại pixmap đen kích thước size rồi vẽ dần các patch.
+    """
+    def __init__(self, request_id: int, generation: int = 0, size=(0, 0), patch: QImage = None,
+                 origin=(0, 0), metrics=None, error: str = None):
+        self.request_id = request_id
+        self.generation = generation
+        self.size = size
+        self.patch = patch
+        self.origin = origin
+        self.metrics = metrics
+        self.error = error
+
+
+def _qimage_pixels(qimg: QImage):
+    """QImage -> mảng numpy (H, W, 4) RGBA (copy 1 lần, bỏ padding cuối dòng)"""
+    if qimg.format() != QImage.Format_RGBA8888:
+        qimg = qimg.convertToFormat(QImage.Format_RGBA8888)
+    bits = qimg.constBits()
+    if hasattr(bits, 'setsize'):  # PyQt: sip.voidptr
+        bits.setsize(qimg.sizeInBytes())
+    rows = np.frombuffer(bits, dtype=np.uint8, count=qimg.sizeInBytes()).reshape(qimg.height(), qimg.bytesPerLine())
+    return rows[:, :qimg.width() * 4].reshape(qimg.height(), qimg.width(), 4).copy()
+
+
+class DiffImageProcessor(QObject):
+    """
+    Worker tính heatmap sai khác + PSNR/SSIM.
+    Giữ DiffSession của cặp ảnh hiện tại: pan/zoom chỉ tính thêm các tile mới lộ ra
+    và chỉ gửi về UI phần heatmap của các tile đó.
+    Queue giống PreviewImageProcessor (chỉ giữ request mới nhất).
+    """
+    result_signal = Signal(object)   # DiffResult
+
+    def __init__(self):
+        super().__init__()
+        self._session = None
+        self._session_key = None
+        self._generation = 0
+        self._scale = (1.0, 1.0)
+        self._is_busy = False
+        self._pending_request = None
+
+    @Slot(object)
+    def process_request(self, request: DiffRequest):
+        if self._is_busy:
+            self._pending_request = request
+            return
+        TRACER.name_thread("DiffWorker")
+        current_req = request
+        while current_req:
+            self._is_busy = True
+            try:
+                self.result_signal.emit(self._process(current_req))
+            except Exception as e:
+                self.result_signal.emit(DiffResult(current_req.request_id, error=str(e)))
+            finally:
+                self._is_busy = False
+                current_req = self._pending_request
+                self._pending_request = None
+
+    def _process(self, request: DiffRequest):
+        original, preview = request.original, request.preview
+        key = (original.cacheKey(), preview.cacheKey())
+        if request.reset or key != self._session_key:
+            with TRACER.span("diff_session", "diff"):
+                w, h = original.width(), original.height()
+                self._scale = (w / max(1, preview.width()), h / max(1, preview.height()))
+                if (preview.width(), preview.height()) != (w, h):
+                    # Lệnh đổi kích thước -> so trên lưới pixel của ảnh gốc
+                    preview = preview.scaled(w, h, Qt.AspectRatioMode.IgnoreAspectRatio,
+                                             Qt.TransformationMode.SmoothTransformation)
+                self._session = DiffSession(_qimage_pixels(original), _qimage_pixels(preview),
+                                            gain=CONFIG.diff_heatmap_gain)
+                self._session_key = key
+                self._generation += 1
+
+        region = request.region
+        if region is not None:
+            sx, sy = self._scale
+            region = (region[0] * sx, region[1] * sy, region[2] * sx, region[3] * sy)
+        session = self._session
+        with TRACER.span("diff_update", "diff"):
+            metrics = session.update(region)
+        patch, origin = None, (0, 0)
+        if session.last_block is not None:
+            x, y, w, h = session.last_block
+            with TRACER.span("to_qimage", "diff", pixels=w * h):
+                block = np.ascontiguousarray(session.heatmap[y:y + h, x:x + w])
+                patch = QImage(block.data, w, h, w * 4, QImage.Format_RGBA8888).copy()
+            origin = (x, y)
+        return DiffResult(request.request_id, self._generation, (session.width, session.height),
+                          patch, origin, metrics)
+
 
 # === Dual Worker Controller (UI Thread) ===
 class PreviewController(QObject):
@@ -137,12 +268,14 @@ class PreviewController(QObject):
     - PreviewWorker: Xử lý preview (panel phải)
     """
     # Signals riêng biệt cho 2 panel
-    original_ready_signal = Signal(QImage)   # → Panel trái
-    preview_ready_signal = Signal(QImage)    # → Panel phải
+    original_ready_signal = Signal(QImage, object)   # → Panel trái (ảnh, PixelStats)
+    preview_ready_signal = Signal(QImage, object)    # → Panel phải (ảnh, PixelStats)
     
     # Signal gửi request
-    original_request_signal = Signal(bytes)
+    original_request_signal = Signal(PreviewRequest)
     preview_request_signal = Signal(PreviewRequest)
+    diff_request_signal = Signal(object)
+    diff_ready_signal = Signal(object)   # → Panel trái ở chế độ Diff (DiffResult)
 
     def __init__(self):
         super().__init__()
@@ -174,6 +307,15 @@ class PreviewController(QObject):
         # Khởi động thread 2
         self.preview_thread.start()
 
+        # === THREAD 3: Diff Worker (chỉ làm việc khi bật chế độ Diff) ===
+        self.diff_thread = QThread()
+        self.diff_worker = DiffImageProcessor()
+        self.diff_worker.moveToThread(self.diff_thread)
+        self.diff_request_signal.connect(self.diff_worker.process_request)
+        self.diff_worker.result_signal.connect(self._handle_diff_result)
+        self._diff_counter = 0
+        self.diff_thread.start()
+
     def request_original(self, image_blob: bytes):
         """
         Yêu cầu xử lý ảnh gốc (panel trái).
@@ -182,8 +324,8 @@ class PreviewController(QObject):
         if not image_blob:
             return
         
-        # Gửi trực tiếp blob, không cần ID
-        self.original_request_signal.emit(image_blob)
+        # Không cần ID tăng dần, chỉ đóng gói để đo thời gian chờ
+        self.original_request_signal.emit(PreviewRequest(0, image_blob, ""))
 
     def request_preview(self, image_blob: bytes, command_string: str):
         """
@@ -198,18 +340,37 @@ class PreviewController(QObject):
         req = PreviewRequest(self._req_counter, image_blob, command_string)
         self.preview_request_signal.emit(req)
 
-    def _handle_original_result(self, qimage: QImage):
+    def request_diff(self, original: QImage, preview: QImage, region=None, reset: bool = False):
+        """So sánh ảnh gốc và preview (region = vùng đang xem, theo pixel preview)"""
+        if original is None or preview is None or original.isNull() or preview.isNull():
+            return
+        self._diff_counter += 1
+        self.diff_request_signal.emit(DiffRequest(self._diff_counter, original, preview, region, reset))
+
+    def _handle_diff_result(self, result: DiffResult):
+        if result.error:
+            print(f"Diff Error: {result.error}")
+            return
+        # Patch luôn phải được vẽ (tile đã tính sẽ không gửi lại); chỉ bỏ chỉ số của vùng cũ
+        if result.request_id < self._diff_counter:
+            result.metrics = None
+        self.diff_ready_signal.emit(result)
+
+    def _handle_original_result(self, result: PreviewResult):
         """
         Nhận kết quả từ Original Worker.
         Emit trực tiếp, không cần check ID.
         """
-        self.original_ready_signal.emit(qimage)
+        TRACER.complete("deliver:original_result", result.emitted_ns, cat="signal")
+        self.original_ready_signal.emit(result.qimage, result.stats)
 
     def _handle_preview_result(self, result: PreviewResult):
         """
         Nhận kết quả từ Preview Worker.
         Chỉ chấp nhận kết quả mới nhất (check ID).
         """
+        TRACER.complete("deliver:preview_result", result.emitted_ns, cat="signal",
+                        request_id=result.request_id)
         # QUAN TRỌNG: Chỉ chấp nhận kết quả mới nhất
         if result.request_id < self._req_counter:
             return  # Vứt bỏ kết quả cũ
@@ -217,7 +378,7 @@ class PreviewController(QObject):
         if result.error:
             print(f"Preview Error: {result.error}")
         elif result.qimage:
-            self.preview_ready_signal.emit(result.qimage)
+            self.preview_ready_signal.emit(result.qimage, result.stats)
     
     def shutdown(self):
         """Dọn dẹp cả 2 threads khi tắt app"""
@@ -227,4 +388,8 @@ class PreviewController(QObject):
         
         # Dừng thread 2
         self.preview_thread.quit()
-        self.preview_thread.wait()
\ No newline at end of file
+        self.preview_thread.wait()
+
+        # Dừng thread 3
+        self.diff_thread.quit()
+        self.diff_thread.wait()
\ No newline at end of file
@@ -0,0 +1,158 @@
+# workers/scheduler.py
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils import SafeParse
+from utils.resources import physical_memory
+
+# ===================================================
+# MEMORY BUDGET SCHEDULER (Batch song song an toàn RAM)
+# ===================================================
+# Số channel giả định khi ước lượng (RGBA) - ImageMagick luôn cấp phát theo số channel thật,
+# ước lượng dư một chút còn hơn thiếu.
+ESTIMATE_CHANNELS = 4
+
+# Các lệnh tạo thêm 1 bản sao kích thước tương tự trong lúc chạy (input + output cùng tồn tại)
+_COPY_FACTOR_DEFAULT = 2.0
+# Lệnh không tạo bản sao (chỉ đổi thuộc tính/metadata)
+_INPLACE_OPS = frozenset({
+    'quality', 'density', 'units', 'depth', 'strip', 'compress', 'interlace', 'sampling-factor',
+    'format', 'loop', 'delay', 'fuzz', 'virtual-pixel', 'background', 'repage', 'target-size',
+})
+
+
+def bytes_per_pixel() -> int:
+    """Số byte/pixel của pixel cache ImageMagick (Q8/Q16, HDRI dùng float)"""
+    try:
+        from wand.version import QUANTUM_DEPTH
+        quantum_bytes = max(1, int(QUANTUM_DEPTH) // 8)
+    except Exception:
+        quantum_bytes = 2  # Bản build phổ biến: Q16
+    try:
+        from wand.version import configure_options
+        if 'HDRI' in configure_options('FEATURES').get('FEATURES', ''):
+            quantum_bytes = 4
+    except Exception:
+        pass
+    return quantum_bytes * ESTIMATE_CHANNELS
+
+
+def default_budget_bytes() -> int:
+    """Ngân sách mặc định = 50% RAM vật lý (0 nếu không đọc được -> tắt scheduler)"""
+    return physical_memory() // 2
+
+
+def _scaled(width: int, height: int, value: Optional[str]) -> Tuple[int, int]:
+    """Kích thước sau resize/scale/sample (cùng quy tắc với cmd_geometry)"""
+    if not value:
+        return width, height
+    if '%' in value:
+        percent = SafeParse.float_val(value) / 100.0
+        return max(1, int(width * percent)), max(1, int(height * percent))
+    geo = SafeParse.geometry(value)
+    if not geo:
+        return width, height
+    w, h, _, _ = geo
+    if w > 0 and h == 0:
+        h = int(w * height / width) if width else height
+    if h > 0 and w == 0:
+        w = int(h * width / height) if height else width
+    return max(1, w), max(1, h)
+
+
+def _geometry(value: Optional[str]) -> Tuple[int, int, int, int]:
+    return SafeParse.geometry(value or '') or (0, 0, 0, 0)
+
+
+def _next_size(cmd: str, value: Optional[str], width: int, height: int) -> Tuple[int, int, float]:
+    """
+    Kích thước ảnh sau 1 lệnh + hệ số bộ nhớ tạm trong lúc chạy lệnh đó
+    (bội số của max(kích thước trước, kích thước sau)).
+    """
+    if cmd in _INPLACE_OPS:
+        return width, height, 1.0
+    if cmd in ('resize', 'scale', 'sample', 'liquid-rescale'):
+        w, h = _scaled(width, height, value)
+        return w, h, _COPY_FACTOR_DEFAULT
+    if cmd == 'extent':
+        w, h, _, _ = _geometry(value)
+        return (w or width), (h or height), _COPY_FACTOR_DEFAULT
+    if cmd == 'crop':
+        w, h, x, y = _geometry(value)
+        return (w or max(1, width - x)), (h or max(1, height - y)), 1.0
+    if cmd in ('border', 'frame'):
+        nums = [SafeParse.int_val(p) for p in (value or '0').replace('+', 'x').split('x') if p]
+        bw = nums[0] if nums else 0
+        bh = nums[1] if len(nums) > 1 else bw
+        return width + 2 * bw, height + 2 * bh, _COPY_FACTOR_DEFAULT
+    if cmd == 'shave':
+        w, h, _, _ = _geometry(value)
+        return max(1, width - 2 * w), max(1, height - 2 * h), 1.0
+    if cmd == 'splice':
+        w, h, _, _ = _geometry(value)
+        return width + w, height + h, _COPY_FACTOR_DEFAULT
+    if cmd == 'chop':
+        w, h, _, _ = _geometry(value)
+        return max(1, width - w), max(1, height - h), 1.0
+    if cmd in ('rotate', 'deskew', 'shear'):
+        # Bounding box lớn nhất khi xoay 45 độ
+        angle = math.radians(SafeParse.float_val(value, 45.0) if cmd == 'rotate' else 45.0)
+        c, s = abs(math.cos(angle)), abs(math.sin(angle))
+        return int(width * c + height * s) + 1, int(width * s + height * c) + 1, _COPY_FACTOR_DEFAULT
+    if cmd in ('transpose', 'transverse'):
+        return height, width, _COPY_FACTOR_DEFAULT
+    if cmd in ('polaroid', 'shadow', 'raise', 'lower', 'distort', 'resample'):
+        # Không đoán chính xác được -> dự phòng gấp đôi kích thước
+        return width, height, 2 * _COPY_FACTOR_DEFAULT
+    return width, height, _COPY_FACTOR_DEFAULT
+
+
+def estimate_peak_bytes(width: int, height: int, operations: List[Tuple[str, Optional[str]]],
+                        bpp: Optional[int] = None) -> int:
+    """
+    Ước lượng bộ nhớ đỉnh khi xử lý 1 ảnh width x height qua chuỗi lệnh.
+    Mô phỏng kích thước qua từng lệnh (VD: -resize 400% làm ảnh to gấp 16 lần).
+    """
+    bpp = bpp or bytes_per_pixel()
+    peak_pixels = width * height  # Ảnh vừa decode
+    for cmd, value in operations:
+        new_w, new_h, factor = _next_size(cmd, value, width, height)
+        step = max(width * height, new_w * new_h) * factor
+        peak_pixels = max(peak_pixels, step)
+        width, height = new_w, new_h
+    # Encode cần thêm bộ đệm ~ 1 ảnh output
+    peak_pixels = max(peak_pixels, 2 * width * height)
+    return int(peak_pixels * bpp)
+
+
+class MemoryBudget:
+    """
+    Semaphore theo byte: acquire(cost) chặn cho tới khi tổng cost đang chạy + cost <= budget.
+    File lớn hơn cả budget vẫn được chạy, nhưng chỉ khi không còn file nào khác đang chạy.
+    """
+    def __init__(self, budget_bytes: int):
+        self.budget = budget_bytes
+        self.in_use = 0
+        self.peak_in_use = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, cost: int, should_wait: Callable[[], bool] = lambda: True) -> bool:
+        with self._cond:
+            while self.in_use > 0 and self.in_use + cost > self.budget:
+                if not should_wait():
+                    return False
+                self._cond.wait(timeout=0.5)
+            self.in_use += cost
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            return True
+
+    def release(self, cost: int):
+        with self._cond:
+            self.in_use -= cost
+            self._cond.notify_all()
+
+
+def order_by_cost(tasks: List, costs: Dict[int, int]) -> List:
+    """File lớn chạy trước (giảm đuôi dài lúc cuối batch)"""
+    return sorted(tasks, key=lambda t: costs.get(t.index, 0), reverse=True)
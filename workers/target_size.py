@@ -0,0 +1,145 @@
+# workers/target_size.py
+import math
+import threading
+from typing import NamedTuple, Optional
+
+from config import CONFIG
+from core.commands.cmd_settings import TARGET_SIZE_OPTION
+
+# ==================================================
+# TARGET SIZE (Tìm quality cao nhất vừa dung lượng)
+# ==================================================
+# Các format mà compression_quality quyết định dung lượng (PNG: quality = mức nén zlib, không áp dụng)
+LOSSY_FORMATS = frozenset({'JPEG', 'JPG', 'WEBP', 'AVIF', 'HEIC', 'JXL', 'JP2'})
+
+DEFAULT_QUALITY = 85
+# ln(size) tăng ~3% mỗi bậc quality (JPEG/WebP, vùng quality 50-95)
+DEFAULT_SLOPE = 0.03
+
+
+class TargetEncode(NamedTuple):
+    blob: bytes
+    quality: int
+    encodes: int
+    met: bool          # False = quality thấp nhất vẫn vượt mục tiêu
+
+
+def target_size_of(img) -> Optional[int]:
+    """Dung lượng mục tiêu đặt bởi lệnh -target-size (None nếu không có)"""
+    try:
+        value = img.options[TARGET_SIZE_OPTION]
+    except KeyError:
+        return None
+    return int(value) if value else None
+
+
+class QualityPredictor:
+    """
+    Nhớ kết quả của các file trước trong batch (thread-safe):
+    - quality tìm được (EWMA) -> điểm bắt đầu cho file sau
+    - độ dốc ln(size) theo quality -> nội suy bước tiếp theo
+    Ảnh cùng batch thường giống nhau (cùng máy ảnh/scan) nên thường chỉ cần 1-3 lần encode.
+    """
+    SMOOTHING = 0.3
+
+    def __init__(self, initial_quality: int = DEFAULT_QUALITY, initial_slope: float = DEFAULT_SLOPE):
+        self._quality = float(initial_quality)
+        self._slope = initial_slope
+        self._lock = threading.Lock()
+        self.images = 0
+        self.encodes = 0
+        self.missed = 0
+
+    def predict(self) -> int:
+        with self._lock:
+            return int(round(self._quality))
+
+    @property
+    def slope(self) -> float:
+        with self._lock:
+            return self._slope
+
+    def observe(self, result: TargetEncode, slope: Optional[float]):
+        with self._lock:
+            self.images += 1
+            self.encodes += result.encodes
+            if not result.met:
+                self.missed += 1
+                return
+            a = self.SMOOTHING if self.images > 1 else 1.0
+            self._quality += a * (result.quality - self._quality)
+            if slope:
+                self._slope += self.SMOOTHING * (slope - self._slope)
+
+    @property
+    def average_encodes(self) -> float:
+        with self._lock:
+            return self.encodes / self.images if self.images else 0.0
+
+
+def encode_to_target(img, target_bytes: int, predictor: QualityPredictor,
+                     min_quality: int = None, max_encodes: int = None,
+                     tolerance: float = None) -> TargetEncode:
+    """
+    Tìm quality cao nhất có len(blob) <= target_bytes (encode vào RAM, không ghi file tạm).
+
+    Giữ khoảng [lo, hi): lo = quality cao nhất đã vừa, hi = quality thấp nhất đã vượt.
+    Bước tiếp theo nội suy theo mô hình ln(size) tuyến tính với quality (độ dốc học từ
+    2 lần encode gần nhất, hoặc từ các file trước), kẹp trong khoảng -> luôn tiến, có giới hạn.
+    Dừng khi hi - lo <= 1, khi kết quả nằm trong `tolerance` dưới mục tiêu, hoặc hết lượt.
+    """
+    min_quality = CONFIG.target_min_quality if min_quality is None else min_quality
+    max_encodes = CONFIG.target_max_encodes if max_encodes is None else max_encodes
+    tolerance = CONFIG.target_tolerance if tolerance is None else tolerance
+
+    def encode(quality):
+        img.compression_quality = quality
+        return img.make_blob()
+
+    lo, lo_blob = min_quality - 1, None
+    hi = 101
+    smallest = None                 # Blob nhỏ nhất (dùng khi không quality nào vừa)
+    slope = predictor.slope
+    learned_slope = None
+    samples = []
+    quality = min(100, max(min_quality, predictor.predict()))
+    encodes = 0
+
+    while encodes < max_encodes:
+        blob = encode(quality)
+        encodes += 1
+        size = len(blob)
+        if smallest is None or size < len(smallest[1]):
+            smallest = (quality, blob)
+
+        if size <= target_bytes:
+            lo, lo_blob = quality, blob
+            if size >= target_bytes * (1 - tolerance):
+                break
+        else:
+            hi = quality
+        if hi - lo <= 1:
+            break
+
+        # Độ dốc từ 2 mẫu gần nhất của chính ảnh này
+        if samples:
+            prev_quality, prev_size = samples[-1]
+            if prev_quality != quality and prev_size > 0 and size > 0 and prev_size != size:
+                measured = math.log(size / prev_size) / (quality - prev_quality)
+                if measured > 0:
+                    slope = learned_slope = measured
+        samples.append((quality, size))
+
+        # Nhắm vào giữa vùng chấp nhận [target*(1-tol), target]
+        aim = target_bytes * (1 - tolerance / 2)
+        guess = round(quality + math.log(aim / max(1, size)) / slope)
+        quality = int(min(hi - 1, max(lo + 1, guess)))
+
+    if lo_blob is not None:
+        result = TargetEncode(lo_blob, lo, encodes, True)
+    else:
+        result = TargetEncode(smallest[1], smallest[0], encodes, False)
+    # Lần ghi sau (metadata/tiêu đề) dùng đúng quality của blob trả về
+    img.compression_quality = result.quality
+    predictor.observe(result, learned_slope)
+    return result
@@ -0,0 +1,136 @@
+# workers/thumbnailer.py
+import os
+import threading
+from pathlib import Path
+from typing import List, Optional, Set
+
+from qtpy.QtCore import QObject, Signal
+from qtpy.QtGui import QImage
+from wand.image import Image as WandImage
+
+from config import CONFIG
+from core import ThumbnailStore
+from utils import TRACER
+from .archive_io import ArchiveSource, is_archive_path
+
+# ==========================================
+# THUMBNAIL SERVICE (Decode nền cho chế độ lưới)
+# ==========================================
+class ThumbnailService(QObject):
+    """
+    Tạo thumbnail cho danh sách file ở background (N thread Python, không chặn UI).
+
+    - request(rel_files): THAY hàng đợi bằng danh sách mới theo thứ tự ưu tiên
+      (ô đang hiện trước, rồi vùng sắp cuộn tới) -> cuộn nhanh không bị kẹt sau các file cũ.
+    - Decode thu nhỏ: đặt 'jpeg:size' trước khi đọc -> libjpeg giải mã ở 1/2, 1/4, 1/8
+      kích thước gốc; chỉ đọc frame đầu của GIF/TIFF nhiều trang.
+    - Kết quả lưu vào ThumbnailStore (đĩa) -> lần mở sau chỉ đọc file JPEG nhỏ.
+    """
+    thumbnail_ready = Signal(str, QImage)
+
+    def __init__(self, workers: int = None, thumb_size: int = None, cache_dir: Path = None):
+        super().__init__()
+        self.thumb_size = thumb_size or CONFIG.thumbnail_size
+        self.store = ThumbnailStore(cache_dir or CONFIG.thumbnail_cache_dir, self.thumb_size)
+        self.input_dir: Optional[Path] = None
+        self.archive: Optional[ArchiveSource] = None
+
+        self._cond = threading.Condition()
+        self._queue: List[str] = []
+        self._in_flight: Set[str] = set()
+        self._generation = 0         # Đổi input -> bỏ kết quả của input cũ
+        self._stop = False
+        self._threads = [threading.Thread(target=self._worker_loop, args=(i,), daemon=True)
+                         for i in range(max(1, workers or CONFIG.thumbnail_workers))]
+        for t in self._threads:
+            t.start()
+
+    # --- Public API (gọi từ UI thread) ---
+    def set_source(self, input_dir: Path):
+        """Đổi input (folder hoặc ZIP/TAR): xóa hàng đợi cũ"""
+        with self._cond:
+            self._generation += 1
+            self._queue.clear()
+            old_archive = self.archive
+            self.input_dir = Path(input_dir)
+            self.archive = ArchiveSource(self.input_dir) if is_archive_path(self.input_dir) else None
+        if old_archive:
+            old_archive.close()
+
+    def request(self, rel_files: List[str]):
+        """Thay hàng đợi bằng rel_files (phần tử đầu được làm trước)"""
+        with self._cond:
+            self._queue = [f for f in dict.fromkeys(rel_files) if f not in self._in_flight]
+            self._cond.notify_all()
+
+    def shutdown(self):
+        with self._cond:
+            self._stop = True
+            self._queue.clear()
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=2)
+        if self.archive:
+            self.archive.close()
+
+    # --- Worker ---
+    def _worker_loop(self, worker_id: int):
+        TRACER.name_thread(f"Thumbnail-{worker_id}")
+        while True:
+            with self._cond:
+                while not self._queue and not self._stop:
+                    self._cond.wait()
+                if self._stop:
+                    return
+                rel_file = self._queue.pop(0)
+                self._in_flight.add(rel_file)
+                generation, input_dir, archive = self._generation, self.input_dir, self.archive
+            try:
+                qimg = self._thumbnail(rel_file, input_dir, archive)
+            except Exception:
+                qimg = None  # File lỗi/không đọc được -> giữ icon trống
+            finally:
+                with self._cond:
+                    self._in_flight.discard(rel_file)
+                    current = generation == self._generation
+            if qimg is not None and current:
+                self.thumbnail_ready.emit(rel_file, qimg)
+
+    def _identity(self, rel_file: str, input_dir: Path, archive: Optional[ArchiveSource]):
+        """(đường dẫn định danh, stat) - member archive dùng stat của chính file archive"""
+        if archive is not None:
+            st = os.stat(archive.path)
+            return f"{archive.path.resolve()}!{Path(rel_file).as_posix()}", st
+        path = input_dir / rel_file
+        return str(path.resolve()), os.stat(path)
+
+    def _thumbnail(self, rel_file: str, input_dir: Path, archive: Optional[ArchiveSource]) -> Optional[QImage]:
+        identity, st = self._identity(rel_file, input_dir, archive)
+        key = self.store.key(identity, st.st_mtime_ns, st.st_size)
+        data = self.store.get(key)
+        if data is None:
+            with TRACER.span("thumbnail_decode", "thumbnail", file=rel_file):
+                data = self._render(rel_file, input_dir, archive)
+            self.store.put(key, data)
+        qimg = QImage.fromData(data)
+        return None if qimg.isNull() else qimg
+
+    def _render(self, rel_file: str, input_dir: Path, archive: Optional[ArchiveSource]) -> bytes:
+        size = self.thumb_size
+        with WandImage() as img:
+            # Gợi ý cho decoder JPEG: chỉ cần ảnh ~2x thumbnail (giải mã DCT thu nhỏ)
+            img.options['jpeg:size'] = f"{size * 2}x{size * 2}"
+            if archive is not None:
+                img.read(blob=archive.read(rel_file))
+            else:
+                img.read(filename=f"{input_dir / rel_file}[0]")
+            with WandImage(image=img.sequence[0]) as frame:
+                frame.auto_orient()
+                frame.transform(resize=f"{size}x{size}>")
+                frame.strip()
+                if frame.alpha_channel:
+                    frame.background_color = 'white'
+                    frame.alpha_channel = 'remove'
+                frame.format = 'jpeg'
+                frame.compression_quality = 80
+                return frame.make_blob()
@@ -0,0 +1,353 @@
+# workers/tiling.py
+import math
+import re
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from wand.image import Image as WandImage
+
+from config import CONFIG
+from core.parser import CommandParser
+from utils import TRACER
+
+# ==========================================================
+# TILED PROCESSING (Ảnh cực lớn - gigapixel scans)
+# ==========================================================
+# 1. Stage: decode file 1 lần, lưu thành MPC (pixel cache của ImageMagick trên disk).
+#    Engine giới hạn 'area' = ngưỡng tile -> ảnh lớn được decode thẳng vào cache trên disk.
+# 2. Đọc từng tile từ MPC (stage.mpc[WxH+X+Y] chỉ đọc vùng đó, không decode lại),
+#    kèm vùng đệm (halo) 4 phía, áp lệnh, cắt bỏ halo.
+# 3. Ghi lõi các tile theo từng dải hàng vào file PAM (ghi tuần tự, không giữ cả ảnh trong RAM).
+#    Output .pam dùng luôn file này; format khác được ImageMagick encode 1 lần từ PAM
+#    (cùng giới hạn 'area' -> pixel cache trên disk).
+# Kết quả trong lõi tile giống hệt xử lý cả ảnh khi halo >= bán kính ảnh hưởng của chuỗi lệnh;
+# ở mép ảnh thật, tile không có halo -> virtual pixel giống như xử lý cả ảnh.
+
+# Lệnh điểm (pixel out chỉ phụ thuộc pixel in cùng vị trí)
+POINT_OPS = frozenset({
+    'colorspace', 'grayscale', 'alpha', 'transparent', 'negate', 'level', 'gamma',
+    'brightness-contrast', 'modulate', 'threshold', 'colorize', 'tint', 'sigmoidal-contrast',
+    'black-threshold', 'white-threshold', 'sepia', 'solarize', 'posterize', 'blue-shift', 'noise',
+})
+
+# Chỉ xuất được tile ở dạng Gray/RGB -> colorspace khác (cmyk, lab...) xử lý cả ảnh
+TILE_COLORSPACES = frozenset({'gray', 'srgb', 'rgb'})
+
+# Cài đặt ảnh hưởng cách xử lý từng tile -> áp dụng cho cả tile lẫn ảnh output
+SHARED_SETTINGS = frozenset({'fuzz', 'virtual-pixel', 'background'})
+
+# Cài đặt encode/metadata -> chỉ áp dụng 1 lần lên ảnh output
+ENCODE_SETTINGS = frozenset({
+    'quality', 'target-size', 'density', 'units', 'depth', 'strip', 'compress', 'interlace',
+    'sampling-factor', 'format', 'loop', 'delay',
+})
+
+_NUMBER = re.compile(r'[-+]?\d*\.?\d+')
+
+
+def _numbers(value: Optional[str]) -> List[float]:
+    return [float(x) for x in _NUMBER.findall(value or '')]
+
+
+def _sigma_reach(sigma: float) -> int:
+    """Bán kính kernel Gaussian ImageMagick tự chọn khi radius = 0 (~4.7 sigma ở Q16)"""
+    return math.ceil(5 * sigma) + 1
+
+
+def _radius_sigma_halo(default_radius: float = 0.0, default_sigma: float = 1.0) -> Callable:
+    """Halo cho lệnh dạng Radius x Sigma: radius nếu > 0, ngược lại theo sigma"""
+    def halo(value):
+        nums = _numbers(value)
+        r = nums[0] if nums else default_radius
+        s = nums[1] if len(nums) > 1 else (r or default_sigma)
+        return math.ceil(r) + 1 if r > 0 else _sigma_reach(s)
+    return halo
+
+
+def _motion_blur_halo(value):
+    """motion-blur: kernel 1 phía dài cỡ cả bề rộng kernel Gaussian (2 x radius)"""
+    nums = _numbers(value)
+    r = nums[0] if nums else 0.0
+    s = nums[1] if len(nums) > 1 else 10.0
+    return math.ceil(2 * r) + 1 if r > 0 else 2 * _sigma_reach(s)
+
+
+def _kuwahara_halo(value):
+    """kuwahara: blur Gaussian trước rồi xét 4 góc phần tư bán kính r"""
+    nums = _numbers(value)
+    r = nums[0] if nums else 1.0
+    s = nums[1] if len(nums) > 1 else 0.5
+    return 2 * (math.ceil(r) if r > 0 else _sigma_reach(s)) + 1
+
+
+def _radius_halo(default_radius: float) -> Callable:
+    def halo(value):
+        nums = _numbers(value)
+        return math.ceil(nums[0] if nums else default_radius) + 1
+    return halo
+
+
+def _fixed_halo(pixels: int) -> Callable:
+    return lambda value: pixels
+
+
+def _window_halo(default: str, extra: int = 0) -> Callable:
+    """Lệnh có cửa sổ WxH (statistic Type:WxH, lat WxH+Offset) -> nửa cạnh lớn nhất"""
+    def halo(value):
+        geometry = (value or '').partition(':')[2] if ':' in (value or '') else (value or default)
+        nums = _numbers(geometry.split('+')[0] or default)
+        size = max(nums[:2]) if nums else max(_numbers(default))
+        return math.ceil(size / 2) + extra
+    return halo
+
+
+# Bán kính mặc định của các kernel hình thái học trong ImageMagick
+_KERNEL_RADIUS = {'disk': 3.5, 'square': 1, 'diamond': 1, 'octagon': 2, 'plus': 2, 'cross': 2}
+
+
+def _kernel_halo(passes: int) -> Callable:
+    """dilate/erode (1 lượt), opening/closing (2 lượt). Kernel lạ -> None (xử lý cả ảnh)."""
+    def halo(value):
+        name, _, args = (value or 'Disk').partition(':')
+        default = _KERNEL_RADIUS.get(name.strip().lower())
+        if default is None:
+            return None
+        nums = _numbers(args)
+        return (math.ceil(nums[0] if nums else default) + 1) * passes
+    return halo
+
+
+# Lệnh cục bộ: halo(value) -> số pixel cần đọc thêm mỗi phía (None = không tile được).
+# Không có: charcoal/emboss/adaptive-* (bên trong có normalize/equalize/auto-level = toàn cục),
+# monochrome/type (dither lan sai số qua cả ảnh).
+LOCAL_OPS: Dict[str, Callable[[Optional[str]], Optional[int]]] = {
+    'blur': _radius_sigma_halo(),
+    'gaussian-blur': _radius_sigma_halo(),
+    'sharpen': _radius_sigma_halo(),
+    'unsharp-mask': _radius_sigma_halo(),
+    'selective-blur': _radius_sigma_halo(),
+    'motion-blur': _motion_blur_halo,
+    'kuwahara': _kuwahara_halo,
+    'median': _radius_halo(1),
+    'mode': _radius_halo(1),
+    'spread': _radius_halo(3),
+    'edge': _radius_halo(1),
+    'statistic': _window_halo('3x3'),
+    'lat': _window_halo('3x3', extra=1),
+    'despeckle': _fixed_halo(8),
+    'enhance': _fixed_halo(3),
+    'shade': _fixed_halo(2),
+    'dilate': _kernel_halo(1),
+    'erode': _kernel_halo(1),
+    'opening': _kernel_halo(2),
+    'closing': _kernel_halo(2),
+}
+
+
+class TilePlan(NamedTuple):
+    tile_ops: List[Tuple[str, Optional[str]]]    # Chạy trên từng tile (theo đúng thứ tự gốc)
+    encode_ops: List[Tuple[str, Optional[str]]]  # Chạy 1 lần trên ảnh output trước khi encode
+    halo: int                                    # Tổng vùng đệm (các lệnh cục bộ nối tiếp cộng dồn)
+
+
+def plan_tiles(operations: List[Tuple[str, Optional[str]]]) -> Optional[TilePlan]:
+    """
+    Phân loại chuỗi lệnh. Trả về None nếu có lệnh toàn cục (resize, trim, equalize,
+    auto-level, rotate...) -> phải xử lý cả ảnh như bình thường.
+    """
+    tile_ops, encode_ops = [], []
+    halo = 0
+    for cmd, value in operations:
+        if cmd == 'colorspace' and (value or '').lower() not in TILE_COLORSPACES:
+            return None
+        if cmd in POINT_OPS:
+            tile_ops.append((cmd, value))
+        elif cmd in SHARED_SETTINGS:
+            tile_ops.append((cmd, value))
+            encode_ops.append((cmd, value))
+        elif cmd in ENCODE_SETTINGS:
+            encode_ops.append((cmd, value))
+        elif cmd in LOCAL_OPS:
+            op_halo = LOCAL_OPS[cmd](value)
+            if op_halo is None:
+                return None
+            halo += op_halo
+            tile_ops.append((cmd, value))
+        else:
+            return None
+    return TilePlan(tile_ops, encode_ops, halo)
+
+
+def tile_edge(plan: TilePlan, tile_size: int = None) -> int:
+    """Cạnh lõi tile: không nhỏ hơn 4 lần halo (đọc thừa ít)"""
+    return max(64, 4 * plan.halo, tile_size or CONFIG.tile_size)
+
+
+def tile_cost_bytes(width: int, plan: TilePlan, bpp: int) -> int:
+    """RAM đỉnh ước lượng khi xử lý theo tile: ~3 bản 1 tile có halo + 1 dải hàng output (16 bit RGBA)"""
+    edge = tile_edge(plan)
+    padded = (edge + 2 * plan.halo) ** 2
+    return 3 * padded * bpp + width * edge * 8
+
+
+def can_tile(img: WandImage) -> bool:
+    """Ảnh đã decode có tile được không (1 frame, không gian màu Gray/RGB)"""
+    return len(img.sequence) == 1 and img.colorspace in TILE_COLORSPACES
+
+
+# === PAM (ghi tuần tự) ===
+_TUPLTYPES = {1: "GRAYSCALE", 2: "GRAYSCALE_ALPHA", 3: "RGB", 4: "RGB_ALPHA"}
+
+
+def _read_pam(blob: bytes) -> Tuple[np.ndarray, int]:
+    """Blob PAM (P7) -> (mảng (H, W, DEPTH), MAXVAL). Mẫu 16 bit trong PAM luôn là big-endian."""
+    end = blob.index(b"ENDHDR\n") + len(b"ENDHDR\n")
+    fields = {}
+    for line in blob[:end].decode('ascii').splitlines()[1:]:
+        key, _, value = line.partition(' ')
+        fields[key] = value.strip()
+    width, height, depth, maxval = (int(fields[k]) for k in ('WIDTH', 'HEIGHT', 'DEPTH', 'MAXVAL'))
+    dtype = np.dtype('>u2') if maxval > 255 else np.dtype(np.uint8)
+    pixels = np.frombuffer(blob, dtype=dtype, count=width * height * depth, offset=end)
+    return pixels.reshape(height, width, depth), maxval
+
+
+def _to_layout(pixels: np.ndarray, maxval: int, channels: int, out_max: int, dtype) -> np.ndarray:
+    """
+    Đưa tile về cùng layout với output. Encoder PAM tự chọn GRAYSCALE/BLACKANDWHITE theo nội dung
+    từng tile (VD tile toàn màu xám) -> phải chuẩn hóa số kênh và MAXVAL trước khi ghép.
+    """
+    depth = pixels.shape[2]
+    has_alpha = depth in (2, 4)
+    color = pixels[..., :depth - 1] if has_alpha else pixels
+    want_gray, want_alpha = channels in (1, 2), channels in (2, 4)
+    if want_gray and color.shape[2] == 3:
+        color = color[..., :1]
+    elif not want_gray and color.shape[2] == 1:
+        color = np.repeat(color, 3, axis=2)
+    parts = [color]
+    if want_alpha:
+        parts.append(pixels[..., -1:] if has_alpha else np.full(color.shape[:2] + (1,), maxval, pixels.dtype))
+    out = np.concatenate(parts, axis=2) if len(parts) > 1 else color
+    if maxval != out_max:
+        out = out.astype(np.uint32) * out_max // maxval
+    return out.astype(dtype, copy=False)
+
+
+class PamWriter:
+    """Ghi file PAM theo từng dải hàng (từ trên xuống) -> ảnh output không cần nằm trọn trong RAM"""
+    def __init__(self, path: Path, width: int, height: int, channels: int, maxval: int):
+        self.path = path
+        self.width = width
+        self.channels = channels
+        self.maxval = maxval
+        self.dtype = np.dtype('>u2') if maxval > 255 else np.dtype(np.uint8)
+        self.rows_left = height
+        self._file = open(path, 'wb', buffering=CONFIG.write_buffer_bytes)
+        self._file.write(f"P7\nWIDTH {width}\nHEIGHT {height}\nDEPTH {channels}\nMAXVAL {maxval}\n"
+                         f"TUPLTYPE {_TUPLTYPES[channels]}\nENDHDR\n".encode('ascii'))
+
+    def new_band(self, rows: int) -> np.ndarray:
+        return np.empty((rows, self.width, self.channels), dtype=self.dtype)
+
+    def write_band(self, band: np.ndarray):
+        self._file.write(band.tobytes())
+        self.rows_left -= band.shape[0]
+
+    def close(self):
+        self._file.close()
+        if self.rows_left:
+            raise ValueError(f"PAM thiếu {self.rows_left} hàng")
+
+    def abort(self):
+        """Đóng file khi lỗi/dừng giữa chừng (caller xóa file dở)"""
+        self._file.close()
+
+
+# === Stage + xử lý ===
+class StagedImage(NamedTuple):
+    path: Path      # File .mpc (kèm .cache): đọc vùng bất kỳ không cần decode lại
+    width: int
+    height: int
+    format: str     # Format của file gốc (output giữ format này nếu không có -format)
+    depth: int      # 8 hoặc 16 bit/kênh khi xuất tile
+
+
+def stage_image(img: WandImage, work_dir: Path) -> StagedImage:
+    """Lưu ảnh đã decode thành MPC trong work_dir (caller tự close img)"""
+    path = work_dir / "stage.mpc"
+    with TRACER.span("tile_stage", "batch", pixels=img.width * img.height):
+        staged = StagedImage(path, img.width, img.height, img.format, 16 if img.depth > 8 else 8)
+        img.save(filename=str(path))
+    return staged
+
+
+class TiledOutput(NamedTuple):
+    path: Path                          # File PAM đã ghép
+    profiles: Dict[str, bytes]          # Metadata của tile sau khi áp lệnh (ICC, EXIF...)
+    resolution: Tuple[float, float]
+    units: str
+
+
+def process_tiles(staged: StagedImage, plan: TilePlan, out_path: Path,
+                  should_continue: Callable[[], bool] = lambda: True) -> TiledOutput:
+    """
+    Đọc từng tile (kèm halo, cắt theo mép ảnh) từ MPC, áp plan.tile_ops, bỏ halo,
+    ghép lõi các tile của 1 dải hàng rồi ghi dải đó vào PAM out_path.
+    RAM đỉnh ~ vài tile + 1 dải hàng, không phụ thuộc kích thước ảnh.
+    """
+    width, height, halo = staged.width, staged.height, plan.halo
+    edge = tile_edge(plan)
+    writer: Optional[PamWriter] = None
+    meta = None
+    try:
+        for y in range(0, height, edge):
+            core_h = min(edge, height - y)
+            band = writer.new_band(core_h) if writer else None
+            for x in range(0, width, edge):
+                if not should_continue():
+                    raise InterruptedError("Đã dừng khi đang xử lý theo tile")
+                core_w = min(edge, width - x)
+                read_x, read_y = max(0, x - halo), max(0, y - halo)
+                read_w = min(width, x + core_w + halo) - read_x
+                read_h = min(height, y + core_h + halo) - read_y
+
+                with TRACER.span("tile", "batch", x=x, y=y):
+                    with WandImage(filename=f"{staged.path}[{read_w}x{read_h}+{read_x}+{read_y}]") as tile:
+                        tile.reset_coords()
+                        CommandParser.apply_commands(tile, plan.tile_ops)
+                        # Bỏ vùng halo, chỉ giữ phần lõi
+                        tile.crop(left=x - read_x, top=y - read_y, width=core_w, height=core_h)
+                        tile.reset_coords()
+
+                        if writer is None:
+                            # Layout output theo tile đầu tiên (colorspace/alpha do chuỗi lệnh quyết định)
+                            channels = (1 if tile.colorspace == 'gray' else 3) + (1 if tile.alpha_channel else 0)
+                            maxval = 65535 if staged.depth > 8 else 255
+                            writer = PamWriter(out_path, width, height, channels, maxval)
+                            band = writer.new_band(core_h)
+                            meta = ({name: tile.profiles[name] for name in tile.profiles},
+                                    tile.resolution, tile.units)
+                        tile.depth = staged.depth
+                        pixels, maxval = _read_pam(tile.make_blob('PAM'))
+                band[:, x:x + core_w] = _to_layout(pixels, maxval, writer.channels, writer.maxval, writer.dtype)
+            with TRACER.span("tile_write", "batch", rows=core_h):
+                writer.write_band(band)
+        writer.close()
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    return TiledOutput(out_path, *meta)
+
+
+def open_tiled_output(output: TiledOutput, staged: StagedImage) -> WandImage:
+    """Mở PAM đã ghép để encode sang format output (giữ format gốc + metadata của tile)"""
+    img = WandImage(filename=f"PAM:{output.path}")
+    img.format = staged.format
+    for name, data in output.profiles.items():
+        img.profiles[name] = data
+    img.resolution = output.resolution
+    img.units = output.units
+    return img
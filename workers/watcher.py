@@ -0,0 +1,269 @@
+# workers/watcher.py
+import os
+import time
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from config import CONFIG
+from utils import TRACER, RESOURCES
+from .engine import BatchEngine, FileTask, scan_input
+from .journal import STATE_DIR_NAME
+from .manifest import BatchManifest
+
+# watchdog là tùy chọn: không có thì quét định kỳ (polling)
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# ==========================================
+# WATCH FOLDER (Chạy nền, xử lý file mới)
+# ==========================================
+class _EventHandler(FileSystemEventHandler):
+    """Chuyển sự kiện của watchdog thành đường dẫn cần kiểm tra"""
+    def __init__(self, notify: Callable[[str], None]):
+        super().__init__()
+        self.notify = notify
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.notify(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.notify(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.notify(event.dest_path)
+
+
+class _Pending:
+    """File đang chờ ghi xong: (size, mtime) phải đứng yên settle_s giây"""
+    __slots__ = ('signature', 'changed_at')
+
+    def __init__(self, signature: Tuple[int, int], changed_at: float):
+        self.signature = signature
+        self.changed_at = changed_at
+
+
+class FolderWatcher:
+    """
+    Theo dõi input folder và xử lý file mới/thay đổi bằng pipeline của BatchEngine
+    (ping/decode/apply/encode/ghi atomic + manifest incremental) với pool worker cố định.
+
+    - Phát hiện file: watchdog (inotify/FSEvents/ReadDirectoryChangesW) nếu có, ngược lại quét
+      định kỳ bằng scan_input (cùng logic với FileLoaderWorker).
+    - Debounce: chỉ xử lý khi size + mtime không đổi trong settle_s giây (máy scan ghi xong).
+    - Manifest incremental: khởi động lại watcher không xử lý lại file đã làm.
+    - Báo cáo throughput + backlog mỗi report_interval_s giây qua on_stats.
+    """
+    def __init__(self, engine: BatchEngine, extensions: Tuple[str, ...] = None,
+                 settle_s: float = None, poll_interval_s: float = None,
+                 report_interval_s: float = None, use_notifications: bool = True,
+                 on_stats: Callable[[dict], None] = None):
+        self.engine = engine
+        self.input_dir = engine.input_dir
+        self.extensions = tuple(e.lower() for e in (extensions or CONFIG.image_extensions))
+        self.settle_s = CONFIG.watch_settle_s if settle_s is None else settle_s
+        self.poll_interval_s = CONFIG.watch_poll_interval_s if poll_interval_s is None else poll_interval_s
+        self.report_interval_s = CONFIG.watch_report_interval_s if report_interval_s is None else report_interval_s
+        self.use_notifications = use_notifications and Observer is not None
+        self.on_stats = on_stats or self._log_stats
+
+        self._task_queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, _Pending] = {}      # rel_file -> chờ ổn định
+        self._in_flight: Set[str] = set()             # Đang xử lý
+        self._dirty: Set[str] = set()                 # Đổi trong lúc đang xử lý -> xử lý lại sau
+        self._known: Dict[str, Tuple[int, int]] = {}  # Chữ ký lần cuối thấy (polling)
+        self._submitted = 0
+        self._stop = threading.Event()
+
+        # Không theo dõi chính output (khi output nằm trong input) và thư mục trạng thái
+        self._excluded = [self.engine.output_dir.resolve(), (self.input_dir / STATE_DIR_NAME).resolve()]
+
+    # --- Public API ---
+    def stop(self):
+        self._stop.set()
+        self.engine.stop()
+
+    def run(self) -> dict:
+        """Chạy tới khi stop() (hoặc Ctrl+C). Blocking. Trả về thống kê."""
+        start = time.perf_counter()
+        engine = self.engine
+        operations, engine.plan_hash = engine._compile_plan()
+        engine.tile_plan = engine._plan_tiling(operations)
+        # Luôn dùng manifest: khởi động lại watcher không xử lý lại file đã làm
+        engine.manifest = engine.manifest or BatchManifest.for_output(
+            engine.output_dir, use_hash=engine.hash_inputs).load()
+
+        mode = "watchdog" if self.use_notifications else f"polling {self.poll_interval_s:g}s"
+        engine.on_log(f"👀 Theo dõi {self.input_dir} ({mode}, chờ ổn định {self.settle_s:g}s, "
+                      f"{engine.workers} worker)")
+        engine.on_log(f"Lệnh: {engine.command_string}")
+
+        observer = None
+        workers = [threading.Thread(target=self._worker_loop, args=(i, operations), daemon=True)
+                   for i in range(engine.workers)]
+        try:
+            with RESOURCES.using(engine._resource_limits()):
+                for t in workers:
+                    t.start()
+                if self.use_notifications:
+                    observer = Observer()
+                    observer.schedule(_EventHandler(self._notify), str(self.input_dir), recursive=True)
+                    observer.start()
+                # Lần quét đầu: file có sẵn (manifest sẽ bỏ qua file đã xử lý)
+                self._poll()
+                self._main_loop()
+        except KeyboardInterrupt:
+            self.stop()
+        finally:
+            self._stop.set()
+            engine.stop()
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            for t in workers:
+                t.join()
+            engine.manifest.close()
+
+        return self.stats(time.perf_counter() - start)
+
+    def stats(self, elapsed_s: float = 0.0) -> dict:
+        engine = self.engine
+        with self._lock:
+            backlog = self._task_queue.qsize() + len(self._in_flight)
+            settling = len(self._pending)
+        return {
+            "submitted": self._submitted,
+            "processed": engine.processed_count,
+            "skipped": engine.skipped_count,
+            "failed": engine.failed_count,
+            "backlog": backlog,
+            "settling": settling,
+            "elapsed_s": round(elapsed_s, 3),
+        }
+
+    # --- Phát hiện file ---
+    def _main_loop(self):
+        """Kiểm tra file chờ ổn định, quét định kỳ (nếu không có watchdog), báo cáo định kỳ"""
+        tick = min(0.5, self.settle_s / 2) if self.settle_s > 0 else 0.5
+        last_poll = last_report = time.monotonic()
+        last_done = 0
+        while not self._stop.wait(tick):
+            now = time.monotonic()
+            if not self.use_notifications and now - last_poll >= self.poll_interval_s:
+                self._poll()
+                last_poll = now
+            self._check_pending(now)
+
+            if self.report_interval_s > 0 and now - last_report >= self.report_interval_s:
+                done = self.engine.done_count
+                stats = self.stats()
+                stats["throughput_per_min"] = round((done - last_done) * 60 / (now - last_report), 2)
+                self.on_stats(stats)
+                last_report, last_done = now, done
+
+    def _rel_file(self, path) -> Optional[str]:
+        """Đường dẫn tương đối của file cần theo dõi (None nếu bỏ qua)"""
+        path = Path(path)
+        if path.suffix.lower() not in self.extensions or path.name.startswith('.'):
+            return None
+        try:
+            resolved = path.resolve()
+            if any(resolved == ex or ex in resolved.parents for ex in self._excluded):
+                return None
+            return str(path.relative_to(self.input_dir))
+        except (ValueError, OSError):
+            return None
+
+    def _notify(self, path: str):
+        """Sự kiện watchdog (thread của observer)"""
+        rel_file = self._rel_file(path)
+        if rel_file:
+            self._mark_changed(rel_file, time.monotonic())
+
+    def _poll(self):
+        """Quét cả folder, đánh dấu file mới hoặc có chữ ký khác lần trước"""
+        _, flat_list = scan_input(self.input_dir, self.extensions)
+        now = time.monotonic()
+        for rel_file in flat_list:
+            if self._rel_file(self.input_dir / rel_file) is None:
+                continue
+            signature = self._signature(rel_file)
+            if signature and self._known.get(rel_file) != signature:
+                self._known[rel_file] = signature
+                self._mark_changed(rel_file, now)
+
+    def _signature(self, rel_file: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.input_dir / rel_file)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _mark_changed(self, rel_file: str, now: float):
+        with self._lock:
+            if rel_file in self._in_flight:
+                self._dirty.add(rel_file)
+            elif rel_file not in self._pending:
+                self._pending[rel_file] = _Pending((-1, -1), now)
+
+    def _check_pending(self, now: float):
+        """File có chữ ký đứng yên >= settle_s giây -> đưa vào hàng đợi xử lý"""
+        with self._lock:
+            candidates = list(self._pending.items())
+        for rel_file, pending in candidates:
+            signature = self._signature(rel_file)
+            if signature is None:
+                # File bị xóa/đổi tên trước khi ghi xong
+                with self._lock:
+                    self._pending.pop(rel_file, None)
+                continue
+            if signature != pending.signature or signature[0] == 0:
+                pending.signature = signature
+                pending.changed_at = now
+                continue
+            if now - pending.changed_at >= self.settle_s:
+                self._submit(rel_file)
+
+    def _submit(self, rel_file: str):
+        rel = Path(rel_file)
+        rel_path = str(rel.parent) if rel.parent != Path('.') else ""
+        with self._lock:
+            self._pending.pop(rel_file, None)
+            self._in_flight.add(rel_file)
+            task = FileTask(self._submitted, rel_path, rel.name)
+            self._submitted += 1
+            self.engine.total = self._submitted
+        self._task_queue.put(task)
+
+    # --- Pool cố định ---
+    def _worker_loop(self, worker_id: int, operations):
+        TRACER.name_thread(f"Watcher-{worker_id}")
+        while not self._stop.is_set():
+            try:
+                task = self._task_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.engine._run_task(task, operations)
+            finally:
+                with self._lock:
+                    self._in_flight.discard(task.rel_file)
+                    if task.rel_file in self._dirty:
+                        # Bị ghi đè trong lúc đang xử lý -> chờ ổn định rồi làm lại
+                        self._dirty.discard(task.rel_file)
+                        self._pending[task.rel_file] = _Pending((-1, -1), time.monotonic())
+
+    def _log_stats(self, stats: dict):
+        self.engine.on_log(
+            f"📊 {stats['throughput_per_min']:.1f} file/phút | xong {stats['processed']} "
+            f"(bỏ qua {stats['skipped']}, lỗi {stats['failed']}) | backlog {stats['backlog']} "
+            f"+ {stats['settling']} đang ghi")